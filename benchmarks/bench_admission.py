@@ -0,0 +1,81 @@
+"""Перегрузка маршрута с медленным view (занимает процессор): потоков-клиентов
+больше, чем view успевает обслужить. Без допуска все view делят процессор,
+и задержка растёт с нагрузкой; с ограничением параллельности и целью
+по времени в очереди лишние запросы сразу получают 503, а задержка
+принятых остаётся в пределах цели.
+
+Запуск из корня проекта: python benchmarks/bench_admission.py [клиентов] [секунд]
+"""
+import io
+import sys
+from pathlib import Path
+from statistics import quantiles
+from threading import Thread
+from time import perf_counter, sleep
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pumba_framework.admission_settings as admission_settings  # noqa: E402
+from pumba_framework.admission import AdmissionControl  # noqa: E402
+from pumba_framework.main import Framework  # noqa: E402
+from pumba_framework.metrics import Metrics  # noqa: E402
+
+VIEW_SECONDS = 0.01
+LIMIT = 2
+QUEUE_TIMEOUT = 0.1
+admission_settings.QUEUE_TIMEOUT = QUEUE_TIMEOUT
+
+
+class SlowView:
+    content_type = 'text/plain'
+
+    def __call__(self, request):
+        # работа под GIL: параллельные view делят процессор
+        deadline = perf_counter() + VIEW_SECONDS
+        while perf_counter() < deadline:
+            pass
+        return '200 OK', 'done'
+
+
+def client(app, deadline, results):
+    while perf_counter() < deadline:
+        status = []
+        started = perf_counter()
+        app({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/slow/', 'QUERY_STRING': '',
+             'wsgi.input': io.BytesIO(), 'REMOTE_ADDR': '127.0.0.1'},
+            lambda code, headers, exc_info=None: status.append(code))
+        results.append((status[0][:3], perf_counter() - started))
+        if status[0].startswith('503'):
+            # клиент выполняет Retry-After не буквально, но и не долбит сразу
+            sleep(0.01)
+
+
+def run(title, admission, clients, seconds):
+    app = Framework({'/slow/': SlowView()}, [], metrics_obj=Metrics(), admission=admission)
+    results = []
+    deadline = perf_counter() + seconds
+    threads = [Thread(target=client, args=(app, deadline, results)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    served = sorted(duration for status, duration in results if status == '200')
+    shed = sum(1 for status, _ in results if status == '503')
+    p50, p99 = ((quantiles(served, n=100)[49], quantiles(served, n=100)[98])
+                if len(served) > 1 else (0, 0))
+    print(f'{title:<26}{len(served):>8}{shed:>8}{p50 * 1000:>10.1f}{p99 * 1000:>10.1f}')
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(f'клиентов {clients}, view {VIEW_SECONDS * 1000:.0f} мс, {seconds:.0f} с на вариант')
+    print(f'{"вариант":<26}{"200":>8}{"503":>8}{"p50, мс":>10}{"p99, мс":>10}')
+    run('без допуска', AdmissionControl(enabled=False), clients, seconds)
+    admission = AdmissionControl(route_concurrency={'/slow/': LIMIT})
+    run(f'{LIMIT} view, очередь {QUEUE_TIMEOUT * 1000:.0f} мс', admission, clients, seconds)
+    print(f'отклонено: {admission.rejected}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Пакетные операции Engine против поштучных: создание курсов
+(create_course в цикле против create_courses), перенос курсов
+(move_course против move_courses) и копия категории со всем поддеревом.
+Каталог в памяти и с хранилищем во временной базе; время записи в базу
+(flush) входит в замер.
+
+Запуск из корня проекта: python benchmarks/bench_batch.py [курсов]
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pumba_framework.storage_settings as storage_settings  # noqa: E402
+storage_settings.STORAGE_PATH = None
+
+from patterns.architectural_patterns import CatalogStorage  # noqa: E402
+from patterns.creational_patterns import Engine, Logger  # noqa: E402
+
+MOVES = 10000
+
+
+def timed(site, func):
+    started = perf_counter()
+    result = func()
+    site.flush()
+    return perf_counter() - started, result
+
+
+def bench(title, make_site, count):
+    print(title)
+    site = make_site()
+    category = site.create_category('Поштучно')
+    seconds, _ = timed(site, lambda: [
+        site.create_course('record', '/site-link/', f'Курс {i}', category)
+        for i in range(count)])
+    print(f'  create_course x {count}: {seconds:8.2f} с')
+    target = site.create_category('Пачкой')
+    seconds, courses = timed(site, lambda: site.create_courses(
+        ('record', '/site-link/', f'Курс {i}', target) for i in range(count)))
+    print(f'  create_courses({count}): {seconds:8.2f} с')
+
+    other = site.create_category('Перенос')
+    moved = list(target.courses)[:MOVES]
+    seconds, _ = timed(site, lambda: [site.move_course(course, other) for course in moved])
+    print(f'  move_course x {MOVES}: {seconds:8.2f} с')
+    seconds, _ = timed(site, lambda: site.move_courses(moved, target))
+    print(f'  move_courses({MOVES}): {seconds:8.2f} с')
+
+    seconds, _ = timed(site, lambda: site.copy_category(target, name='Копия'))
+    print(f'  copy_category ({target.course_count()} курсов): {seconds:8.2f} с')
+    errors = site.check_course_counts()
+    if errors:
+        sys.exit(f'Счётчики курсов разошлись: {errors}')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    Logger('main').configure(level=Logger.WARNING)
+    Logger('storage').configure(level=Logger.WARNING)
+    bench('каталог в памяти', Engine, count)
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'catalog.sqlite3')
+        bench('хранилище SQLite', lambda: Engine(CatalogStorage(file_name)), count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Сжатие страниц view: размер ответа и время на запрос без сжатия,
+с gzip, deflate и brotli (если установлен) - с промахом и попаданием
+в кэш ответов. Страницы запрашиваются через Framework, как в проде.
+
+Запуск из корня проекта: python benchmarks/bench_compression.py [курсов в категории]
+"""
+import io
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pumba_framework.storage_settings as storage_settings  # noqa: E402
+storage_settings.STORAGE_PATH = None
+
+import views  # noqa: E402
+from patterns.creational_patterns import Logger  # noqa: E402
+from patterns.structural_patterns import routes  # noqa: E402
+from pumba_framework.compression import brotli  # noqa: E402
+from pumba_framework.main import Framework  # noqa: E402
+from pumba_framework.response_cache import response_cache  # noqa: E402
+from urls import fronts  # noqa: E402
+
+REPEAT = 200
+
+
+def call(app, path, query_string, accept_encoding):
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'QUERY_STRING': query_string,
+               'wsgi.input': io.BytesIO(b''), 'REMOTE_ADDR': '127.0.0.1'}
+    if accept_encoding:
+        environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+    result = app(environ, lambda status, headers, exc_info=None: None)
+    size = sum(len(chunk) for chunk in result)
+    if hasattr(result, 'close'):
+        result.close()
+    return size
+
+
+def measure(app, path, query_string, accept_encoding, cached):
+    started = perf_counter()
+    for _ in range(REPEAT):
+        if not cached:
+            response_cache.clear()
+        size = call(app, path, query_string, accept_encoding)
+    return size, (perf_counter() - started) / REPEAT * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    Logger('main').configure(level=Logger.WARNING)
+    app = Framework(routes, fronts)
+    category = views.site.create_category('Сжатие')
+    for i in range(count):
+        views.site.create_course('record', '/site-link/', f'Курс {i}', category)
+    encodings = ['', 'gzip', 'deflate'] + (['br'] if brotli is not None else [])
+    pages = [('/courses-list/', f'id={category.id}', 'курсы, 50 на странице'),
+             ('/courses-list/', f'id={category.id}&size=500', 'курсы, 500 на странице'),
+             ('/category-list/', '', 'список категорий')]
+    for path, query_string, title in pages:
+        print(title)
+        plain = None
+        for coding in encodings:
+            size, miss = measure(app, path, query_string, coding, cached=False)
+            _, hit = measure(app, path, query_string, coding, cached=True)
+            plain = plain or size
+            print(f'  {coding or "без сжатия":<11} {size:>8} байт ({plain / size:>4.1f}x), '
+                  f'промах кэша {miss:>6.2f} мс, попадание {hit:>6.3f} мс')
+
+
+if __name__ == '__main__':
+    main()
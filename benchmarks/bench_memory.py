@@ -0,0 +1,104 @@
+"""Память каталога на 1M курсов (tracemalloc): обычные объекты с __dict__
+(как было до __slots__), объекты со __slots__ и столбцовый режим
+(STORAGE_COLUMNAR). Каталог строится через Engine без хранилища
+и без поиска; поисковый индекс названий (SearchIndex, курсы добавляются
+по одному, как в create_course) измеряется отдельной строкой.
+
+Запуск из корня проекта: python benchmarks/bench_memory.py [курсов]
+"""
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pumba_framework.search_settings as search_settings  # noqa: E402
+import pumba_framework.storage_settings as storage_settings  # noqa: E402
+storage_settings.STORAGE_PATH = None
+search_settings.SEARCH_ENABLED = False
+
+from patterns.creational_patterns import Engine, Logger  # noqa: E402
+from patterns.search_patterns import SearchIndex  # noqa: E402
+
+CATEGORIES = 1000
+
+
+class DictCategory:
+    """Категория в прежнем виде - атрибуты в __dict__"""
+
+    def __init__(self, id, name):
+        self.child_categories = []
+        self.id = id
+        self.name = name
+        self.category = None
+        self.courses = []
+        self.total_courses = 0
+
+
+class DictCourse:
+    """Курс в записи в прежнем виде - атрибуты в __dict__, ссылка не интернирована"""
+
+    def __init__(self, id, name, category, link):
+        self.id = id
+        self.name = name
+        self.category = category
+        self.link = link
+
+
+def build_dict_catalog(count):
+    categories = [DictCategory(i, f'Категория {i}') for i in range(CATEGORIES)]
+    courses, by_name = {}, {}
+    for i in range(count):
+        category = categories[i % CATEGORIES]
+        # ссылка собирается из частей, как при разборе формы, - без интернирования
+        course = DictCourse(i, f'Курс {i}', category, ''.join(('/site', '-link/')))
+        category.courses.append(course)
+        courses[i] = course
+        by_name.setdefault(course.name, []).append(course)
+    return categories, courses, by_name
+
+
+def build_engine(count, columnar):
+    site = Engine(columnar=columnar)
+    categories = [site.create_category(f'Категория {i}') for i in range(CATEGORIES)]
+    for i in range(count):
+        site.create_course('record', ''.join(('/site', '-link/')), f'Курс {i}',
+                           categories[i % CATEGORIES])
+    return site
+
+
+def build_search(count):
+    index = SearchIndex()
+    for i in range(count):
+        index.add(i, f'Курс {i}')
+    return index
+
+
+def measure(title, build, count):
+    gc.collect()
+    tracemalloc.start()
+    started = perf_counter()
+    catalog = build()
+    seconds = perf_counter() - started
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{title:<28} {size / 2 ** 20:>9.1f} МБ {size / count:>9.0f} байт/курс '
+          f'{seconds:>8.1f} с')
+    del catalog
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    Logger('main').configure(level=Logger.WARNING)
+    print(f'курсов: {count}, категорий: {CATEGORIES}')
+    measure('__dict__ (прежние классы)', lambda: build_dict_catalog(count), count)
+    measure('__slots__', lambda: build_engine(count, columnar=False), count)
+    measure('столбцовый режим', lambda: build_engine(count, columnar=True), count)
+    measure('поисковый индекс', lambda: build_search(count), count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Цена конвейера middleware на запрос: простой view без ступеней,
+с N ступенями before/after на всех маршрутах и с N ступенями, привязанными
+к другим маршрутам (у этого маршрута конвейер пустой). Затем страница
+сайта с шаблоном (кэш ответов выключен) против ступени before, которая
+отвечает сама, не доходя до view.
+
+Запуск из корня проекта: python benchmarks/bench_middleware.py
+"""
+import io
+import os
+import sys
+from pathlib import Path
+from timeit import repeat
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+os.chdir(ROOT_DIR)
+
+import pumba_framework.cache_settings as cache_settings  # noqa: E402
+cache_settings.RESPONSE_CACHE_ENABLED = False
+
+from pumba_framework.main import Framework  # noqa: E402
+from pumba_framework.middleware import Middleware  # noqa: E402
+
+NUMBER = 2000
+STAGES = 10
+
+
+class Hello:
+    content_type = 'text/plain'
+
+    def __call__(self, request):
+        return '200 OK', 'hello'
+
+
+class Passing(Middleware):
+    def __init__(self, routes=None):
+        self.routes = routes
+
+    def before(self, request):
+        return None
+
+    def after(self, request, response):
+        return response
+
+
+class Reject(Middleware):
+    def before(self, request):
+        return '403 Forbidden', 'forbidden'
+
+
+def make_environ(path):
+    return {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+            'wsgi.input': io.BytesIO(), 'REMOTE_ADDR': '127.0.0.1'}
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def per_request(app, path):
+    seconds = min(repeat(lambda: app(make_environ(path), start_response),
+                         number=NUMBER, repeat=5))
+    return seconds / NUMBER * 1e6
+
+
+def main():
+    routes = {'/hello/': Hello(), '/other/': Hello()}
+    variants = [
+        ('без ступеней', []),
+        (f'{STAGES} ступеней на всех маршрутах', [Passing() for _ in range(STAGES)]),
+        (f'{STAGES} ступеней на других маршрутах',
+         [Passing(['/other/']) for _ in range(STAGES)]),
+    ]
+    print(f'{"конвейер /hello/":<36}{"мкс на запрос":>14}')
+    for title, stages in variants:
+        print(f'{title:<36}{per_request(Framework(routes, stages), "/hello/"):>14.1f}')
+
+    import views  # noqa: F401
+    from patterns.creational_patterns import Logger
+    from patterns.structural_patterns import routes as site_routes
+    from urls import fronts
+    Logger('main').configure(level=Logger.WARNING)
+    print(f'\n{"страница /":<36}{"мкс на запрос":>14}')
+    print(f'{"view и шаблон":<36}{per_request(Framework(site_routes, fronts), "/"):>14.1f}')
+    app = Framework(site_routes, fronts + [Reject()])
+    print(f'{"ответ ступени before":<36}{per_request(app, "/"):>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
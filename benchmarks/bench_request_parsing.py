@@ -0,0 +1,89 @@
+"""Бенчмарк разбора параметров запроса: прежний путь (split по & и =,
+затем раскодирование через quopri во фреймворке и ещё раз во view)
+против нового разбора framework_requests за один проход.
+Новый разбор делает больше работы: хранит повторяющиеся ключи, проверяет
+лимиты и правильно раскодирует значения с '=', '%' и переводами строк.
+
+Запуск из корня проекта: python benchmarks/bench_request_parsing.py
+"""
+import io
+import sys
+from pathlib import Path
+from quopri import decodestring
+from timeit import repeat
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pumba_framework.framework_requests import GetRequests, PostRequests  # noqa: E402
+
+NUMBER = 5000
+
+
+def old_parse_input_data(data):
+    result = {}
+    if data:
+        vals = [item.split('=')[:2] for item in data.split('&')]
+        result = {v[0]: v[1] for v in vals}
+    return result
+
+
+def old_decode_value(data):
+    new_data = {}
+    for k, v in data.items():
+        val = bytes(v.replace('%', '=').replace("+", " "), 'UTF-8')
+        new_data[k] = decodestring(val).decode('UTF-8')
+    return new_data
+
+
+def old_decode_single(val):
+    val_b = bytes(val.replace('%', '=').replace("+", " "), 'UTF-8')
+    return decodestring(val_b).decode('UTF-8')
+
+
+def old_post(body):
+    environ = {'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body)}
+    content_length = int(environ['CONTENT_LENGTH'])
+    body = environ['wsgi.input'].read(content_length)
+    data = old_decode_value(old_parse_input_data(body.decode('utf-8')))
+    # view раскодировал название ещё раз
+    data['name'] = old_decode_single(data['name'])
+    return data
+
+
+def new_post(body):
+    environ = {'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body),
+               'CONTENT_TYPE': 'application/x-www-form-urlencoded'}
+    return PostRequests().get_request_data(environ)[0]
+
+
+def old_get(query):
+    return old_decode_value(old_parse_input_data(query))
+
+
+def new_get(query):
+    return GetRequests.get_request_params({'QUERY_STRING': query})
+
+
+CASES = {
+    'GET id': ('get', 'id=42'),
+    'GET id+cid': ('get', 'id=42&cid=7'),
+    'POST курс (кириллица)': ('post', urlencode({'name': 'Основы Python для начинающих',
+                                                 'link': '/site-link/', 'id': 3,
+                                                 'category': 5}).encode()),
+    'POST 50 полей': ('post', urlencode({f'field{i}': f'значение {i}' for i in range(50)}
+                                        | {'name': 'x'}).encode()),
+}
+
+
+def main():
+    print(f'{"случай":<24} {"было, мкс":>10} {"стало, мкс":>11}')
+    for title, (kind, payload) in CASES.items():
+        old, new = (old_get, new_get) if kind == 'get' else (old_post, new_post)
+        old_time = min(repeat(lambda: old(payload), number=NUMBER, repeat=5)) / NUMBER
+        new_time = min(repeat(lambda: new(payload), number=NUMBER, repeat=5)) / NUMBER
+        print(f'{title:<24} {old_time * 1e6:>10.2f} {new_time * 1e6:>11.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Микро-бенчмарк поиска view: словарь + проверка префикса статики
+против скомпилированного Router при 10, 100 и 1000 маршрутах.
+Словарь не умеет параметры пути, поэтому для '/section-N/42/' он
+возвращает промах - это цена проверки, а не найденный view.
+
+Запуск из корня проекта: python benchmarks/bench_router.py
+"""
+import sys
+from pathlib import Path
+from timeit import repeat
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pumba_framework.router import Router  # noqa: E402
+
+STATIC_URL = '/static/'
+NUMBER = 20000
+
+
+def make_routes(count):
+    routes = {}
+    for i in range(count):
+        if i % 2:
+            routes[f'/section-{i}/page/'] = object()
+        else:
+            routes[f'/section-{i}/<int:id>/'] = object()
+    return routes
+
+
+def dict_resolve(routes, path):
+    if path in routes:
+        return routes[path]
+    elif path.startswith(STATIC_URL):
+        return None
+    return None
+
+
+def bench(count):
+    routes = make_routes(count)
+    router = Router(routes)
+    last = count - 1 if count % 2 == 0 else count - 2
+    paths = [f'/section-{count - 1}/page/', f'/section-{last}/42/', '/missing/']
+    result = {}
+    for path in paths:
+        dict_time = min(repeat(lambda: dict_resolve(routes, path), number=NUMBER, repeat=5))
+        router_time = min(repeat(lambda: router.resolve(path, 'GET'), number=NUMBER, repeat=5))
+        result[path] = (dict_time / NUMBER * 1e9, router_time / NUMBER * 1e9)
+    return result
+
+
+def main():
+    print(f'{"маршрутов":>10} {"путь":<24} {"dict, нс":>10} {"router, нс":>11}')
+    for count in (10, 100, 1000):
+        for path, (dict_ns, router_ns) in bench(count).items():
+            print(f'{count:>10} {path:<24} {dict_ns:>10.0f} {router_ns:>11.0f}')
+
+
+if __name__ == '__main__':
+    main()
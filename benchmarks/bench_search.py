@@ -0,0 +1,62 @@
+"""Бенчмарк полнотекстового поиска (SearchIndex): построение индекса
+пачками, как при загрузке из хранилища, задержка запросов - одно слово,
+префикс, несколько слов - и добавление/изменение/удаление курса.
+
+Запуск из корня проекта: python benchmarks/bench_search.py [курсов]
+"""
+import random
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from patterns.search_patterns import SearchIndex  # noqa: E402
+import pumba_framework.search_settings as settings  # noqa: E402
+
+WORDS = ['Python', 'Java', 'курс', 'Основы', 'продвинутый', 'Машинное', 'обучение',
+         'Django', 'веб', 'разработка', 'данных', 'анализ', 'Тестирование',
+         'алгоритмы', 'Йога', 'бег', 'теннис', 'ёлка']
+QUERIES = ['курс', 'ку', 'p', 'елка', '12345', 'йога 4999', 'python курс', 'маш обу']
+REPEAT = 200
+WRITES = 1000
+
+
+def make_rows(count, seed=1):
+    rnd = random.Random(seed)
+    return [(i, ' '.join(rnd.sample(WORDS, rnd.randint(2, 5))) + f' {i}')
+            for i in range(count)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    rows = make_rows(count)
+    index = SearchIndex()
+    started = perf_counter()
+    for start in range(0, count, settings.SEARCH_BUILD_CHUNK_SIZE):
+        index.add_missing(rows[start:start + settings.SEARCH_BUILD_CHUNK_SIZE])
+    print(f'построение индекса на {count} курсов: {perf_counter() - started:.2f} с, '
+          f'слов {len(index.terms)}')
+
+    for query in QUERIES:
+        started = perf_counter()
+        for _ in range(REPEAT):
+            ids, has_next = index.search(query, 0, settings.SEARCH_PAGE_SIZE)
+        print(f'{query!r:<16} {(perf_counter() - started) / REPEAT * 1e6:>9.1f} мкс, '
+              f'найдено {len(ids)}{"+" if has_next else ""}')
+
+    writes = (('добавление', 'Новый курс Python {}', None),
+              ('изменение', 'Изменённый курс {}', 'Новый курс Python {}'),
+              ('удаление', None, 'Изменённый курс {}'))
+    for title, name, old_name in writes:
+        started = perf_counter()
+        for id in range(count, count + WRITES):
+            if name is None:
+                index.remove(id, old_name.format(id))
+            else:
+                index.add(id, name.format(id), old_name and old_name.format(id))
+        print(f'{title} курса: {(perf_counter() - started) / WRITES * 1e6:.1f} мкс')
+
+
+if __name__ == '__main__':
+    main()
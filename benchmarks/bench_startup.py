@@ -0,0 +1,126 @@
+"""Время запуска run.py на временной базе каталога заданного масштаба:
+импорт модулей (-X importtime), когда порт начинает принимать соединения
+и когда приходит первый ответ - от запуска процесса (StartupProfiler).
+Варианты запуска:
+* eager - каталог загружается при импорте views, затем прогрев
+* deferred - PUMBA_DEFER_CATALOG=1 и --no-warm-up: каталог загружается
+  перед первым запросом
+Медианы прогонов сравниваются с эталоном benchmarks/baselines/startup-<масштаб>.json:
+замедление больше --tolerance - регрессия, код возврата 1. Эталон снимается
+ключом --save-baseline на этой же машине; без него код возврата 3.
+
+Запуск из корня проекта: python benchmarks/bench_startup.py [--scale medium] [--save-baseline]
+"""
+import json
+import os
+import platform
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+from statistics import median
+
+from load_test import BASELINES_DIR, ROOT_DIR, SCALES, build_storage_catalog, load_baseline
+
+from pumba_framework.startup import StartupProfiler
+
+VARIANTS = {
+    'eager': ({}, []),
+    'deferred': ({'PUMBA_DEFER_CATALOG': '1'}, ['--no-warm-up']),
+}
+METRICS = ('import_total', 'listening', 'first_response')
+# не считаем регрессией рост меньше этого (мс) - шум запуска процесса
+NOISE_MS = 10
+RUN_PARAMS = ('scale', 'rounds', 'workers', 'seed')
+
+
+def measure(file_name, variant, args):
+    env, run_args = VARIANTS[variant]
+    server_args = [str(ROOT_DIR / 'run.py'), *run_args]
+    if args.workers > 1:
+        server_args += ['--workers', str(args.workers)]
+    results = []
+    for _ in range(args.rounds):
+        profiler = StartupProfiler(server_args, StartupProfiler.free_port(),
+                                   env=dict(env, PUMBA_STORAGE_PATH=file_name))
+        results.append(profiler.run())
+    return {name: median(item[name] for item in results) * 1000 for name in METRICS}
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    for variant, stats in report['variants'].items():
+        reference = baseline['variants'].get(variant)
+        if reference is None:
+            continue
+        for name in METRICS:
+            if (stats[name] > reference[name] * (1 + tolerance)
+                    and stats[name] - reference[name] > NOISE_MS):
+                regressions.append(f'{variant} {name} {stats[name]:.1f} мс, '
+                                   f'эталон {reference[name]:.1f} мс')
+    return regressions
+
+
+def get_args():
+    parser = ArgumentParser(description='Время запуска сервера')
+    parser.add_argument('--scale', choices=SCALES, default='medium')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='запусков каждого варианта; в отчёт идёт медиана')
+    parser.add_argument('--workers', type=int, default=1, help='--workers run.py')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', help='файл эталона (по умолчанию по масштабу)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='сохранить результат как эталон вместо сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='допустимое замедление относительно эталона (0.2 - 20%%)')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    baseline_file = Path(args.baseline) if args.baseline else (
+        BASELINES_DIR / f'startup-{args.scale}.json')
+    report = {
+        'scale': args.scale,
+        'rounds': args.rounds,
+        'workers': args.workers,
+        'seed': args.seed,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'variants': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'catalog.sqlite3')
+        build_storage_catalog(file_name, args.scale, args.seed)
+        for variant in VARIANTS:
+            report['variants'][variant] = measure(file_name, variant, args)
+
+    print(f'масштаб {args.scale}, воркеров {args.workers}, '
+          f'запусков {args.rounds} (медиана), мс от запуска процесса')
+    print(f'{"вариант":<10}{"импорт":>10}{"порт":>10}{"ответ":>10}')
+    for variant, stats in report['variants'].items():
+        print(f'{variant:<10}{stats["import_total"]:>10.1f}{stats["listening"]:>10.1f}'
+              f'{stats["first_response"]:>10.1f}')
+    if args.save_baseline:
+        baseline_file.parent.mkdir(parents=True, exist_ok=True)
+        baseline_file.write_text(json.dumps(report, indent=2, ensure_ascii=False),
+                                 encoding='utf-8')
+        print(f'эталон сохранён: {baseline_file}')
+        return
+    baseline = load_baseline(baseline_file, report)
+    different = [name for name in RUN_PARAMS if baseline.get(name) != report[name]]
+    if different:
+        print(f'эталон {baseline_file} снят с другими параметрами ({", ".join(different)}) - '
+              f'сравнение пропущено')
+        sys.exit(2)
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print(f'РЕГРЕССИИ относительно {baseline_file} (допуск {args.tolerance:.0%}):')
+        for line in regressions:
+            print(f'  {line}')
+        sys.exit(1)
+    print(f'регрессий относительно {baseline_file} нет (допуск {args.tolerance:.0%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Бенчмарк хранилища каталога: массовый импорт, время запуска Engine,
+ленивая загрузка категории и запись курсов - каждое изменение своей
+транзакцией (STORAGE_FLUSH_INTERVAL = 0) против записи пачками.
+
+Запуск из корня проекта: python benchmarks/bench_storage.py [курсов]
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from patterns.architectural_patterns import CatalogStorage  # noqa: E402
+from patterns.creational_patterns import Engine, Logger  # noqa: E402
+
+WRITES = 5000
+
+
+def make_records(count, categories=500):
+    for i in range(count):
+        yield f'Раздел {i % 10}/Категория {i % categories}', f'Курс {i}', f'/site-link/{i}/'
+
+
+def bench_writes(file_name, flush_interval):
+    site = Engine(CatalogStorage(file_name, flush_interval=flush_interval))
+    category = site.categories[0]
+    started = perf_counter()
+    for i in range(WRITES):
+        site.create_course('record', '/site-link/', f'Новый курс {i}', category)
+    site.flush()
+    return perf_counter() - started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    Logger('main').configure(level=Logger.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'catalog.sqlite3')
+        started = perf_counter()
+        CatalogStorage(file_name).import_courses(make_records(count))
+        print(f'импорт {count} курсов: {perf_counter() - started:.2f} с')
+
+        started = perf_counter()
+        site = Engine(CatalogStorage(file_name))
+        print(f'запуск Engine: {(perf_counter() - started) * 1000:.1f} мс, '
+              f'категорий {len(site.index.categories)}, курсов в памяти {len(site.index.courses)}')
+
+        category = site.index.get_category(site.categories[0].child_categories[0].id)
+        started = perf_counter()
+        loaded = len(category.courses)
+        print(f'ленивая загрузка категории ({loaded} курсов): '
+              f'{(perf_counter() - started) * 1000:.1f} мс')
+
+        for flush_interval, title in ((0, 'транзакция на изменение'), (0.05, 'пачками')):
+            seconds = bench_writes(file_name, flush_interval)
+            print(f'{WRITES} курсов, {title}: {seconds:.2f} с '
+                  f'({WRITES / seconds:.0f} в секунду)')
+
+
+if __name__ == '__main__':
+    main()
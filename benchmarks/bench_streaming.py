@@ -0,0 +1,62 @@
+"""Отдача большой страницы курсов: render собирает всю страницу и кодирует
+её одним куском, stream отдаёт её частями. Сравнивается время до первого
+куска (TTFB), общее время и пиковая память (tracemalloc).
+
+Запуск из корня проекта: python benchmarks/bench_streaming.py [курсов на странице]
+"""
+import sys
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pumba_framework.storage_settings as storage_settings  # noqa: E402
+storage_settings.STORAGE_PATH = None
+
+from patterns.creational_patterns import Engine, Logger  # noqa: E402
+from pumba_framework.pagination import Page  # noqa: E402
+from pumba_framework.templator import TemplateEngine, render, stream  # noqa: E402
+
+
+def send_rendered(category, courses):
+    yield render('course_list.html', category=category, courses=courses).encode('utf-8')
+
+
+def send_streamed(category, courses):
+    for chunk in stream('course_list.html', category=category, courses=courses):
+        yield chunk.encode('utf-8')
+
+
+def measure(title, send, category, courses):
+    tracemalloc.start()
+    started = perf_counter()
+    first = None
+    size = 0
+    for chunk in send(category, courses):
+        if first is None:
+            first = perf_counter() - started
+        size += len(chunk)
+    total = perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'{title:<8} первый кусок {first * 1000:>8.1f} мс, всего {total * 1000:>8.1f} мс, '
+          f'пик памяти {peak / 2 ** 20:>6.1f} МБ, ответ {size / 2 ** 20:.1f} МБ')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    Logger('main').configure(level=Logger.WARNING)
+    site = Engine()
+    category = site.create_category('Большая категория')
+    for i in range(count):
+        site.create_course('record', '/site-link/', f'Курс {i}', category)
+    courses = Page.from_sequence(category.courses, 1, count)
+    TemplateEngine.get_template('course_list.html')
+    print(f'курсов на странице: {count}')
+    measure('render', send_rendered, category, courses)
+    measure('stream', send_streamed, category, courses)
+
+
+if __name__ == '__main__':
+    main()
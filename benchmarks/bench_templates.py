@@ -0,0 +1,78 @@
+"""Холодный старт шаблонов: загрузка всех шаблонов из исходников (разбор и
+компиляция Jinja2) против модулей, собранных python manage.py compile-templates,
+и первый запрос к главной странице в новом процессе - без прогрева и после
+Framework.warm_up(). Каждый замер - в отдельном процессе.
+
+Запуск из корня проекта: python benchmarks/bench_templates.py [повторов]
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def load_templates(precompiled):
+    from pumba_framework.templator import TemplateEngine
+    import pumba_framework.template_settings as settings
+    started = perf_counter()
+    env = TemplateEngine.make_environment(settings.TEMPLATES_FOLDER, '/static/', precompiled)
+    for name in env.list_templates():
+        env.get_template(name)
+    return perf_counter() - started
+
+
+def first_request(warm_up):
+    import pumba_framework.storage_settings as storage_settings
+    storage_settings.STORAGE_PATH = None
+    from patterns.creational_patterns import Logger
+    Logger('main').configure(level=Logger.WARNING)
+    import run
+    from wsgiref.util import setup_testing_defaults
+    if warm_up:
+        run.application.warm_up(gc_freeze=False)
+    environ = {'PATH_INFO': '/', 'REQUEST_METHOD': 'GET'}
+    setup_testing_defaults(environ)
+    started = perf_counter()
+    b''.join(run.application(environ, lambda status, headers, exc_info=None: None))
+    return perf_counter() - started
+
+
+MEASURES = {
+    'source': lambda: load_templates(precompiled=False),
+    'precompiled': lambda: load_templates(precompiled=True),
+    'request': lambda: first_request(warm_up=False),
+    'request-warm': lambda: first_request(warm_up=True),
+}
+
+
+def measure(name, repeat):
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, __file__, '--child', name], cwd=ROOT,
+                                env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'),
+                                check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    return median(results) * 1000
+
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        print(json.dumps(MEASURES[sys.argv[2]]()))
+        return
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    from pumba_framework.templator import TemplateEngine
+    print(f'скомпилировано шаблонов: {TemplateEngine.compile_templates()}')
+    print(f'все шаблоны из исходников:     {measure("source", repeat):8.1f} мс')
+    print(f'все шаблоны из модулей:        {measure("precompiled", repeat):8.1f} мс')
+    print(f'первый запрос / без прогрева:  {measure("request", repeat):8.1f} мс')
+    print(f'первый запрос / после прогрева:{measure("request-warm", repeat):8.1f} мс')
+
+
+if __name__ == '__main__':
+    main()
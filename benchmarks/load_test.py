@@ -0,0 +1,549 @@
+"""Нагрузочный тест фреймворка: воспроизводимая смесь запросов ко всем view
+из views.py, статике и POST на /create-course/, /edit-course/ и
+/create-category/ на каталоге заданного масштаба.
+Режимы:
+* inprocess - Framework вызывается напрямую, без сокетов; каталог строит Engine
+* socket - запросы по HTTP к run.py, запущенному на временной базе каталога
+  (или к уже запущенному серверу - --url)
+Результат - запросов в секунду и перцентили задержек по маршрутам. Он
+сравнивается с эталоном benchmarks/baselines/<режим>-<масштаб>.json:
+замедление больше --tolerance помечается как регрессия, и скрипт завершается
+с кодом 1. Эталоны зависят от машины и в репозиторий не входят: эталон
+снимается ключом --save-baseline на той машине, где потом сравнивают. Без
+эталона сравнение не выполняется - скрипт печатает команду, которой его
+снять, и завершается с кодом 3.
+
+Запуск из корня проекта: python benchmarks/load_test.py [--mode socket] [--scale medium]
+"""
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+from threading import Barrier, Thread
+from time import perf_counter, sleep
+from urllib.parse import urlencode, urlsplit
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+os.chdir(ROOT_DIR)
+
+BASELINES_DIR = ROOT_DIR / 'benchmarks' / 'baselines'
+# код возврата, когда сравнивать не с чем
+NO_BASELINE_EXIT = 3
+
+# масштаб каталога: (категорий, курсов)
+SCALES = {
+    'small': (50, 1000),
+    'medium': (500, 50000),
+    'large': (2000, 500000),
+}
+
+WORDS = ['Python', 'Java', 'Основы', 'продвинутый', 'Машинное', 'обучение', 'Django',
+         'веб', 'разработка', 'данных', 'анализ', 'Тестирование', 'алгоритмы',
+         'Йога', 'бег', 'теннис', 'дизайн', 'музыка']
+
+# маршрут смеси -> доля запросов; записи - около 5%
+MIX = {
+    'index': 8,
+    'about': 3,
+    'study_programs': 3,
+    'category_list': 8,
+    'courses_list': 20,
+    'courses_path': 8,
+    'courses_page': 4,
+    'create_course_form': 3,
+    'edit_course_form': 5,
+    'create_category_form': 2,
+    'search': 12,
+    'static_css': 10,
+    'static_image': 6,
+    'copy_course': 1,
+    'create_course': 3,
+    'edit_course': 3,
+    'create_category': 1,
+}
+
+# не считаем регрессией рост задержки меньше этого (мс) - шум таймера
+NOISE_MS = 0.1
+# p99 маршрута сравнивается, только если у него хватает запросов
+MIN_P99_COUNT = 1000
+# эталон сравним, только если снят с теми же параметрами
+RUN_PARAMS = ('mode', 'scale', 'requests', 'rounds', 'threads', 'seed', 'accept_encoding')
+
+
+class Catalog:
+    """id категорий и курсов, к которым обращаются запросы смеси"""
+
+    def __init__(self, category_ids, course_ids):
+        self.category_ids = category_ids
+        self.course_ids = course_ids
+
+
+class LoadRequest:
+    __slots__ = ('name', 'method', 'path', 'query', 'body')
+
+    def __init__(self, name, method, path, params=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        encoded = urlencode(params or {})
+        self.query = '' if method == 'POST' else encoded
+        self.body = encoded.encode() if method == 'POST' else b''
+
+
+def make_request(name, rnd, catalog, number):
+    category = rnd.choice(catalog.category_ids)
+    course = rnd.choice(catalog.course_ids)
+    if name == 'index':
+        return LoadRequest(name, 'GET', '/')
+    if name == 'about':
+        return LoadRequest(name, 'GET', '/about/')
+    if name == 'study_programs':
+        return LoadRequest(name, 'GET', '/study_programs/')
+    if name == 'category_list':
+        return LoadRequest(name, 'GET', '/category-list/')
+    if name == 'courses_list':
+        return LoadRequest(name, 'GET', '/courses-list/', {'id': category})
+    if name == 'courses_path':
+        return LoadRequest(name, 'GET', f'/courses/{category}/')
+    if name == 'courses_page':
+        return LoadRequest(name, 'GET', '/courses-list/',
+                           {'id': category, 'page': rnd.randint(2, 5)})
+    if name == 'create_course_form':
+        return LoadRequest(name, 'GET', '/create-course/', {'id': category})
+    if name == 'edit_course_form':
+        return LoadRequest(name, 'GET', '/edit-course/', {'id': course})
+    if name == 'create_category_form':
+        return LoadRequest(name, 'GET', '/create-category/')
+    if name == 'search':
+        word = rnd.choice(WORDS).lower()
+        query = word[:rnd.randint(2, len(word))] if rnd.random() < 0.5 else word
+        if rnd.random() < 0.3:
+            query = f'{query} {rnd.choice(WORDS).lower()}'
+        return LoadRequest(name, 'GET', '/search/', {'q': query})
+    if name == 'static_css':
+        return LoadRequest(name, 'GET', '/static/css/style.css')
+    if name == 'static_image':
+        return LoadRequest(name, 'GET', '/static/images/search.png')
+    if name == 'copy_course':
+        return LoadRequest(name, 'GET', '/copy-course/', {'id': course, 'cid': category})
+    if name == 'create_course':
+        return LoadRequest(name, 'POST', '/create-course/',
+                           {'name': f'Нагрузка {number}', 'id': category})
+    if name == 'edit_course':
+        return LoadRequest(name, 'POST', '/edit-course/',
+                           {'name': f'Изменён {number}', 'link': '/site-link/',
+                            'id': course, 'category': category})
+    if name == 'create_category':
+        return LoadRequest(name, 'POST', '/create-category/',
+                           {'name': f'Нагрузка {number}', 'id': category})
+    raise ValueError(f'Неизвестный маршрут смеси {name}')
+
+
+def make_requests(catalog, count, seed):
+    """Одна и та же последовательность запросов при одном seed"""
+    rnd = random.Random(seed)
+    names = rnd.choices(list(MIX), weights=list(MIX.values()), k=count)
+    return [make_request(name, rnd, catalog, number) for number, name in enumerate(names)]
+
+
+def make_category_parents(rnd, count):
+    """Индекс родителя каждой категории (None - корневая), как в manage.py generate"""
+    parents = []
+    for i in range(count):
+        parents.append(rnd.randrange(i) if i and rnd.random() < 0.7 else None)
+    return parents
+
+
+def make_course_name(rnd, number):
+    return f'{rnd.choice(WORDS)} {rnd.choice(WORDS)} {number}'
+
+
+def build_engine_catalog(site, scale, seed):
+    categories_count, courses_count = SCALES[scale]
+    rnd = random.Random(seed)
+    categories = []
+    for i, parent in enumerate(make_category_parents(rnd, categories_count)):
+        categories.append(site.create_category(
+            f'Категория {i}', categories[parent] if parent is not None else None))
+    for i in range(courses_count):
+        site.create_course('record', '/site-link/', make_course_name(rnd, i),
+                           rnd.choice(categories))
+    return Catalog(list(site.index.categories), list(site.index.courses))
+
+
+def build_storage_catalog(file_name, scale, seed):
+    """Каталог для run.py: массовый импорт во временную базу"""
+    from patterns.architectural_patterns import CatalogStorage
+    categories_count, courses_count = SCALES[scale]
+    rnd = random.Random(seed)
+    paths = []
+    for i, parent in enumerate(make_category_parents(rnd, categories_count)):
+        paths.append(f'{paths[parent]}/Категория {i}' if parent is not None else f'Категория {i}')
+    storage = CatalogStorage(file_name)
+    storage.import_courses((rnd.choice(paths), make_course_name(rnd, i), '/site-link/')
+                           for i in range(courses_count))
+    category_ids = [row[0] for row in storage.categories.find_all(storage.db)]
+    course_ids = list(range(1, storage.courses.max_id(storage.db) + 1))
+    storage.db.close()
+    return Catalog(category_ids, course_ids)
+
+
+class InProcessClient:
+    """Вызывает WSGI-application напрямую"""
+
+    def __init__(self, app, accept_encoding):
+        self.app = app
+        self.accept_encoding = accept_encoding
+
+    def __call__(self, request):
+        environ = {
+            'PATH_INFO': request.path,
+            'REQUEST_METHOD': request.method,
+            'QUERY_STRING': request.query,
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(request.body)),
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.input': io.BytesIO(request.body),
+        }
+        if self.accept_encoding:
+            environ['HTTP_ACCEPT_ENCODING'] = self.accept_encoding
+        status = []
+        result = self.app(environ, lambda code, headers, exc_info=None: status.append(code))
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return int(status[0].split(' ', 1)[0])
+
+
+class SocketClient:
+    """HTTP-клиент одного потока; переподключается, если сервер закрыл соединение"""
+
+    def __init__(self, url, accept_encoding):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80,
+                                                     timeout=60)
+        self.headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        if accept_encoding:
+            self.headers['Accept-Encoding'] = accept_encoding
+
+    def __call__(self, request):
+        target = f'{request.path}?{request.query}' if request.query else request.path
+        try:
+            self.connection.request(request.method, target, request.body or None, self.headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            # обрыв соединения или тайм-аут считается ошибкой запроса
+            self.connection.close()
+            return 0
+        if response.will_close:
+            self.connection.close()
+        return response.status
+
+
+def run_load(make_client, requests, threads):
+    """Запросы делятся между потоками по кругу. Возвращает
+    (секунд на весь прогон, [(маршрут, секунд, статус)])"""
+    results = [[] for _ in range(threads)]
+    barrier = Barrier(threads + 1)
+
+    def worker(number):
+        client = make_client()
+        out = results[number]
+        barrier.wait()
+        for request in requests[number::threads]:
+            started = perf_counter()
+            status = client(request)
+            out.append((request.name, perf_counter() - started, status))
+
+    workers = [Thread(target=worker, args=(number,)) for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = perf_counter()
+    for thread in workers:
+        thread.join()
+    seconds = perf_counter() - started
+    return seconds, [item for out in results for item in out]
+
+
+def percentile(values, percent):
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def summarize(durations):
+    values = sorted(durations)
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50) * 1000,
+        'p90': percentile(values, 90) * 1000,
+        'p99': percentile(values, 99) * 1000,
+        'max': values[-1] * 1000,
+    }
+
+
+def summarize_round(seconds, results):
+    routes, errors = {}, {}
+    for name, duration, status in results:
+        routes.setdefault(name, []).append(duration)
+        if not 200 <= status < 400:
+            errors[name] = errors.get(name, 0) + 1
+    summary = {
+        'rps': len(results) / seconds,
+        'total': dict(summarize([duration for _, duration, _ in results]),
+                      errors=sum(errors.values())),
+        'routes': {},
+    }
+    for name in sorted(routes):
+        summary['routes'][name] = dict(summarize(routes[name]), errors=errors.get(name, 0))
+    return summary
+
+
+def median_stats(items):
+    """Медиана каждой метрики по прогонам: один неудачный прогон
+    (сборка мусора, соседний процесс) не сдвигает результат"""
+    return {key: sorted(item[key] for item in items)[len(items) // 2] for key in items[0]}
+
+
+def make_report(args, rounds):
+    report = {
+        'mode': args.mode,
+        'scale': args.scale,
+        'requests': args.requests,
+        'rounds': len(rounds),
+        'threads': args.threads,
+        'seed': args.seed,
+        'accept_encoding': args.accept_encoding,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'rps': median_stats([{'rps': item['rps']} for item in rounds])['rps'],
+        'total': median_stats([item['total'] for item in rounds]),
+        'routes': {},
+    }
+    report['errors'] = report['total'].pop('errors')
+    for name in rounds[0]['routes']:
+        report['routes'][name] = median_stats([item['routes'][name] for item in rounds])
+    return report
+
+
+def print_report(report):
+    print(f'{report["mode"]}, масштаб {report["scale"]}: {report["requests"]} запросов, '
+          f'прогонов {report["rounds"]} (медиана), потоков {report["threads"]}, '
+          f'{report["rps"]:.0f} запросов/с, ошибок {report["errors"]}')
+    print(f'{"маршрут":<22}{"запросов":>9}{"p50 мс":>9}{"p90 мс":>9}{"p99 мс":>9}'
+          f'{"max мс":>9}{"ошибок":>8}')
+    rows = list(report['routes'].items()) + [('всего', dict(report['total'],
+                                                             errors=report['errors']))]
+    for name, stats in rows:
+        print(f'{name:<22}{stats["count"]:>9}{stats["p50"]:>9.2f}{stats["p90"]:>9.2f}'
+              f'{stats["p99"]:>9.2f}{stats["max"]:>9.2f}{stats["errors"]:>8}')
+
+
+def load_baseline(baseline_file, report):
+    """Эталон для сравнения. Без эталона печатает команду, которой его снять,
+    и завершает скрипт с кодом NO_BASELINE_EXIT"""
+    if not baseline_file.exists():
+        command = shlex.join(['python', os.path.relpath(sys.argv[0], ROOT_DIR),
+                              *sys.argv[1:], '--save-baseline'])
+        print(f'СРАВНЕНИЕ НЕ ВЫПОЛНЕНО: эталона {baseline_file} нет.\n'
+              f'Эталоны зависят от машины и в репозиторий не входят - снимите его '
+              f'здесь с теми же параметрами:\n  {command}')
+        sys.exit(NO_BASELINE_EXIT)
+    baseline = json.loads(baseline_file.read_text(encoding='utf-8'))
+    for name in ('machine', 'python'):
+        if baseline.get(name) != report[name]:
+            print(f'внимание: эталон {baseline_file} снят на {name} {baseline.get(name)}, '
+                  f'сейчас {report[name]} - сравнение может быть неточным')
+    return baseline
+
+
+def compare(report, baseline, tolerance):
+    """Строки о регрессиях относительно эталона"""
+    regressions = []
+    if report['rps'] < baseline['rps'] * (1 - tolerance):
+        regressions.append(f'пропускная способность {report["rps"]:.0f} запросов/с, '
+                           f'эталон {baseline["rps"]:.0f}')
+    routes = dict(report['routes'], всего=report['total'])
+    baseline_routes = dict(baseline['routes'], всего=baseline['total'])
+    for name, stats in routes.items():
+        reference = baseline_routes.get(name)
+        if reference is None:
+            continue
+        for key in ('p50', 'p99'):
+            if key == 'p99' and name != 'всего' and stats['count'] < MIN_P99_COUNT:
+                continue
+            if (stats[key] > reference[key] * (1 + tolerance)
+                    and stats[key] - reference[key] > NOISE_MS):
+                regressions.append(f'{name} {key} {stats[key]:.2f} мс, '
+                                   f'эталон {reference[key]:.2f} мс')
+    if report['errors'] > baseline['errors']:
+        regressions.append(f'ошибок {report["errors"]}, в эталоне {baseline["errors"]}')
+    return regressions
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port, process, timeout=120):
+    started = perf_counter()
+    while perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f'run.py завершился с кодом {process.returncode}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            sleep(0.1)
+    raise RuntimeError('run.py не начал принимать соединения')
+
+
+def start_server(file_name, args):
+    port = free_port()
+    command = [sys.executable, 'run.py', '--addr', '127.0.0.1', '--port', str(port),
+               '--workers', str(args.workers)]
+    if args.server_threads:
+        command.append('--threads')
+    env = dict(os.environ, PUMBA_STORAGE_PATH=file_name)
+    # своя группа процессов - чтобы остановить и мастер, и воркеры pre-fork
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_server(port, process)
+    return process, f'http://127.0.0.1:{port}'
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def run_inprocess(args):
+    import pumba_framework.storage_settings as storage_settings
+    storage_settings.STORAGE_PATH = None
+
+    import views
+    from patterns.creational_patterns import Logger
+    from patterns.structural_patterns import routes
+    from pumba_framework.main import Framework
+    from urls import fronts
+
+    if not args.log:
+        Logger('main').configure(level=Logger.WARNING)
+    started = perf_counter()
+    catalog = build_engine_catalog(views.site, args.scale, args.seed)
+    print(f'каталог построен за {perf_counter() - started:.1f} с: '
+          f'категорий {len(catalog.category_ids)}, курсов {len(catalog.course_ids)}')
+    app = Framework(routes, fronts)
+    return lambda: InProcessClient(app, args.accept_encoding), catalog
+
+
+def run_socket(args, directory):
+    if args.url:
+        # сервер запущен отдельно: id берём из его каталога по масштабу
+        categories_count, courses_count = SCALES[args.scale]
+        catalog = Catalog(list(range(1, categories_count + 1)),
+                          list(range(1, courses_count + 1)))
+        return lambda: SocketClient(args.url, args.accept_encoding), catalog, None
+    file_name = os.path.join(directory, 'catalog.sqlite3')
+    started = perf_counter()
+    catalog = build_storage_catalog(file_name, args.scale, args.seed)
+    print(f'база каталога создана за {perf_counter() - started:.1f} с: '
+          f'категорий {len(catalog.category_ids)}, курсов {len(catalog.course_ids)}')
+    process, url = start_server(file_name, args)
+    return lambda: SocketClient(url, args.accept_encoding), catalog, process
+
+
+def get_args():
+    parser = ArgumentParser(description='Нагрузочный тест фреймворка и view')
+    parser.add_argument('--mode', choices=('inprocess', 'socket'), default='inprocess')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='прогонов; в отчёт идёт медиана каждой метрики')
+    parser.add_argument('--warmup', type=int, default=1000,
+                        help='запросов перед замером: компиляция шаблонов, прогрев кэшей')
+    parser.add_argument('--threads', type=int, default=1, help='параллельных клиентов')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--accept-encoding', default='gzip',
+                        help='Accept-Encoding клиентов; пустая строка - без сжатия')
+    parser.add_argument('--workers', type=int, default=1, help='socket: --workers run.py')
+    parser.add_argument('--server-threads', action='store_true',
+                        help='socket: запустить run.py с --threads')
+    parser.add_argument('--url', help='socket: адрес уже запущенного сервера')
+    parser.add_argument('--baseline', help='файл эталона (по умолчанию по режиму и масштабу)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='сохранить результат как эталон вместо сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='допустимое замедление относительно эталона (0.2 - 20%%)')
+    parser.add_argument('--log', action='store_true', help='inprocess: не глушить лог view')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    baseline_file = Path(args.baseline) if args.baseline else (
+        BASELINES_DIR / f'{args.mode}-{args.scale}.json')
+    process = None
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            if args.mode == 'inprocess':
+                make_client, catalog = run_inprocess(args)
+            else:
+                make_client, catalog, process = run_socket(args, directory)
+            requests = make_requests(catalog, args.warmup + args.requests, args.seed)
+            run_load(make_client, requests[:args.warmup], args.threads)
+            rounds = []
+            for _ in range(args.rounds):
+                # каждый прогон - та же последовательность запросов
+                rounds.append(summarize_round(
+                    *run_load(make_client, requests[args.warmup:], args.threads)))
+        finally:
+            if process is not None:
+                stop_server(process)
+
+    report = make_report(args, rounds)
+    print_report(report)
+    if args.save_baseline:
+        baseline_file.parent.mkdir(parents=True, exist_ok=True)
+        baseline_file.write_text(json.dumps(report, indent=2, ensure_ascii=False),
+                                 encoding='utf-8')
+        print(f'эталон сохранён: {baseline_file}')
+        return
+    baseline = load_baseline(baseline_file, report)
+    different = [name for name in RUN_PARAMS if baseline.get(name) != report[name]]
+    if different:
+        print(f'эталон {baseline_file} снят с другими параметрами ({", ".join(different)}) - '
+              f'сравнение пропущено')
+        sys.exit(2)
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print(f'РЕГРЕССИИ относительно {baseline_file} (допуск {args.tolerance:.0%}):')
+        for line in regressions:
+            print(f'  {line}')
+        sys.exit(1)
+    print(f'регрессий относительно {baseline_file} нет (допуск {args.tolerance:.0%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Стресс-тест Engine: много потоков одновременно шлют в Framework запросы
+на запись (создание, редактирование, копирование курсов, создание категорий)
+и чтение, после чего проверяются инварианты каталога. Каталог пишется во
+временную базу SQLite; в конце она открывается заново и сверяется с памятью.
+
+Запуск из корня проекта: python benchmarks/stress_engine.py [потоков] [запросов]
+"""
+import io
+import os
+import random
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+from threading import Barrier, Thread
+from urllib.parse import urlencode
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+os.chdir(ROOT_DIR)
+
+import pumba_framework.storage_settings as storage_settings  # noqa: E402
+DB_DIR = tempfile.TemporaryDirectory()
+storage_settings.STORAGE_PATH = os.path.join(DB_DIR.name, 'catalog.sqlite3')
+
+import views  # noqa: E402
+from patterns.architectural_patterns import CatalogStorage  # noqa: E402
+from patterns.creational_patterns import Engine  # noqa: E402
+from patterns.structural_patterns import routes  # noqa: E402
+from pumba_framework.main import Framework  # noqa: E402
+from urls import fronts  # noqa: E402
+
+
+def call(app, path, method='GET', params=None):
+    query = urlencode(params or {})
+    body = query.encode() if method == 'POST' else b''
+    environ = {
+        'PATH_INFO': path,
+        'REQUEST_METHOD': method,
+        'QUERY_STRING': '' if method == 'POST' else query,
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    status = []
+    result = app(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        b''.join(result)
+    finally:
+        # как сервер WSGI: закрытие тела освобождает место view маршрута
+        if hasattr(result, 'close'):
+            result.close()
+    return status[0]
+
+
+def worker(app, barrier, requests_count, seed, errors):
+    site = views.site
+    rnd = random.Random(seed)
+    barrier.wait()
+    for i in range(requests_count):
+        category_ids = list(site.index.categories)
+        course_ids = list(site.index.courses)
+        action = rnd.random()
+        try:
+            if action < 0.3:
+                status = call(app, '/create-course/', 'POST',
+                              {'name': f'course {seed}-{i}', 'id': rnd.choice(category_ids)})
+            elif action < 0.5:
+                status = call(app, '/edit-course/', 'POST',
+                              {'name': f'edited {seed}-{i}', 'link': '/link/',
+                               'id': rnd.choice(course_ids),
+                               'category': rnd.choice(category_ids)})
+            elif action < 0.65:
+                status = call(app, '/copy-course/', 'GET',
+                              {'id': rnd.choice(course_ids), 'cid': rnd.choice(category_ids)})
+            elif action < 0.75:
+                parent = rnd.choice(category_ids + [-1])
+                status = call(app, '/create-category/', 'POST',
+                              {'name': f'category {seed}-{i}', 'id': parent})
+            elif action < 0.9:
+                status = call(app, '/courses-list/', 'GET', {'id': rnd.choice(category_ids)})
+            else:
+                status = call(app, '/category-list/')
+            if not status.startswith('200'):
+                errors.append(f'{status} в потоке {seed}')
+        except Exception as e:
+            errors.append(f'{type(e).__name__}: {e}')
+
+
+def check_invariants(site):
+    errors = []
+    # пересчёт загружает курсы всех категорий, после него в индексе все курсы
+    for category, cached, actual in site.check_course_counts():
+        errors.append(f'категория {category.id}: счётчик {cached}, на самом деле {actual}')
+    courses = list(site.index.courses.values())
+    category_ids = [category.id for category in site.get_all_categories(site.categories)]
+    if len(category_ids) != len(set(category_ids)) or len(category_ids) != len(site.index.categories):
+        errors.append('id категорий повторяются или не совпадают с индексом')
+    for course in courses:
+        if course not in course.category.courses:
+            errors.append(f'курс {course.id} отсутствует в своей категории')
+    placed = sum(len(category.courses) for category in site.index.categories.values())
+    if placed != len(courses):
+        errors.append(f'в категориях {placed} курсов, всего {len(courses)}')
+    if sum(category.course_count() for category in site.categories) != len(courses):
+        errors.append('сумма счётчиков корневых категорий не равна числу курсов')
+    return errors
+
+
+def check_storage(site):
+    """Каталог, прочитанный из базы заново, совпадает с каталогом в памяти"""
+    site.flush()
+    errors = []
+    reloaded = Engine(CatalogStorage(storage_settings.STORAGE_PATH))
+    for category in site.index.categories.values():
+        other = reloaded.index.get_category(category.id)
+        if other is None or other.name != category.name:
+            errors.append(f'категория {category.id} не сохранилась')
+            continue
+        if other.course_count() != category.course_count():
+            errors.append(f'категория {category.id}: в базе {other.course_count()} курсов, '
+                          f'в памяти {category.course_count()}')
+        # из базы курсы читаются по id, в памяти перенесённый курс стоит в конце
+        saved = sorted((course.id, course.name) for course in other.courses)
+        if saved != sorted((course.id, course.name) for course in category.courses):
+            errors.append(f'курсы категории {category.id} в базе отличаются от памяти')
+    return errors
+
+
+def main():
+    threads_count = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    requests_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    sys.setswitchinterval(1e-5)
+    app = Framework(routes, fronts)
+    barrier = Barrier(threads_count)
+    errors = []
+    threads = [Thread(target=worker, args=(app, barrier, requests_count, seed, errors))
+               for seed in range(threads_count)]
+    with redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    errors += check_invariants(views.site)
+    errors += check_storage(views.site)
+    print(f'потоков: {threads_count}, запросов: {threads_count * requests_count}, '
+          f'курсов: {len(views.site.index.courses)}, '
+          f'категорий: {len(views.site.index.categories)}')
+    if errors:
+        print(f'Ошибок: {len(errors)}')
+        for error in errors[:20]:
+            print(' ', error)
+        sys.exit(1)
+    print('Инварианты выполнены')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+from argparse import ArgumentParser
+from time import perf_counter
+import csv
+import random
+import sys
+from patterns.architectural_patterns import CATALOG_MIGRATIONS, CatalogStorage
+from pumba_framework.storage import Database
+from pumba_framework.templator import TemplateEngine
+import pumba_framework.storage_settings as settings
+import pumba_framework.template_settings as template_settings
+
+
+def migrate(args):
+    applied = Database(args.db).migrate(CATALOG_MIGRATIONS)
+    print(f'Применено миграций: {applied}, версия схемы: {len(CATALOG_MIGRATIONS)}')
+
+
+def read_courses(file_name):
+    with open(file_name, newline='', encoding='utf-8') as file:
+        for row in csv.reader(file):
+            if not row or row[0].startswith('#'):
+                continue
+            category_path, name = row[0], row[1]
+            yield category_path, name, row[2] if len(row) > 2 and row[2] else None
+
+
+def import_courses(args):
+    storage = CatalogStorage(args.db)
+    started = perf_counter()
+    imported = storage.import_courses(read_courses(args.file), args.batch_size)
+    print(f'Импортировано курсов: {imported} за {perf_counter() - started:.2f} с')
+
+
+def generate(args):
+    """Тестовый каталог: случайное дерево категорий и courses курсов"""
+    rnd = random.Random(args.seed)
+    paths = []
+    for i in range(args.categories):
+        parent = rnd.choice(paths) if paths and rnd.random() < 0.7 else ''
+        paths.append(f'{parent}/Категория {i}' if parent else f'Категория {i}')
+    with open(args.file, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        for i in range(args.courses):
+            writer.writerow([rnd.choice(paths), f'Курс {i}', f'/site-link/{i}/'])
+    print(f'Записано курсов: {args.courses}, категорий: {args.categories} в {args.file}')
+
+
+def compile_templates(args):
+    started = perf_counter()
+    compiled = TemplateEngine.compile_templates(args.folder)
+    print(f'Скомпилировано шаблонов: {compiled} за {perf_counter() - started:.2f} с '
+          f'в {TemplateEngine.compiled_path(args.folder)}')
+
+
+def get_args():
+    parser = ArgumentParser(description='Хранилище каталога: миграции и массовый импорт; '
+                                        'сборка шаблонов')
+    parser.add_argument('--db', default=settings.STORAGE_PATH, help='файл базы SQLite')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help='создать или обновить схему базы')
+    importer = commands.add_parser(
+        'import', help='импорт курсов из CSV: путь категории через /, название, ссылка')
+    importer.add_argument('file')
+    importer.add_argument('--batch-size', type=int, default=settings.STORAGE_IMPORT_BATCH_SIZE,
+                          help='строк в одной транзакции')
+    generator = commands.add_parser('generate', help='создать CSV с тестовым каталогом')
+    generator.add_argument('file')
+    generator.add_argument('--courses', type=int, default=100000)
+    generator.add_argument('--categories', type=int, default=500)
+    generator.add_argument('--seed', type=int, default=1)
+    compiler = commands.add_parser(
+        'compile-templates', help='скомпилировать шаблоны в модули Python (шаг сборки)')
+    compiler.add_argument('--folder', default=template_settings.TEMPLATES_FOLDER)
+    return parser.parse_args()
+
+
+COMMANDS = {
+    'migrate': migrate,
+    'import': import_courses,
+    'generate': generate,
+    'compile-templates': compile_templates,
+}
+# команды, которым нужна база
+STORAGE_COMMANDS = ('migrate', 'import')
+
+if __name__ == '__main__':
+    args = get_args()
+    if args.command in STORAGE_COMMANDS and not args.db:
+        sys.exit('Хранилище выключено: задайте --db или PUMBA_STORAGE_PATH')
+    COMMANDS[args.command](args)
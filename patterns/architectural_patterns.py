@@ -0,0 +1,667 @@
+from array import array
+from collections.abc import MutableMapping
+from threading import Event, Lock, Thread
+from time import sleep
+from patterns.concurrency_patterns import process_hooks
+from pumba_framework.storage import Database
+import pumba_framework.storage_settings as settings
+
+# схема каталога: миграция - список SQL-команд, новые миграции - в конец списка
+CATALOG_MIGRATIONS = [
+    [
+        """CREATE TABLE category (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            parent_id INTEGER
+        )""",
+        """CREATE TABLE course (
+            id INTEGER PRIMARY KEY,
+            type TEXT NOT NULL,
+            name TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            link TEXT,
+            addr TEXT
+        )""",
+        'CREATE INDEX course_category ON course (category_id)',
+        'CREATE INDEX course_name ON course (name)',
+    ],
+    [
+        # следующий свободный id: процессы берут из базы блоки id
+        """CREATE TABLE id_sequence (
+            name TEXT PRIMARY KEY,
+            next INTEGER NOT NULL
+        )""",
+    ],
+    [
+        # версия каталога: растёт с каждой транзакцией записи каталога -
+        # по ней процессы узнают, что каталог изменил другой процесс
+        'CREATE TABLE catalog_version (version INTEGER NOT NULL)',
+        'INSERT INTO catalog_version (version) VALUES (0)',
+    ],
+]
+
+
+class CatalogIndex:
+    """Репозиторий - индексы каталога для поиска за O(1)"""
+
+    def __init__(self):
+        # id -> Category
+        self.categories = {}
+        # id -> Course
+        self.courses = {}
+        # название -> Course или [Course], если курсов с таким названием
+        # несколько (в порядке создания): у большинства названий курс один,
+        # и список на каждый курс стоил бы памяти
+        self.courses_by_name = {}
+        # id родительской категории (None - корень) -> [Category]
+        self.children = {None: []}
+
+    def add_category(self, category):
+        self.categories[category.id] = category
+        self.children.setdefault(category.id, [])
+        parent_id = category.category.id if category.category else None
+        self.children.setdefault(parent_id, []).append(category)
+
+    def add_course(self, course):
+        self.courses[course.id] = course
+        self.remember_name(course)
+
+    def remove_course(self, course):
+        self.courses.pop(course.id, None)
+        self.forget_name(course, course.name)
+
+    def rename_course(self, course, old_name):
+        if old_name == course.name:
+            return
+        self.forget_name(course, old_name)
+        self.remember_name(course)
+
+    def remember_name(self, course):
+        same_name = self.courses_by_name.get(course.name)
+        if same_name is None:
+            self.courses_by_name[course.name] = course
+        elif isinstance(same_name, list):
+            same_name.append(course)
+        else:
+            self.courses_by_name[course.name] = [same_name, course]
+
+    def forget_name(self, course, name):
+        same_name = self.courses_by_name.get(name)
+        if same_name is course:
+            del self.courses_by_name[name]
+        elif isinstance(same_name, list) and course in same_name:
+            same_name.remove(course)
+            if len(same_name) == 1:
+                self.courses_by_name[name] = same_name[0]
+
+    def get_category(self, id):
+        return self.categories.get(id)
+
+    def get_course(self, id):
+        return self.courses.get(id)
+
+    def get_course_by_name(self, name):
+        same_name = self.courses_by_name.get(name)
+        return same_name[0] if isinstance(same_name, list) else same_name
+
+    def get_children(self, category_id=None):
+        return self.children.get(category_id, [])
+
+    def get_parent(self, category_id):
+        category = self.categories.get(category_id)
+        return category.category if category else None
+
+    @staticmethod
+    def course_list():
+        """Пустой список курсов для категории"""
+        return []
+
+
+class CourseColumns(MutableMapping):
+    """Курсы в параллельных массивах, позиция в массивах - id курса.
+    Ведёт себя как словарь id -> курс: объект курса создаётся build
+    при каждом обращении. Названия лежат подряд в одном bytearray,
+    ссылки и адреса - номерами в таблице неповторяющихся строк"""
+
+    def __init__(self, build):
+        self.build = build
+        # -1 - курса с таким id нет
+        self.category_ids = array('i')
+        self.types = array('B')
+        self.links = array('i')
+        self.addrs = array('i')
+        self.name_starts = array('Q')
+        self.name_lengths = array('I')
+        self.names = bytearray()
+        # таблица строк: номер -> строка и строка -> номер
+        self.strings = []
+        self.string_ids = {}
+        self.type_names = []
+        self.count = 0
+
+    def string_id(self, value):
+        if value is None:
+            return -1
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = self.string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def grow(self, size):
+        missing = size - len(self.category_ids)
+        if missing > 0:
+            self.category_ids.extend([-1] * missing)
+            self.types.extend(bytes(missing))
+            self.links.extend([-1] * missing)
+            self.addrs.extend([-1] * missing)
+            self.name_starts.extend([0] * missing)
+            self.name_lengths.extend([0] * missing)
+
+    def name(self, id):
+        start = self.name_starts[id]
+        return self.names[start:start + self.name_lengths[id]].decode('utf-8')
+
+    def __getitem__(self, id):
+        if not 0 <= id < len(self.category_ids) or self.category_ids[id] == -1:
+            raise KeyError(id)
+        link, addr = self.links[id], self.addrs[id]
+        return self.build(id, self.type_names[self.types[id]], self.name(id),
+                          self.category_ids[id],
+                          self.strings[link] if link != -1 else None,
+                          self.strings[addr] if addr != -1 else None)
+
+    def __setitem__(self, id, course):
+        self.grow(id + 1)
+        if self.category_ids[id] == -1:
+            self.count += 1
+        self.category_ids[id] = course.category.id
+        if course.type_name not in self.type_names:
+            self.type_names.append(course.type_name)
+        self.types[id] = self.type_names.index(course.type_name)
+        self.links[id] = self.string_id(getattr(course, 'link', None))
+        self.addrs[id] = self.string_id(getattr(course, 'addr', None))
+        name = course.name.encode('utf-8')
+        start = self.name_starts[id]
+        if self.names[start:start + self.name_lengths[id]] != name:
+            # старое название остаётся в bytearray - режим для каталогов,
+            # которые в основном читают
+            self.name_starts[id] = len(self.names)
+            self.name_lengths[id] = len(name)
+            self.names += name
+
+    def __delitem__(self, id):
+        if not 0 <= id < len(self.category_ids) or self.category_ids[id] == -1:
+            raise KeyError(id)
+        self.category_ids[id] = -1
+        self.count -= 1
+
+    def __iter__(self):
+        for id, category_id in enumerate(self.category_ids):
+            if category_id != -1:
+                yield id
+
+    def __len__(self):
+        return self.count
+
+    def find_by_name(self, name):
+        """Первый по id курс с таким названием - полный просмотр"""
+        encoded = name.encode('utf-8')
+        for id in self:
+            start = self.name_starts[id]
+            if self.names[start:start + self.name_lengths[id]] == encoded:
+                return self[id]
+        return None
+
+
+class ColumnarCourseList:
+    """Курсы категории для столбцового режима: хранит только id,
+    объекты курсов создаются при обходе. Курсы сравниваются по id"""
+    __slots__ = ('columns', 'ids')
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.ids = array('i')
+
+    def __iter__(self):
+        for id in self.ids:
+            yield self.columns[id]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        # срез - для постраничного вывода: объекты создаются только для страницы
+        if isinstance(index, slice):
+            return [self.columns[id] for id in self.ids[index]]
+        return self.columns[self.ids[index]]
+
+    def __contains__(self, course):
+        return course.id in self.ids
+
+    def append(self, course):
+        self.columns[course.id] = course
+        self.ids.append(course.id)
+
+    def remove(self, course):
+        self.ids.remove(course.id)
+
+    def extend(self, courses):
+        for course in courses:
+            self.columns[course.id] = course
+        self.ids.extend(course.id for course in courses)
+
+    def remove_many(self, courses):
+        ids = {course.id for course in courses}
+        self.ids = array('i', (id for id in self.ids if id not in ids))
+
+
+class ColumnarIndex(CatalogIndex):
+    """Индексы каталога со столбцовым хранением курсов - для каталогов,
+    которые в основном читают. Индекса по названию нет: поиск по названию
+    просматривает все курсы"""
+
+    def __init__(self, build_course):
+        super().__init__()
+        self.courses = CourseColumns(build_course)
+
+    def add_course(self, course):
+        self.courses[course.id] = course
+
+    def remove_course(self, course):
+        self.courses.pop(course.id, None)
+
+    def rename_course(self, course, old_name):
+        # вместе с названием могла смениться ссылка
+        self.courses[course.id] = course
+
+    def get_course_by_name(self, name):
+        return self.courses.find_by_name(name)
+
+    def course_list(self):
+        return ColumnarCourseList(self.courses)
+
+
+class CategoryMapper:
+    """Преобразователь данных - категории в таблице category"""
+    insert_sql = 'INSERT INTO category (id, name, parent_id) VALUES (?, ?, ?)'
+    update_sql = 'UPDATE category SET name = ?, parent_id = ? WHERE id = ?'
+    delete_sql = 'DELETE FROM category WHERE id = ?'
+
+    @staticmethod
+    def insert_row(category):
+        return category.id, category.name, category.category.id if category.category else None
+
+    @staticmethod
+    def update_row(category):
+        return category.name, category.category.id if category.category else None, category.id
+
+    @staticmethod
+    def find_all(db):
+        """(id, name, parent_id) всех категорий по возрастанию id"""
+        return db.execute('SELECT id, name, parent_id FROM category ORDER BY id').fetchall()
+
+    @staticmethod
+    def max_id(db):
+        return db.execute('SELECT MAX(id) FROM category').fetchone()[0]
+
+
+class CourseMapper:
+    """Преобразователь данных - курсы в таблице course"""
+    insert_sql = ('INSERT INTO course (id, type, name, category_id, link, addr) '
+                  'VALUES (?, ?, ?, ?, ?, ?)')
+    update_sql = ('UPDATE course SET type = ?, name = ?, category_id = ?, link = ?, addr = ? '
+                  'WHERE id = ?')
+    delete_sql = 'DELETE FROM course WHERE id = ?'
+    columns = 'id, type, name, category_id, link, addr'
+
+    @staticmethod
+    def insert_row(course):
+        return (course.id, course.type_name, course.name, course.category.id,
+                getattr(course, 'link', None), getattr(course, 'addr', None))
+
+    @staticmethod
+    def update_row(course):
+        return (course.type_name, course.name, course.category.id,
+                getattr(course, 'link', None), getattr(course, 'addr', None), course.id)
+
+    def find_by_id(self, db, id):
+        return db.execute(f'SELECT {self.columns} FROM course WHERE id = ?', (id,)).fetchone()
+
+    def find_by_name(self, db, name):
+        return db.execute(f'SELECT {self.columns} FROM course WHERE name = ? '
+                          f'ORDER BY id LIMIT 1', (name,)).fetchone()
+
+    def find_by_category(self, db, category_id):
+        return db.execute(f'SELECT {self.columns} FROM course WHERE category_id = ? '
+                          f'ORDER BY id', (category_id,)).fetchall()
+
+    @staticmethod
+    def find_names(db, chunk_size):
+        """(id, название) всех курсов пачками по chunk_size строк"""
+        cursor = db.execute('SELECT id, name FROM course')
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+    @staticmethod
+    def count_by_category(db):
+        """{id категории: число курсов прямо в ней} - по индексу, без чтения строк"""
+        return dict(db.execute('SELECT category_id, COUNT(*) FROM course '
+                               'GROUP BY category_id').fetchall())
+
+    @staticmethod
+    def max_id(db):
+        return db.execute('SELECT MAX(id) FROM course').fetchone()[0]
+
+
+class IdSequence:
+    """Последовательность id таблицы в базе. Процесс занимает в базе блок
+    из block_size id и раздаёт его без обращения к базе, поэтому воркеры
+    pre-fork, пишущие в одну базу, не выдают одинаковых id. После fork
+    блок родителя в потомке отбрасывается. Интерфейс - как у AtomicCounter.
+    Неиспользованные id блока при остановке теряются - в id бывают пропуски"""
+
+    def __init__(self, db, name, table, block_size=None):
+        self.db = db
+        self.name = name
+        self.table = table
+        self.block_size = block_size or settings.STORAGE_ID_BLOCK_SIZE
+        self.lock = Lock()
+        # текущий блок - [value, end)
+        self.value = self.end = 0
+        process_hooks.add(self)
+
+    def allocate(self, count):
+        """Занимает в базе count id подряд, не меньше value"""
+        with self.db.transaction() as connection:
+            row = connection.execute('SELECT next FROM id_sequence WHERE name = ?',
+                                     (self.name,)).fetchone()
+            # строки, записанные без последовательности (прежние версии), тоже учитываются
+            max_id = connection.execute(f'SELECT MAX(id) FROM {self.table}').fetchone()[0]
+            first = max(row[0] if row else 1, (max_id or 0) + 1, self.value)
+            connection.execute('INSERT OR REPLACE INTO id_sequence (name, next) VALUES (?, ?)',
+                               (self.name, first + count))
+        return first
+
+    def next(self):
+        return self.reserve(1)
+
+    def reserve(self, count):
+        """Занимает count значений подряд, возвращает первое"""
+        with self.lock:
+            if self.value + count > self.end:
+                self.value = self.allocate(max(count, self.block_size))
+                self.end = self.value + max(count, self.block_size)
+            value = self.value
+            self.value += count
+            return value
+
+    def skip_to(self, value):
+        """Следующее значение будет не меньше value"""
+        with self.lock:
+            if value > self.value:
+                # блок не годится - следующий займётся начиная с value
+                self.value = value
+                self.end = min(self.end, value)
+
+    def after_fork(self):
+        # блок принадлежит родителю: потомок займёт в базе свой
+        self.lock = Lock()
+        self.end = self.value
+
+
+class UnitOfWork:
+    """Единица работы - копит новые, изменённые и удалённые объекты
+    и записывает их одной транзакцией. Строка объекта снимается в момент
+    регистрации, поэтому запись не мешает дальнейшим изменениям каталога"""
+
+    def __init__(self, mappers):
+        # порядок важен: категории вставляются раньше курсов, удаляются позже
+        self.mappers = mappers
+        # (имя преобразователя, id) -> строка
+        self.new = {}
+        self.dirty = {}
+        self.removed = {}
+
+    def register_new(self, mapper_name, obj):
+        self.new[mapper_name, obj.id] = self.mappers[mapper_name].insert_row(obj)
+
+    def register_dirty(self, mapper_name, obj):
+        key = mapper_name, obj.id
+        if key in self.new:
+            self.new[key] = self.mappers[mapper_name].insert_row(obj)
+        else:
+            self.dirty[key] = self.mappers[mapper_name].update_row(obj)
+
+    def register_removed(self, mapper_name, obj):
+        key = mapper_name, obj.id
+        self.dirty.pop(key, None)
+        if self.new.pop(key, None) is None:
+            self.removed[key] = (obj.id,)
+
+    def __len__(self):
+        return len(self.new) + len(self.dirty) + len(self.removed)
+
+    def merge(self, newer):
+        """Добавляет изменения более поздней единицы работы - когда запись
+        этой не удалась и она возвращается в хранилище. Строки вставки и
+        изменения одного объекта могут быть обе: commit вставляет раньше,
+        чем изменяет"""
+        self.new.update(newer.new)
+        self.dirty.update(newer.dirty)
+        for key, row in newer.removed.items():
+            self.dirty.pop(key, None)
+            if self.new.pop(key, None) is None:
+                self.removed[key] = row
+
+    def commit(self, connection):
+        for mapper_name, mapper in self.mappers.items():
+            self.execute(connection, mapper_name, mapper.insert_sql, self.new)
+            self.execute(connection, mapper_name, mapper.update_sql, self.dirty)
+        for mapper_name, mapper in reversed(self.mappers.items()):
+            self.execute(connection, mapper_name, mapper.delete_sql, self.removed)
+
+    @staticmethod
+    def execute(connection, mapper_name, sql, rows):
+        rows = [row for (name, _), row in rows.items() if name == mapper_name]
+        if rows:
+            connection.executemany(sql, rows)
+
+
+class CatalogStorage:
+    """Хранилище каталога в SQLite.
+    Изменения копятся в единице работы и пишутся одной транзакцией раз в
+    flush_interval секунд фоновым потоком или сразу, когда накопилось
+    batch_size изменений. При сбое процесса теряются изменения последних
+    flush_interval секунд; flush() записывает их немедленно.
+    Каждая транзакция записи увеличивает версию каталога в базе: changed()
+    сообщает, что каталог изменил другой процесс (воркер pre-fork)"""
+
+    def __init__(self, file_name, flush_interval=None, batch_size=None):
+        self.db = Database(file_name)
+        self.db.migrate(CATALOG_MIGRATIONS)
+        self.flush_interval = (flush_interval if flush_interval is not None
+                               else settings.STORAGE_FLUSH_INTERVAL)
+        self.batch_size = batch_size if batch_size is not None else settings.STORAGE_BATCH_SIZE
+        self.categories = CategoryMapper()
+        self.courses = CourseMapper()
+        self.mappers = {'category': self.categories, 'course': self.courses}
+        # id новых объектов выдаёт база - общая у всех воркеров
+        self.category_ids = IdSequence(self.db, 'category', 'category')
+        self.course_ids = IdSequence(self.db, 'course', 'course')
+        self.unit_of_work = UnitOfWork(self.mappers)
+        self.lock = Lock()
+        # транзакции идут строго в порядке смены единиц работы
+        self.flush_lock = Lock()
+        self.pending = Event()
+        self.flusher = None
+        # версия каталога, которую знает процесс; stale - другой процесс
+        # писал между нашими транзакциями
+        self.version = self.read_version()
+        self.stale = False
+        process_hooks.add(self)
+
+    def read_version(self):
+        return self.db.execute('SELECT version FROM catalog_version').fetchone()[0]
+
+    @staticmethod
+    def bump_version(connection):
+        """Увеличивает версию каталога в транзакции записи; возвращает новую"""
+        version = connection.execute('SELECT version FROM catalog_version').fetchone()[0] + 1
+        connection.execute('UPDATE catalog_version SET version = ?', (version,))
+        return version
+
+    def written(self, version):
+        """Своя транзакция записана с версией version"""
+        with self.lock:
+            if version - 1 != self.version:
+                self.stale = True
+            self.version = version
+
+    def changed(self):
+        """Изменял ли каталог в базе другой процесс после synced()"""
+        version = self.read_version()
+        with self.lock:
+            return self.stale or version != self.version
+
+    def synced(self, version):
+        """Каталог процесса перечитан из базы версии version"""
+        with self.lock:
+            self.version = version
+            self.stale = False
+
+    def register_new(self, mapper_name, obj):
+        with self.lock:
+            self.unit_of_work.register_new(mapper_name, obj)
+        self.schedule()
+
+    def register_dirty(self, mapper_name, obj):
+        with self.lock:
+            self.unit_of_work.register_dirty(mapper_name, obj)
+        self.schedule()
+
+    def register_removed(self, mapper_name, obj):
+        with self.lock:
+            self.unit_of_work.register_removed(mapper_name, obj)
+        self.schedule()
+
+    def register_batch(self, action, items):
+        """Пачка изменений (имя преобразователя, объект) попадает в одну
+        единицу работы целиком - и записывается одной транзакцией"""
+        with self.lock:
+            register = getattr(self.unit_of_work, f'register_{action}')
+            for mapper_name, obj in items:
+                register(mapper_name, obj)
+        self.schedule()
+
+    def schedule(self):
+        if not self.flush_interval or len(self.unit_of_work) >= self.batch_size:
+            self.flush()
+            return
+        if self.flusher is None:
+            self.start_flusher()
+        self.pending.set()
+
+    def start_flusher(self):
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = Thread(target=self.run_flusher, name='catalog-flusher',
+                                      daemon=True)
+                self.flusher.start()
+
+    def run_flusher(self):
+        while True:
+            self.pending.wait()
+            self.pending.clear()
+            # изменения, пришедшие за интервал, попадут в ту же транзакцию
+            sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                # импорт здесь: creational_patterns сам импортирует этот модуль
+                from patterns.creational_patterns import Logger
+                Logger('storage').error(f'Не удалось записать каталог: {e}')
+                # изменения вернулись в единицу работы - повторим через интервал
+                self.pending.set()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not len(self.unit_of_work):
+                    return
+                unit_of_work, self.unit_of_work = self.unit_of_work, UnitOfWork(self.mappers)
+            try:
+                with self.db.transaction() as connection:
+                    unit_of_work.commit(connection)
+                    version = self.bump_version(connection)
+            except BaseException:
+                # транзакция откатилась: изменения возвращаются и не теряются,
+                # изменения, пришедшие за это время, ложатся поверх
+                with self.lock:
+                    unit_of_work.merge(self.unit_of_work)
+                    self.unit_of_work = unit_of_work
+                raise
+            self.written(version)
+
+    def before_fork(self):
+        # изменения, накопленные до fork, пишет родитель, а не каждый воркер
+        self.flush()
+
+    def at_exit(self):
+        self.flush()
+
+    def after_fork(self):
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.pending = Event()
+        self.flusher = None
+
+    def import_courses(self, records, batch_size=None):
+        """Массовый импорт: records - (путь категории через '/', название, ссылка).
+        Недостающие категории создаются. Пишет напрямую, пачками по batch_size
+        строк в транзакции. Возвращает число импортированных курсов"""
+        batch_size = batch_size or settings.STORAGE_IMPORT_BATCH_SIZE
+        self.flush()
+        categories = {}
+        names = {}
+        for id, name, parent_id in self.categories.find_all(self.db):
+            names[id] = (name, parent_id)
+        for id in names:
+            path, parent_id = [], id
+            while parent_id is not None:
+                name, parent_id = names[parent_id]
+                path.append(name)
+            categories.setdefault('/'.join(reversed(path)), id)
+        imported = 0
+        category_rows, course_rows = [], []
+
+        def write():
+            with self.db.transaction() as connection:
+                connection.executemany(self.categories.insert_sql, category_rows)
+                connection.executemany(self.courses.insert_sql, course_rows)
+                version = self.bump_version(connection)
+            self.written(version)
+            category_rows.clear()
+            course_rows.clear()
+
+        for category_path, name, link in records:
+            parts = [part for part in category_path.split('/') if part]
+            parent_id = None
+            for depth in range(1, len(parts) + 1):
+                path = '/'.join(parts[:depth])
+                if path not in categories:
+                    category_id = self.category_ids.next()
+                    categories[path] = category_id
+                    category_rows.append((category_id, parts[depth - 1], parent_id))
+                parent_id = categories[path]
+            if parent_id is None:
+                raise ValueError(f'У курса {name} не указана категория')
+            course_rows.append((self.course_ids.next(), 'record', name, parent_id, link, None))
+            imported += 1
+            if len(course_rows) >= batch_size:
+                write()
+        write()
+        return imported
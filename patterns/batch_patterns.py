@@ -0,0 +1,64 @@
+import csv
+import json
+
+
+class CourseBatchReader:
+    """Записи пакетного создания курсов из тела запроса или файла:
+    (вид, ссылка или адрес, название, id категории).
+    CSV (text/csv): id категории, название, ссылка[, вид]; строки с # - комментарии.
+    JSON Lines (application/x-ndjson): {"category": 1, "name": "...", "link": "...",
+    "type": "record"}; у интерактивного курса вместо link - addr.
+    Ошибки - ValueError с номером строки"""
+    formats = {
+        'text/csv': 'read_csv',
+        'application/x-ndjson': 'read_jsonl',
+        'application/jsonl': 'read_jsonl',
+        'application/json-lines': 'read_jsonl',
+    }
+
+    def read(self, content_type, lines):
+        method = self.formats.get(content_type.partition(';')[0].strip().lower())
+        if method is None:
+            raise ValueError(f'Формат {content_type or "без Content-Type"} не поддерживается, '
+                             f'нужен один из: {", ".join(self.formats)}')
+        return getattr(self, method)(lines)
+
+    @staticmethod
+    def category_id(value, number):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Строка {number}: неверный id категории {value!r}')
+
+    def read_csv(self, lines):
+        records = []
+        for number, row in enumerate(csv.reader(lines), 1):
+            if not row or row[0].startswith('#'):
+                continue
+            if len(row) < 3:
+                raise ValueError(f'Строка {number}: нужны id категории, название и ссылка')
+            type_ = row[3].strip() if len(row) > 3 and row[3].strip() else 'record'
+            records.append((type_, row[2], row[1], self.category_id(row[0], number)))
+        return records
+
+    def read_jsonl(self, lines):
+        records = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f'Строка {number}: {e}')
+            if not isinstance(item, dict):
+                raise ValueError(f'Строка {number}: нужен объект JSON')
+            type_ = item.get('type', 'record')
+            field = 'addr' if type_ == 'interactive' else 'link'
+            addr = item.get(field, '')
+            name = item.get('name', '')
+            if not isinstance(name, str):
+                raise ValueError(f'Строка {number}: name должно быть строкой')
+            if not isinstance(addr, str):
+                raise ValueError(f'Строка {number}: {field} должно быть строкой')
+            records.append((type_, addr, name, self.category_id(item.get('category'), number)))
+        return records
@@ -0,0 +1,155 @@
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+import atexit
+import json
+import os
+import sys
+
+
+class Observer:
+    """Наблюдатель - поведенческий паттерн"""
+
+    def update(self, subject, tags):
+        pass
+
+
+class Subject:
+    """Наблюдаемый объект: сообщает наблюдателям, какие данные изменились.
+    tags - множество строк вида 'category:3', по которым наблюдатель
+    решает, что ему делать; None - изменилось всё"""
+
+    def __init__(self):
+        self.observers = []
+
+    def attach(self, observer):
+        self.observers.append(observer)
+
+    def detach(self, observer):
+        self.observers.remove(observer)
+
+    def notify(self, tags):
+        for observer in self.observers:
+            observer.update(self, tags)
+
+
+class ConsoleWriter:
+    """Стратегия записи лога - в консоль"""
+
+    def write(self, line):
+        sys.stdout.write(f'{line}\n')
+
+    def flush(self):
+        sys.stdout.flush()
+
+
+class FileWriter:
+    """Стратегия записи лога - в файл с ротацией по размеру:
+    log.txt -> log.txt.1 -> ... -> log.txt.<backup_count>"""
+
+    def __init__(self, file_name, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.file_name = file_name
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.file = None
+        self.size = 0
+
+    def open(self):
+        self.file = open(self.file_name, 'a', encoding='utf-8')
+        self.size = self.file.tell()
+
+    def write(self, line):
+        if self.file is None:
+            self.open()
+        data = f'{line}\n'
+        if self.max_bytes and self.size + len(data) > self.max_bytes and self.size:
+            self.rotate()
+        self.file.write(data)
+        self.size += len(data.encode('utf-8'))
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f'{self.file_name}.{i}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.file_name}.{i + 1}')
+        if self.backup_count:
+            os.replace(self.file_name, f'{self.file_name}.1')
+        else:
+            os.remove(self.file_name)
+        self.open()
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+
+class LogQueue:
+    """Очередь записей лога. Запрос только кладёт запись в очередь,
+    а фоновый поток переводит записи в JSON и передаёт стратегиям записи,
+    поэтому медленная консоль или диск не задерживают ответ.
+    Если очередь переполнена, запись отбрасывается и учитывается в dropped;
+    ошибки записи (диск полон, поток закрыт) учитываются в errors, и поток
+    продолжает работу"""
+
+    def __init__(self, max_size=10000):
+        self.queue = Queue(maxsize=max_size)
+        self.dropped = 0
+        self.errors = 0
+        self.thread = None
+        self.lock = Lock()
+        os.register_at_fork(after_in_child=self.after_fork)
+        atexit.register(self.close)
+
+    def put(self, writer, record):
+        if self.thread is None or not self.thread.is_alive():
+            self.start()
+        try:
+            self.queue.put_nowait((writer, record))
+        except Full:
+            self.dropped += 1
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = Thread(target=self.run, name='log-writer', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            writers = set()
+            # забираем всё, что накопилось, и сбрасываем буферы один раз
+            while item is not None:
+                writer, record = item
+                try:
+                    writer.write(json.dumps(record, ensure_ascii=False, default=str))
+                    writers.add(writer)
+                except Exception:
+                    self.errors += 1
+                try:
+                    item = self.queue.get_nowait()
+                except Empty:
+                    item = False
+                    break
+            for writer in writers:
+                try:
+                    writer.flush()
+                except Exception:
+                    self.errors += 1
+            if item is None:
+                return
+
+    def close(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+        self.thread = None
+
+    def after_fork(self):
+        # поток записи не переживает fork - в воркере запустится новый
+        self.queue = Queue(maxsize=self.queue.maxsize)
+        self.thread = None
+        self.lock = Lock()
+
+
+log_queue = LogQueue()
@@ -0,0 +1,142 @@
+from contextlib import contextmanager
+from threading import Condition, Lock, get_ident, local
+from weakref import WeakSet
+import atexit
+import os
+
+
+class AtomicCounter:
+    """Счётчик, который можно увеличивать из нескольких потоков"""
+
+    def __init__(self, start=0):
+        self.value = start
+        self.lock = Lock()
+
+    def next(self):
+        with self.lock:
+            value = self.value
+            self.value += 1
+            return value
+
+    def reserve(self, count):
+        """Занимает count значений подряд, возвращает первое"""
+        with self.lock:
+            value = self.value
+            self.value += count
+            return value
+
+    def skip_to(self, value):
+        """Следующее значение будет не меньше value"""
+        with self.lock:
+            self.value = max(self.value, value)
+
+
+class ReadWriteLock:
+    """Блокировка чтения-записи: читатели работают параллельно,
+    писатель - один и без читателей. Ожидающий писатель не пропускает
+    новых читателей вперёд. Поток-писатель может снова брать блокировку
+    на запись или чтение, поток-читатель - на чтение."""
+
+    def __init__(self):
+        self.condition = Condition(Lock())
+        self.readers = 0
+        self.writers_waiting = 0
+        self.writer = None
+        self.write_depth = 0
+        self.local = local()
+
+    @contextmanager
+    def read(self):
+        me = get_ident()
+        depth = getattr(self.local, 'read_depth', 0)
+        if self.writer == me or depth:
+            # уже держим блокировку в этом потоке
+            self.local.read_depth = depth + 1
+            try:
+                yield
+            finally:
+                self.local.read_depth = depth
+            return
+        with self.condition:
+            while self.writer is not None or self.writers_waiting:
+                self.condition.wait()
+            self.readers += 1
+        self.local.read_depth = 1
+        try:
+            yield
+        finally:
+            self.local.read_depth = 0
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = get_ident()
+        with self.condition:
+            if self.writer == me:
+                self.write_depth += 1
+            else:
+                if getattr(self.local, 'read_depth', 0):
+                    raise RuntimeError('Нельзя взять блокировку на запись, держа её на чтение')
+                self.writers_waiting += 1
+                while self.writer is not None or self.readers:
+                    self.condition.wait()
+                self.writers_waiting -= 1
+                self.writer = me
+                self.write_depth = 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.write_depth -= 1
+                if not self.write_depth:
+                    self.writer = None
+                    self.condition.notify_all()
+
+
+class ProcessHooks:
+    """Обработчики fork и выхода из процесса для объектов, которых может быть
+    много (Engine, индексы, хранилища). os.register_at_fork и atexit
+    регистрируются один раз, а объекты хранятся по слабым ссылкам - hooks
+    не держат их до конца процесса. У объекта вызываются те из методов
+    before_fork, after_fork (в дочернем процессе) и at_exit, что у него есть"""
+
+    def __init__(self):
+        self.objects = WeakSet()
+        self.lock = Lock()
+        os.register_at_fork(before=self.before_fork, after_in_child=self.after_fork)
+        atexit.register(self.at_exit)
+
+    def add(self, obj):
+        with self.lock:
+            self.objects.add(obj)
+
+    def call(self, method_name):
+        with self.lock:
+            objects = list(self.objects)
+        for obj in objects:
+            method = getattr(obj, method_name, None)
+            if method is None:
+                continue
+            try:
+                method()
+            except Exception as e:
+                # ошибка одного объекта не мешает остальным
+                from patterns.creational_patterns import Logger
+                Logger('main').error(f'{type(obj).__name__}.{method_name}: {e}')
+
+    def before_fork(self):
+        self.call('before_fork')
+
+    def after_fork(self):
+        # блокировку мог держать поток родителя, которого в потомке нет
+        self.lock = Lock()
+        self.call('after_fork')
+
+    def at_exit(self):
+        self.call('at_exit')
+
+
+process_hooks = ProcessHooks()
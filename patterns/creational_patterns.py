@@ -1,9 +1,20 @@
 from copy import copy
-from quopri import decodestring
+from random import random
+from sys import intern
+from time import time
+from threading import Lock, Thread
+from patterns.architectural_patterns import CatalogIndex, CatalogStorage, ColumnarIndex
+from patterns.behavioral_patterns import Subject, ConsoleWriter, log_queue
+from patterns.concurrency_patterns import AtomicCounter, ReadWriteLock, process_hooks
+from patterns.search_patterns import SearchIndex
+from pumba_framework.framework_requests import decode_value
+import pumba_framework.search_settings as search_settings
+import pumba_framework.storage_settings as storage_settings
 
 
 class User:
     """Абстрактный пользователь"""
+    __slots__ = ('first_name', 'last_name', 'birthday')
 
     def __init__(self, first_name, last_name):
         self.first_name = first_name
@@ -13,6 +24,7 @@ class User:
 
 class Teacher(User):
     """Преподаватель"""
+    __slots__ = ()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -20,6 +32,7 @@ class Teacher(User):
 
 class Student(User):
     """Студент"""
+    __slots__ = ()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -46,31 +59,55 @@ class UserFactory:
 
 class Course:
     """Курс"""
-    auto_id = 0
+    __slots__ = ('id', 'name', 'category')
+    auto_id = AtomicCounter()
+    # вид курса в хранилище
+    type_name = 'course'
 
     def __init__(self, name, category):
-        self.id = Course.auto_id
-        Course.auto_id += 1
+        self.id = Course.auto_id.next()
         self.name = name
         self.category = category
-        self.category.courses.append(self)
+        self.category.add_course(self)
 
     def clone(self):
-        return Course(self.name, self.category)
+        """Копия курса того же вида с новым id в той же категории"""
+        course = copy(self)
+        course.id = Course.auto_id.next()
+        course.category.add_course(course)
+        return course
+
+    @classmethod
+    def restore(cls, id, name, category, **fields):
+        """Курс из хранилища: id уже есть, в категорию курс не добавляется"""
+        course = cls.__new__(cls)
+        course.id = id
+        course.name = name
+        course.category = category
+        for field, value in fields.items():
+            # ссылки и адреса у многих курсов одинаковые - храним одну строку
+            setattr(course, field, intern(value))
+        return course
 
 
 class InteractiveCourse(Course):
     """Интерактивный курс"""
+    __slots__ = ('addr',)
+    type_name = 'interactive'
+
     def __init__(self, addr, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.addr = addr
+        self.addr = intern(addr)
 
 
 class RecordCourse(Course):
     """Курс в записи"""
+    __slots__ = ('link',)
+    type_name = 'record'
+
     def __init__(self, link, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.link = link
+        self.link = intern(link)
 
 
 class CourseFactory:
@@ -78,122 +115,615 @@ class CourseFactory:
         'interactive': InteractiveCourse,
         'record': RecordCourse
     }
+    # поле, которое задаёт второй аргумент create
+    fields = {
+        'interactive': 'addr',
+        'record': 'link',
+    }
+    # классы по виду курса в хранилище; копии курсов раньше сохранялись
+    # как Course без ссылки - они восстанавливаются курсами в записи
+    stored_types = {
+        'course': RecordCourse,
+        'interactive': InteractiveCourse,
+        'record': RecordCourse,
+    }
+
+    @classmethod
+    def field(cls, course):
+        """Поле курса со ссылкой или адресом: у интерактивного - addr"""
+        return cls.fields.get(course.type_name, 'link')
 
     @classmethod
     def create(cls, type_, addr, name, category):
         """Фабричный метод - порождающий паттерн"""
         return cls.types[type_](addr, name, category)
 
+    @classmethod
+    def create_batch(cls, records):
+        """Курсы по записям (вид, ссылка или адрес, название, категория) с id подряд.
+        Сначала проверяются все записи, в категории курсы не добавляются"""
+        for number, (type_, addr, name, category) in enumerate(records, 1):
+            if type_ not in cls.types:
+                raise ValueError(f'Запись {number}: неизвестный вид курса {type_}')
+            if not isinstance(name, str) or not name:
+                raise ValueError(f'Запись {number}: название курса должно быть непустой строкой')
+            if not isinstance(addr, str):
+                raise ValueError(f'Запись {number}: {cls.fields[type_]} должно быть строкой')
+            if category is None:
+                raise ValueError(f'Запись {number}: не указана категория')
+        first_id = Course.auto_id.reserve(len(records))
+        return [cls.types[type_].restore(first_id + offset, name, category,
+                                         **{cls.fields[type_]: addr})
+                for offset, (type_, addr, name, category) in enumerate(records)]
+
+    @staticmethod
+    def copy_batch(courses, category):
+        """Копии курсов с новыми id подряд в категории category (в неё не добавляются)"""
+        first_id = Course.auto_id.reserve(len(courses))
+        copies = []
+        for offset, course in enumerate(courses):
+            new_course = copy(course)
+            new_course.id = first_id + offset
+            new_course.category = category
+            copies.append(new_course)
+        return copies
+
 
 class Category:
     """Категория"""
-    auto_id = 0
+    __slots__ = ('child_categories', 'id', 'name', 'category', '_courses',
+                 'total_courses', 'course_loader')
+    auto_id = AtomicCounter()
 
-    def __init__(self, name, category):
+    def __init__(self, name, category, course_loader=None, id=None):
         self.child_categories = []
-        self.id = Category.auto_id
-        Category.auto_id += 1
+        self.id = Category.auto_id.next() if id is None else id
         self.name = name
         self.category = category
         if category:
             category.child_categories.append(self)
-        self.courses = []
+        # загрузчик курсов категории (ленивая загрузка): без него
+        # курсы живут в обычном списке
+        self.course_loader = course_loader
+        self._courses = [] if course_loader is None else None
+        # курсов в категории вместе со всеми подкатегориями
+        self.total_courses = 0
+
+    @property
+    def courses(self):
+        if self._courses is None:
+            self._courses = self.course_loader(self)
+        return self._courses
+
+    def add_course(self, course):
+        self.courses.append(course)
+        self.update_course_count(1)
+
+    def remove_course(self, course):
+        self.courses.remove(course)
+        self.update_course_count(-1)
+
+    def add_courses(self, courses):
+        """Пачка курсов: счётчики предков обновляются один раз"""
+        self.courses.extend(courses)
+        self.update_course_count(len(courses))
+
+    def remove_courses(self, courses):
+        """Пачка курсов удаляется за один проход по списку категории"""
+        course_list = self.courses
+        if isinstance(course_list, list):
+            ids = {course.id for course in courses}
+            course_list[:] = [course for course in course_list if course.id not in ids]
+        else:
+            course_list.remove_many(courses)
+        self.update_course_count(-len(courses))
+
+    def update_course_count(self, delta):
+        """Поднимает изменение счётчика по цепочке предков"""
+        category = self
+        while category:
+            category.total_courses += delta
+            category = category.category
 
     def course_count(self):
+        return self.total_courses
+
+    def recount(self):
+        """Полный пересчёт курсов в поддереве без учёта сохранённых счётчиков"""
         result = len(self.courses)
         for category in self.child_categories:
-            result += category.course_count()
+            result += category.recount()
         return result
 
 
-class Engine:
-    """Основной интерфейс проекта"""
-
-    def __init__(self):
+class Engine(Subject):
+    """Основной интерфейс проекта
+    Изменения каталога идут под блокировкой на запись, чтение - под
+    блокировкой на чтение: site.lock.read() можно держать на время рендера.
+    После изменения наблюдатели получают теги затронутых страниц:
+    'categories' - список корневых категорий, 'categories:all' - все
+    категории, 'category:<id>' - категория, 'course:<id>' - курс.
+    С хранилищем (storage) при запуске читаются только категории и число
+    курсов в них, курсы загружаются при первом обращении к категории или id.
+    Загруженные объекты остаются в index - это карта объектов: один курс
+    в памяти представлен одним объектом.
+    В столбцовом режиме (columnar) курсы хранятся в массивах ColumnarIndex,
+    а объекты курсов создаются при каждом обращении и не совпадают по
+    ссылке - сравнивать их нужно по id"""
+
+    def __init__(self, storage=None, columnar=None, deferred=False):
+        super().__init__()
+        self.lock = ReadWriteLock()
+        self.load_lock = Lock()
         self.teachers = []
         self.students = []
         self.categories = []
-        self.courses = []
-        self.make_data()
-
-    def make_data(self):
+        if columnar is None:
+            columnar = storage_settings.STORAGE_COLUMNAR
+        self.index = ColumnarIndex(self.build_course) if columnar else CatalogIndex()
+        # id удалённых курсов: их строки могут ещё не быть удалены из базы
+        self.removed_course_ids = set()
+        # полнотекстовый поиск по названиям курсов и категорий
+        self.course_search = SearchIndex() if search_settings.SEARCH_ENABLED else None
+        self.category_search = SearchIndex() if search_settings.SEARCH_ENABLED else None
+        if storage is None and storage_settings.STORAGE_PATH:
+            storage = CatalogStorage(storage_settings.STORAGE_PATH)
+        self.storage = storage
+        # курсы новых категорий хранятся в обычном списке, если их
+        # не нужно ни загружать, ни держать в столбцах
+        self.course_loader = self.load_courses if storage is not None or columnar else None
+        # deferred - каталог загружается позже, вызовом load_catalog()
+        self.loaded = False
+        process_hooks.add(self)
+        if not deferred:
+            self.load_catalog()
+
+    def before_fork(self):
+        # поток построения поискового индекса не переживает fork:
+        # воркеры pre-fork получают от родителя уже готовый индекс
+        if self.course_search is not None:
+            self.course_search.ready.wait()
+
+    def load_catalog(self):
+        """Пользователи и каталог - из хранилища или демонстрационные"""
+        if self.loaded:
+            return
+        self.make_users()
+        if self.storage is not None:
+            # id выдаёт база: воркеры, пишущие в одну базу, их не повторят
+            Category.auto_id = self.storage.category_ids
+            Course.auto_id = self.storage.course_ids
+        if self.storage is None or not self.load():
+            self.make_data()
+        self.loaded = True
+
+    def make_users(self):
         for t in [('John', 'Wick'), ('Peter', 'Dinklage'),
                   ('Emilia', 'Clarke')]:
             self.teachers.append(self.create_user('teacher', *t))
         for s in [('Angela', 'Moss'), ('Jill', 'Lawson'), ('Steve', 'Ray')]:
             self.students.append(self.create_user('student', *s))
+
+    def make_data(self):
         for cat, cs in [('Programmers', ['Python', 'Java']),
                         ('Sport', ['Power', 'Run', 'Tennis', 'Soccer']),
                         ('Life Ballance', ['Time']),
                         ('Spirit', ['First course', 'Second course'])]:
             cat = self.create_category(cat)
-            self.categories.append(cat)
-            self.courses += [self.create_course('record',
-                                                '/site_link/',
-                                                c, cat) for c in cs]
+            for c in cs:
+                self.create_course('record', '/site_link/', c, cat)
         last_category = self.categories[-1]
         for cat, cs in [('first_sub_category', ['First course in first', 'Second course in first']),
                         ('second_sub_category', ['First course in second', 'Second course in second'])]:
             cat = self.create_category(cat, last_category)
-            self.courses += [self.create_course('record',
-                                                '/site_link/',
-                                                c, cat) for c in cs]
+            for c in cs:
+                self.create_course('record', '/site_link/', c, cat)
         # all_categories = self.get_all_categories(self.categories)
         # for cat in all_categories:
         #     print(cat.name)
 
+    def load(self):
+        """Читает из хранилища дерево категорий и счётчики курсов.
+        Возвращает False, если хранилище пустое"""
+        db = self.storage.db
+        rows = self.storage.categories.find_all(db)
+        if not rows:
+            return False
+        # родитель может иметь больший id, если базу правили вручную
+        pending = rows
+        while pending:
+            postponed = []
+            for id, name, parent_id in pending:
+                if parent_id is not None and parent_id not in self.index.categories:
+                    postponed.append((id, name, parent_id))
+                    continue
+                category = Category(name, self.index.get_category(parent_id),
+                                    self.load_courses, id)
+                self.index.add_category(category)
+                self.update_search(self.category_search, id, name)
+                if parent_id is None:
+                    self.categories.append(category)
+            if len(postponed) == len(pending):
+                raise Exception(f'Категории без родителя: {[row[0] for row in postponed]}')
+            pending = postponed
+        for category_id, count in self.storage.courses.count_by_category(db).items():
+            category = self.index.get_category(category_id)
+            if category:
+                category.update_course_count(count)
+        if self.course_search is not None:
+            # названия курсов индексируются в фоне, чтобы не задерживать запуск
+            self.course_search.ready.clear()
+            Thread(target=self.build_course_search, name='course-search-index',
+                   args=(self.course_search, self.removed_course_ids), daemon=True).start()
+        return True
+
+    def build_course_search(self, search_index, removed_ids):
+        """Загружает в поисковый индекс названия всех курсов из хранилища.
+        Курсы, изменённые за время построения, индекс уже знает - они пропускаются"""
+        try:
+            for rows in self.storage.courses.find_names(
+                    self.storage.db, search_settings.SEARCH_BUILD_CHUNK_SIZE):
+                search_index.add_missing(rows, removed_ids)
+        except Exception as e:
+            Logger('storage').error(f'Не удалось построить поисковый индекс: {e}')
+        finally:
+            search_index.ready.set()
+
+    def sync(self):
+        """Перечитывает каталог из хранилища, если его изменил другой процесс
+        (воркер pre-fork или manage.py import): у каждого процесса свой
+        каталог в памяти. Наблюдатели получают tags=None - изменилось всё.
+        Возвращает True, если каталог перечитан"""
+        if self.storage is None or not self.loaded or not self.storage.changed():
+            return False
+        with self.lock.write():
+            try:
+                # свои изменения - в базу, иначе перечитанный каталог их потеряет;
+                # после flush своя транзакция, которая шла во время проверки,
+                # уже учтена - повторная проверка её не примет за чужую
+                self.storage.flush()
+                if not self.storage.changed():
+                    return False
+                version = self.storage.read_version()
+            except Exception as e:
+                Logger('storage').error(f'Не удалось перечитать каталог: {e}')
+                return False
+            self.categories = []
+            self.index = (ColumnarIndex(self.build_course)
+                          if isinstance(self.index, ColumnarIndex) else CatalogIndex())
+            self.removed_course_ids = set()
+            if self.course_search is not None:
+                self.course_search = SearchIndex()
+                self.category_search = SearchIndex()
+            self.load()
+            self.storage.synced(version)
+            self.notify(None)
+        return True
+
+    @staticmethod
+    def update_search(search_index, id, name=None, old_name=None):
+        """Добавляет документ поиска или меняет его название с old_name;
+        без name - удаляет документ с названием old_name"""
+        if search_index is None:
+            return
+        if name is None:
+            search_index.remove(id, old_name)
+        else:
+            search_index.add(id, name, old_name)
+
+    def search(self, query, page=1, page_size=None):
+        """Поиск по названиям. Возвращает (категории, курсы страницы page,
+        есть ли следующая страница курсов)"""
+        if self.course_search is None:
+            return [], [], False
+        page_size = page_size or search_settings.SEARCH_PAGE_SIZE
+        category_ids, _ = self.category_search.search(
+            query, 0, search_settings.SEARCH_CATEGORIES_LIMIT) if page == 1 else ([], False)
+        course_ids, has_next = self.course_search.search(
+            query, (page - 1) * page_size, page_size)
+        categories = [self.index.get_category(id) for id in category_ids]
+        courses = []
+        for id in course_ids:
+            try:
+                courses.append(self.find_course_by_id(id))
+            except Exception:
+                # курс удалили между поиском и загрузкой
+                continue
+        return [category for category in categories if category], courses, has_next
+
+    def load_courses(self, category):
+        """Ленивая загрузка курсов категории"""
+        rows = ()
+        if self.storage is not None:
+            rows = self.storage.courses.find_by_category(self.storage.db, category.id)
+        with self.load_lock:
+            courses = self.index.course_list()
+            for row in rows:
+                if row[0] not in self.removed_course_ids:
+                    courses.append(self.restore_course(row))
+            return courses
+
+    def restore_course(self, row):
+        """Объект курса по строке хранилища; уже загруженный курс не дублируется"""
+        id, type_name, name, category_id, link, addr = row
+        course = self.index.get_course(id)
+        if course is None:
+            course = self.build_course(id, type_name, name, category_id, link, addr)
+            self.index.add_course(course)
+        return course
+
+    def build_course(self, id, type_name, name, category_id, link, addr):
+        fields = {}
+        if link is not None:
+            fields['link'] = link
+        if addr is not None:
+            fields['addr'] = addr
+        return CourseFactory.stored_types[type_name].restore(
+            id, name, self.index.get_category(category_id), **fields)
+
+    def save(self, action, mapper_name, obj):
+        """Передаёт изменение в единицу работы хранилища"""
+        if self.storage is not None:
+            getattr(self.storage, f'register_{action}')(mapper_name, obj)
+
+    def flush(self):
+        """Немедленно записывает накопленные изменения в хранилище"""
+        if self.storage is not None:
+            self.storage.flush()
+
     @staticmethod
     def create_user(type_, *args, **kwargs):
         return UserFactory.create(type_, *args, **kwargs)
 
-    @staticmethod
-    def create_category(name, category=None):
-        return Category(name, category)
+    def create_category(self, name, category=None):
+        with self.lock.write():
+            new_category = Category(name, category, self.course_loader)
+            self.index.add_category(new_category)
+            self.update_search(self.category_search, new_category.id, name)
+            self.save('new', 'category', new_category)
+            if category is None:
+                self.categories.append(new_category)
+                self.notify({'categories', 'categories:all'})
+            else:
+                self.notify({f'category:{category.id}', 'categories:all'})
+            return new_category
 
     def find_category_by_id(self, id):
-        category = self.find_in_all_category(self.categories, id)
+        category = self.index.get_category(id)
         if category:
             return category
         raise Exception(f'Нет категории с id = {id}')
 
-    @classmethod
-    def find_in_all_category(cls, categories, id):
-        for category in categories:
-            print('category', category.id)
-            if category.id == id:
-                return category
-            category = cls.find_in_all_category(category.child_categories, id)
-            if category:
-                return category
-
     def get_all_categories(self, categories):
-        cats = categories.copy()
-        for cat in categories:
-            cats += self.get_all_categories(cat.child_categories)
-        return cats
+        with self.lock.read():
+            cats = categories.copy()
+            for cat in categories:
+                cats += self.get_all_categories(cat.child_categories)
+            return cats
 
     def find_course_by_id(self, id):
-        for item in self.courses:
-            print('item', item.id)
-            if item.id == id:
-                return item
+        course = self.index.get_course(id)
+        if course:
+            return course
+        if self.storage is not None and id not in self.removed_course_ids:
+            row = self.storage.courses.find_by_id(self.storage.db, id)
+            if row:
+                with self.load_lock:
+                    return self.restore_course(row)
         raise Exception(f'Нет курса с id = {id}')
 
+    def add_course(self, course):
+        with self.lock.write():
+            self.index.add_course(course)
+            self.update_search(self.course_search, course.id, course.name)
+            self.save('new', 'course', course)
+            self.notify(self.category_tags(course.category))
+            return course
+
+    def create_course(self, type_, addr, name, category):
+        with self.lock.write():
+            return self.add_course(CourseFactory.create(type_, addr, name, category))
+
+    def clone_course(self, course, name=None):
+        with self.lock.write():
+            new_course = course.clone()
+            if name is not None:
+                new_course.name = name
+            return self.add_course(new_course)
+
+    def edit_course(self, course, name, link, category):
+        """Меняет название, ссылку (у интерактивного курса - адрес) и категорию.
+        Неверные данные - ValueError до изменений"""
+        if not isinstance(name, str) or not name:
+            raise ValueError('Пустое название курса')
+        if not isinstance(link, str):
+            raise ValueError('Ссылка должна быть строкой')
+        field = CourseFactory.field(course)
+        with self.lock.write():
+            if self.index.get_category(category.id) is not category:
+                raise ValueError(f'Категории {category.id} нет в каталоге')
+            # ленивая загрузка курсов - до изменений, она может упасть
+            category.courses
+            course.category.courses
+            old_name = course.name
+            course.name = name
+            setattr(course, field, intern(link))
+            self.index.rename_course(course, old_name)
+            self.update_search(self.course_search, course.id, name, old_name)
+            self.move_course(course, category)
+            self.save('dirty', 'course', course)
+            self.notify(self.category_tags(category) | {f'course:{course.id}'})
+            return course
+
+    def move_course(self, course, category):
+        with self.lock.write():
+            if course.category is category:
+                return
+            old_category = course.category
+            old_category.remove_course(course)
+            course.category = category
+            category.add_course(course)
+            self.save('dirty', 'course', course)
+            self.notify(self.category_tags(old_category) | self.category_tags(category))
+
+    def save_batch(self, action, items):
+        """Передаёт пачку изменений (имя преобразователя, объект) в хранилище
+        одной единицей работы"""
+        if self.storage is not None:
+            self.storage.register_batch(action, items)
+
+    def add_courses(self, courses):
+        """Добавляет в каталог созданные, но ещё не добавленные курсы:
+        по одному обновлению счётчиков на категорию, одно слияние
+        поискового индекса, одна единица работы и одно уведомление"""
+        by_category = {}
+        for course in courses:
+            by_category.setdefault(course.category.id, []).append(course)
+        with self.lock.write():
+            for category_courses in by_category.values():
+                category = category_courses[0].category
+                if self.index.get_category(category.id) is not category:
+                    raise ValueError(f'Категории {category.id} нет в каталоге')
+                # ленивая загрузка курсов - до изменений, она может упасть
+                category.courses
+            # и разбор названий для поиска
+            documents = (SearchIndex.prepare((course.id, course.name) for course in courses)
+                         if self.course_search is not None else None)
+            tags = set()
+            for category_courses in by_category.values():
+                category = category_courses[0].category
+                category.add_courses(category_courses)
+                tags |= self.category_tags(category)
+            for course in courses:
+                self.index.add_course(course)
+            if documents is not None:
+                self.course_search.add_documents(documents)
+            self.save_batch('new', [('course', course) for course in courses])
+            self.notify(tags)
+            return courses
+
+    def create_courses(self, records):
+        """Пакетное создание: records - (вид, ссылка или адрес, название, категория).
+        Применяется целиком или, если хоть одна запись неверна, не применяется
+        совсем (ValueError). Возвращает созданные курсы"""
+        records = list(records)
+        with self.lock.write():
+            return self.add_courses(CourseFactory.create_batch(records))
+
+    def copy_category(self, category, parent=None, name=None):
+        """Глубокая копия категории со всеми подкатегориями и курсами
+        в parent (None - в корень) под названием name. Возвращает копию"""
+        with self.lock.write():
+            sources = self.get_all_categories([category])
+            if parent is not None and parent in sources:
+                raise ValueError('Нельзя копировать категорию внутрь самой себя')
+            for source in sources:
+                source.courses
+            copies = {}
+            new_categories, new_courses = [], []
+            for source in sources:
+                if source is category:
+                    new_category = Category(name or source.name, parent, self.course_loader)
+                else:
+                    new_category = Category(source.name, copies[source.category.id],
+                                            self.course_loader)
+                copies[source.id] = new_category
+                new_categories.append(new_category)
+                self.index.add_category(new_category)
+                category_courses = CourseFactory.copy_batch(list(source.courses), new_category)
+                new_category.courses.extend(category_courses)
+                new_category.total_courses = len(category_courses)
+                new_courses += category_courses
+            # дети идут после родителей: суммы поддеревьев - в обратном порядке
+            for new_category in reversed(new_categories[1:]):
+                new_category.category.total_courses += new_category.total_courses
+            root = new_categories[0]
+            if parent is None:
+                self.categories.append(root)
+            else:
+                parent.update_course_count(root.total_courses)
+            for course in new_courses:
+                self.index.add_course(course)
+            if self.category_search is not None:
+                self.category_search.add_missing((c.id, c.name) for c in new_categories)
+            if self.course_search is not None:
+                self.course_search.add_missing((c.id, c.name) for c in new_courses)
+            self.save_batch('new', [('category', c) for c in new_categories]
+                            + [('course', c) for c in new_courses])
+            self.notify(self.category_tags(parent) | {'categories', 'categories:all'})
+            return root
+
+    def move_courses(self, courses, category):
+        """Переносит курсы в category: по одному проходу по списку каждой
+        старой категории и одна единица работы. Возвращает число перенесённых"""
+        with self.lock.write():
+            if self.index.get_category(category.id) is not category:
+                raise ValueError(f'Категории {category.id} нет в каталоге')
+            # повторы id в запросе: курс переносится один раз
+            courses = [course for course in {course.id: course for course in courses}.values()
+                       if course.category is not category]
+            by_category = {}
+            for course in courses:
+                by_category.setdefault(course.category.id, []).append(course)
+            category.courses
+            for category_courses in by_category.values():
+                category_courses[0].category.courses
+            tags = self.category_tags(category)
+            for category_courses in by_category.values():
+                old_category = category_courses[0].category
+                old_category.remove_courses(category_courses)
+                tags |= self.category_tags(old_category)
+            for course in courses:
+                course.category = category
+            category.add_courses(courses)
+            self.save_batch('dirty', [('course', course) for course in courses])
+            self.notify(tags | {f'course:{course.id}' for course in courses})
+            return len(courses)
+
+    def remove_course(self, course):
+        with self.lock.write():
+            course.category.remove_course(course)
+            self.index.remove_course(course)
+            self.removed_course_ids.add(course.id)
+            self.update_search(self.course_search, course.id, old_name=course.name)
+            self.save('removed', 'course', course)
+            self.notify(self.category_tags(course.category) | {f'course:{course.id}'})
+
     @staticmethod
-    def create_course(type_, addr, name, category):
-        return CourseFactory.create(type_, addr, name, category)
+    def category_tags(category):
+        """Теги страниц, на которых видно число курсов категории и её предков"""
+        tags = {'categories'}
+        while category:
+            tags.add(f'category:{category.id}')
+            category = category.category
+        return tags
+
+    def check_course_counts(self):
+        """Сверяет сохранённые счётчики курсов с полным пересчётом.
+        Возвращает список (категория, сохранено, на самом деле) для расхождений"""
+        errors = []
+        with self.lock.read():
+            for category in self.index.categories.values():
+                actual = category.recount()
+                if category.total_courses != actual:
+                    errors.append((category, category.total_courses, actual))
+        return errors
 
     def get_course(self, name):
-        for item in self.courses:
-            if item.name == name:
-                return item
-        return None
+        if self.storage is None:
+            return self.index.get_course_by_name(name)
+        # в памяти могут быть не все курсы - ищем в базе после записи изменений
+        self.storage.flush()
+        row = self.storage.courses.find_by_name(self.storage.db, name)
+        if row is None:
+            return None
+        with self.load_lock:
+            return self.restore_course(row)
 
     @staticmethod
     def decode_value(val):
-        val_b = bytes(val.replace('%', '=').replace("+", " "), 'UTF-8')
-        val_decode_str = decodestring(val_b)
-        return val_decode_str.decode('UTF-8')
+        # данные форм фреймворк уже раскодирует при разборе запроса
+        return decode_value(val)
 
 
 class SingletonByName(type):
@@ -202,26 +732,68 @@ class SingletonByName(type):
     def __init__(cls, name, bases, attrs, **kwargs):
         super().__init__(name, bases, attrs)
         cls.__instance = {}
+        cls.__lock = Lock()
 
     def __call__(cls, *args, **kwargs):
-        if args:
-            name = args[0]
-        if kwargs:
-            name = kwargs['name']
+        name = args[0] if args else kwargs['name']
 
         if name in cls.__instance:
             return cls.__instance[name]
-        else:
-            cls.__instance[name] = super().__call__(*args, **kwargs)
+        with cls.__lock:
+            if name not in cls.__instance:
+                cls.__instance[name] = super().__call__(*args, **kwargs)
             return cls.__instance[name]
 
 
 class Logger(metaclass=SingletonByName):
-    """Логгер"""
-
-    def __init__(self, name):
+    """Логгер: записи в виде JSON-строк пишет фоновый поток (LogQueue).
+    Проверка уровня и выборки - первое, что делает log, поэтому
+    отключённые вызовы почти ничего не стоят"""
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
+    ERROR = 40
+    LEVEL_NAMES = {DEBUG: 'debug', INFO: 'info', WARNING: 'warning', ERROR: 'error'}
+
+    def __init__(self, name, level=INFO, writers=None, sample_rate=1.0):
         self.name = name
-
-    @staticmethod
-    def log(text):
-        print('log--->', text)
+        self.level = level
+        # стратегии записи - свои у каждого логгера
+        self.writers = writers if writers is not None else [ConsoleWriter()]
+        # доля записей, которые попадут в лог (1.0 - все)
+        self.sample_rate = sample_rate
+
+    def is_enabled(self, level):
+        return level >= self.level
+
+    def log(self, text, level=INFO, **fields):
+        if level < self.level:
+            return
+        if self.sample_rate < 1.0 and random() >= self.sample_rate:
+            return
+        record = {'time': time(), 'logger': self.name,
+                  'level': self.LEVEL_NAMES.get(level, level), 'message': text}
+        if fields:
+            record.update(fields)
+        for writer in self.writers:
+            log_queue.put(writer, record)
+
+    def debug(self, text, **fields):
+        self.log(text, self.DEBUG, **fields)
+
+    def info(self, text, **fields):
+        self.log(text, self.INFO, **fields)
+
+    def warning(self, text, **fields):
+        self.log(text, self.WARNING, **fields)
+
+    def error(self, text, **fields):
+        self.log(text, self.ERROR, **fields)
+
+    def configure(self, level=None, writers=None, sample_rate=None):
+        if level is not None:
+            self.level = level
+        if writers is not None:
+            self.writers = writers
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
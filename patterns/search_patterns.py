@@ -0,0 +1,319 @@
+from array import array
+from bisect import bisect_left, insort
+from heapq import merge
+from itertools import islice
+from math import isqrt
+from threading import Event, Lock
+import re
+import unicodedata
+from patterns.concurrency_patterns import process_hooks
+import pumba_framework.search_settings as settings
+
+# слово - буквы и цифры любого алфавита; '_' разделяет слова
+TOKEN_RE = re.compile(r'[^\W_]+')
+ID_MASK = (1 << 32) - 1
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре: 'Курс Python-3' -> ['курс', 'python', '3']"""
+    text = unicodedata.normalize('NFKC', text).casefold().replace('ё', 'е')
+    return TOKEN_RE.findall(text)
+
+
+class SearchIndex:
+    """Инвертированный индекс по названиям: слово -> отсортированный массив
+    ключей документов. Ключ упаковывает ранг в старшие биты: меньше слов,
+    затем короче название, затем меньший id. Поэтому страница результатов
+    набирается с начала массивов без сортировки всех совпадений.
+    Последнее слово запроса, как и остальные, ищется и по префиксу -
+    для автодополнения; точные совпадения идут раньше префиксных.
+
+    Слова документов индекс не хранит - ключ и слова вычисляются из названия,
+    поэтому изменение и удаление получают прежнее название. Слово одного
+    документа хранит вместо массива сам ключ. Добавления и удаления копятся
+    по слову в небольших отсортированных списке и множестве и вливаются
+    в массив одним проходом, когда их набирается больше
+    max(SEARCH_MERGE_SIZE, корень из длины массива)"""
+
+    def __init__(self):
+        # слово -> ключ (один документ) или array('q') ключей по возрастанию
+        self.postings = {}
+        # слово -> отсортированный список ключей, ещё не влитых в массив
+        self.added = {}
+        # слово -> множество ключей, удалённых из массива
+        self.deleted = {}
+        # отсортированный словарь - для поиска по префиксу - и новые слова,
+        # ещё не влитые в него
+        self.terms = []
+        self.new_terms = []
+        # по байту на id: 1 - документ есть в индексе
+        self.present = bytearray()
+        self.count = 0
+        self.lock = Lock()
+        # выставляется, когда в индекс загружены все документы хранилища
+        self.ready = Event()
+        self.ready.set()
+        process_hooks.add(self)
+
+    def after_fork(self):
+        # блокировку мог держать поток родителя, которого в воркере нет
+        self.lock = Lock()
+
+    @staticmethod
+    def make_document(id, name):
+        """(ключ, неповторяющиеся слова) документа"""
+        tokens = tokenize(name)
+        key = min(len(tokens), 0xFFFF) << 48 | min(len(name), 0xFFFF) << 32 | id
+        return key, dict.fromkeys(tokens)
+
+    @staticmethod
+    def merge_size(size):
+        return max(settings.SEARCH_MERGE_SIZE, isqrt(size))
+
+    def __contains__(self, id):
+        return id < len(self.present) and self.present[id]
+
+    def mark(self, id, present):
+        if id >= len(self.present):
+            self.present.extend(bytes(id + 1 - len(self.present)))
+        self.count += present - self.present[id]
+        self.present[id] = present
+
+    def add(self, id, name, old_name=None):
+        """Добавляет документ; old_name - прежнее название, если документ
+        уже есть в индексе"""
+        with self.lock:
+            if old_name is not None and id in self:
+                self.discard(id, old_name)
+            if id not in self:
+                self.insert(id, name)
+
+    def remove(self, id, name):
+        with self.lock:
+            if id in self:
+                self.discard(id, name)
+
+    def insert(self, id, name):
+        key, tokens = self.make_document(id, name)
+        self.mark(id, 1)
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                self.postings[token] = key
+                self.add_term(token)
+            elif type(postings) is int:
+                self.postings[token] = array('q', sorted((postings, key)))
+            else:
+                deleted = self.deleted.get(token)
+                if deleted and key in deleted:
+                    deleted.discard(key)
+                    continue
+                added = self.added.setdefault(token, [])
+                insort(added, key)
+                if len(added) > self.merge_size(len(postings)):
+                    self.compact(token)
+
+    def discard(self, id, name):
+        key, tokens = self.make_document(id, name)
+        self.mark(id, 0)
+        for token in tokens:
+            postings = self.postings[token]
+            if type(postings) is int:
+                del self.postings[token]
+                self.remove_term(token)
+                continue
+            added = self.added.get(token)
+            position = bisect_left(added, key) if added else 0
+            if added and position < len(added) and added[position] == key:
+                del added[position]
+            else:
+                deleted = self.deleted.setdefault(token, set())
+                deleted.add(key)
+                if len(deleted) > self.merge_size(len(postings)):
+                    self.compact(token)
+            if not self.size(token):
+                del self.postings[token]
+                self.added.pop(token, None)
+                self.deleted.pop(token, None)
+                self.remove_term(token)
+
+    def compact(self, token):
+        """Вливает в массив слова накопленные добавления и удаления:
+        массив копируется срезами между их позициями"""
+        postings = self.postings[token]
+        changes = [(key, True) for key in self.added.pop(token, ())]
+        changes += [(key, False) for key in self.deleted.pop(token, ())]
+        changes.sort()
+        result = array('q')
+        start = 0
+        for key, added in changes:
+            position = bisect_left(postings, key, start)
+            result += postings[start:position]
+            if added:
+                result.append(key)
+                start = position
+            else:
+                start = position + 1
+        result += postings[start:]
+        self.postings[token] = result
+
+    def size(self, token):
+        """Число документов со словом"""
+        postings = self.postings[token]
+        if type(postings) is int:
+            return 1
+        return (len(postings) + len(self.added.get(token, ()))
+                - len(self.deleted.get(token, ())))
+
+    def add_term(self, token):
+        insort(self.new_terms, token)
+        if len(self.new_terms) > self.merge_size(len(self.terms)):
+            # два отсортированных отрезка сливаются за один проход
+            self.terms.extend(self.new_terms)
+            self.terms.sort()
+            self.new_terms = []
+
+    def remove_term(self, token):
+        for terms in (self.new_terms, self.terms):
+            position = bisect_left(terms, token)
+            if position < len(terms) and terms[position] == token:
+                del terms[position]
+                return
+
+    @classmethod
+    def prepare(cls, rows):
+        """Документы (id, ключ, слова) по строкам (id, название) - для add_documents.
+        Разбор названий не меняет индекс: неверная строка падает до изменений"""
+        return [(id, *cls.make_document(id, name)) for id, name in rows]
+
+    def add_missing(self, rows, skip_ids=()):
+        """Массовое добавление (id, название) при построении индекса: документы,
+        которые уже есть в индексе или удалены, пропускаются"""
+        self.add_documents(self.prepare(rows), skip_ids)
+
+    def add_documents(self, documents, skip_ids=()):
+        """Массовое добавление подготовленных prepare документов.
+        Ключи пачки сливаются с массивами одной сортировкой на слово"""
+        new_keys = {}
+        with self.lock:
+            for id, key, tokens in documents:
+                if id in self or id in skip_ids:
+                    continue
+                self.mark(id, 1)
+                for token in tokens:
+                    new_keys.setdefault(token, []).append(key)
+            new_terms = []
+            for token, keys in new_keys.items():
+                if token in self.postings:
+                    self.compact_with(token, keys)
+                    continue
+                new_terms.append(token)
+                self.postings[token] = keys[0] if len(keys) == 1 else array('q', sorted(keys))
+            if new_terms:
+                self.terms.extend(self.new_terms)
+                self.terms.extend(new_terms)
+                self.terms.sort()
+                self.new_terms = []
+
+    def compact_with(self, token, keys):
+        postings = self.postings[token]
+        if type(postings) is int:
+            keys.append(postings)
+            self.postings[token] = array('q', sorted(keys))
+            return
+        self.added.setdefault(token, []).extend(keys)
+        self.added[token].sort()
+        self.compact(token)
+
+    def expand(self, term):
+        """Слова словаря, начинающиеся с term; точное совпадение - первым"""
+        limit = settings.SEARCH_MAX_PREFIX_TERMS
+        candidates = merge(*(terms[start:start + limit] for terms, start in (
+            (terms, bisect_left(terms, term)) for terms in (self.terms, self.new_terms))))
+        expansions = []
+        for token in islice(candidates, limit):
+            if not token.startswith(term):
+                break
+            expansions.append(token)
+        return expansions
+
+    def keys(self, token):
+        """Ключи документов со словом по возрастанию"""
+        postings = self.postings[token]
+        if type(postings) is int:
+            return (postings,)
+        added = self.added.get(token)
+        deleted = self.deleted.get(token)
+        keys = merge(postings, added) if added else postings
+        if deleted:
+            keys = (key for key in keys if key not in deleted)
+        return keys
+
+    def contains(self, token):
+        """Проверка ключа документа среди ключей слова"""
+        postings = self.postings[token]
+        if type(postings) is int:
+            return postings.__eq__
+        added = self.added.get(token)
+        deleted = self.deleted.get(token)
+        size = len(postings)
+
+        def contains(key):
+            position = bisect_left(postings, key)
+            if position < size and postings[position] == key:
+                return not deleted or key not in deleted
+            if added:
+                position = bisect_left(added, key)
+                return position < len(added) and added[position] == key
+            return False
+        return contains
+
+    def check(self, tokens):
+        """Проверка, что документ содержит одно из слов tokens"""
+        if len(tokens) == 1:
+            return self.contains(tokens[0])
+        checks = [self.contains(token) for token in tokens]
+        return lambda key: any(contains(key) for contains in checks)
+
+    def matches(self, term, expansions):
+        """Ключи документов со словом term: сначала точные, затем по префиксу"""
+        if expansions[0] == term:
+            yield from self.keys(term)
+            expansions = expansions[1:]
+        if expansions:
+            yield from merge(*(self.keys(token) for token in expansions))
+
+    def search(self, query, offset=0, limit=20):
+        """Возвращает (id документов страницы, есть ли следующая страница)"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], False
+        with self.lock:
+            expansions = [self.expand(term) for term in terms]
+            if not all(expansions):
+                return [], False
+            # обходим самое редкое слово, остальные проверяем по массивам слов
+            sizes = [sum(self.size(token) for token in tokens) for tokens in expansions]
+            driving = sizes.index(min(sizes))
+            checks = [self.check(tokens) for i, tokens in enumerate(expansions) if i != driving]
+            # документ попадает в несколько продолжений префикса только однажды
+            seen = set() if len(expansions[driving]) > 1 else None
+            ids = []
+            for key in self.matches(terms[driving], expansions[driving]):
+                id = key & ID_MASK
+                if seen is not None:
+                    if id in seen:
+                        continue
+                    seen.add(id)
+                if checks and not all(check(key) for check in checks):
+                    continue
+                if offset:
+                    offset -= 1
+                    continue
+                ids.append(id)
+                if len(ids) > limit:
+                    break
+        return ids[:limit], len(ids) > limit
+
+    def __len__(self):
+        return self.count
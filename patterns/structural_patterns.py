@@ -1,18 +1,51 @@
-from time import time
+from time import perf_counter
+from patterns.creational_patterns import Logger
+from pumba_framework.metrics import metrics
+from pumba_framework.middleware import Middleware
+from pumba_framework.router import LazyView
 
 routes = {}
+# функции без аргументов, которые Framework вызывает один раз -
+# при прогреве или перед первым запросом
+startup = []
+logger = Logger('debug')
 
 
-def route(url):
-    """Декоратор - структурный паттерн"""
+def route(url, methods=None):
+    """Декоратор - структурный паттерн
+    url может содержать параметры пути: '/courses/<int:id>/'
+    methods - список методов, для которых регистрируется view (по умолчанию все).
+    Экземпляр view создаётся при первом запросе к маршруту"""
     def decorator(cls):
-        routes[url] = cls()
+        view = LazyView(cls)
+        if methods is None:
+            routes[url] = view
+        else:
+            views = routes.get(url)
+            if not isinstance(views, dict):
+                views = {'*': views} if views is not None else {}
+            views.update({method.upper(): view for method in methods})
+            routes[url] = views
         return cls
     return decorator
 
 
+class CatalogSync(Middleware):
+    """Ступень конвейера до кэша ответов: если каталог в хранилище изменил
+    другой процесс, каталог и закэшированные страницы процесса обновляются
+    до ответа (Engine.sync)"""
+
+    def __init__(self, site):
+        self.site = site
+
+    def before(self, request):
+        self.site.sync()
+
+
 class Debug:
-    """Декоратор - структурный паттерн"""
+    """Декоратор - структурный паттерн.
+    Время вызова попадает в метрики (pumba_debug_duration_seconds)
+    и в лог на уровне DEBUG"""
     def __init__(self, name):
         self.name = name
 
@@ -21,9 +54,14 @@ class Debug:
         def timeit(method):
             """Декоратор класса обернул в timeit каждый метод декорируемого класса"""
             def timed(*args, **kw):
-                ts = time()
-                result = method(*args, **kw)
-                print(f'debug --> {self.name} выполнялся {time() - ts:2.2f} ms')
-                return result
+                ts = perf_counter()
+                try:
+                    return method(*args, **kw)
+                finally:
+                    seconds = perf_counter() - ts
+                    metrics.observe_debug(self.name, seconds)
+                    if logger.is_enabled(Logger.DEBUG):
+                        logger.debug(f'{self.name} выполнялся {seconds * 1000:.2f} ms',
+                                     view=self.name, duration_ms=round(seconds * 1000, 3))
             return timed
         return timeit(cls)
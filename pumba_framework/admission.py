@@ -0,0 +1,278 @@
+from fnmatch import fnmatchcase
+from math import ceil
+from threading import Condition, Lock
+from time import monotonic
+from pumba_framework.framework_requests import RequestError
+from pumba_framework.metrics import stage
+from pumba_framework.middleware import Middleware
+import pumba_framework.admission_settings as settings
+
+
+class Rejected(RequestError):
+    """Запрос не допущен - клиенту уходит status и Retry-After"""
+
+    def __init__(self, retry_after):
+        super().__init__(self.status)
+        self.headers = [('Retry-After', str(max(1, ceil(retry_after))))]
+
+
+class TooManyRequests(Rejected):
+    status = '429 Too Many Requests'
+
+
+class ServiceUnavailable(Rejected):
+    status = '503 Service Unavailable'
+
+
+class TokenBucket:
+    """Маркерная корзина: rate маркеров в секунду, не больше capacity.
+    Блокировку держит вызывающий"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """0 - маркер взят, иначе через сколько секунд появится следующий"""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class ClientRateLimit(Middleware):
+    """Частота запросов одного клиента ко всем маршрутам"""
+
+    def __init__(self, rate, burst, count, key=None, max_clients=None, trusted_proxies=None):
+        self.rate = rate
+        self.burst = burst
+        self.count = count
+        self.key = key if key is not None else settings.CLIENT_KEY
+        self.trusted_proxies = max(1, trusted_proxies if trusted_proxies is not None
+                                   else settings.TRUSTED_PROXIES)
+        self.max_clients = max_clients if max_clients is not None else settings.MAX_CLIENTS
+        self.buckets = {}
+        self.lock = Lock()
+
+    def client(self, environ):
+        # прокси дописывают адреса в X-Forwarded-For справа: адрес от самого
+        # внешнего своего прокси подделать нельзя, всё левее - прислал клиент
+        addresses = environ.get(self.key, '').split(',')
+        return addresses[-min(self.trusted_proxies, len(addresses))].strip()
+
+    def before(self, request):
+        client = self.client(request.environ)
+        now = monotonic()
+        with self.lock:
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                if len(self.buckets) >= self.max_clients:
+                    self.forget(now)
+                bucket = self.buckets[client] = TokenBucket(self.rate, self.burst, now)
+            wait = bucket.take(now)
+        if wait:
+            self.count('*', 'client_rate')
+            raise TooManyRequests(wait)
+
+    def forget(self, now):
+        """Убирает клиентов с полным запасом: новая корзина для них такая же"""
+        for client, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[client]
+        if len(self.buckets) >= self.max_clients:
+            self.buckets.clear()
+
+
+class RouteRateLimit(Middleware):
+    """Частота запросов к одному маршруту от всех клиентов"""
+
+    def __init__(self, url, rate, burst, count):
+        self.url = url
+        self.routes = (url,)
+        self.count = count
+        self.bucket = TokenBucket(rate, burst, monotonic())
+        self.lock = Lock()
+
+    def before(self, request):
+        with self.lock:
+            wait = self.bucket.take(monotonic())
+        if wait:
+            self.count(self.url, 'route_rate')
+            raise TooManyRequests(wait)
+
+
+class ConcurrencyLimit:
+    """Не больше limit одновременных view маршрута, остальные ждут в очереди.
+    Не дождавшийся за queue_timeout получает 503, и следующие queue_timeout
+    секунд новые запросы без свободного места отклоняются сразу, а не ждут:
+    очередь не растёт, когда цель по задержке уже не выполняется"""
+
+    def __init__(self, url, limit, count, queue_size=None, queue_timeout=None,
+                 retry_after=None):
+        self.url = url
+        self.limit = limit
+        self.count = count
+        self.queue_size = queue_size if queue_size is not None else settings.QUEUE_SIZE
+        self.queue_timeout = (queue_timeout if queue_timeout is not None
+                              else settings.QUEUE_TIMEOUT)
+        self.retry_after = retry_after if retry_after is not None else settings.RETRY_AFTER
+        self.condition = Condition()
+        self.active = 0
+        self.queued = 0
+        self.shed_until = 0.0
+
+    def acquire(self, timeout=None):
+        """Занимает место; timeout - сколько ждать в очереди (0 - не ждать,
+        по умолчанию queue_timeout)"""
+        if timeout is None:
+            timeout = self.queue_timeout
+        with self.condition:
+            # свободное место достаётся первым в очереди, а не новому запросу
+            if self.active < self.limit and not self.queued:
+                self.active += 1
+                return
+            now = monotonic()
+            if self.queued >= self.queue_size:
+                self.reject('queue_full')
+            if timeout <= 0 or now < self.shed_until:
+                self.reject('overloaded')
+            deadline = now + timeout
+            self.queued += 1
+            try:
+                with stage('queue'):
+                    while self.active >= self.limit:
+                        remaining = deadline - monotonic()
+                        if remaining <= 0:
+                            self.shed_until = monotonic() + self.queue_timeout
+                            self.reject('queue_timeout')
+                        self.condition.wait(remaining)
+            finally:
+                self.queued -= 1
+            self.active += 1
+
+    def try_acquire(self):
+        """Занимает свободное место без ожидания и без отказа; False - места нет"""
+        with self.condition:
+            if self.active < self.limit and not self.queued:
+                self.active += 1
+                return True
+            return False
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def reject(self, reason):
+        self.count(self.url, reason)
+        raise ServiceUnavailable(self.retry_after)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class NoLimit:
+    """Маршрут без ограничения параллельности"""
+
+    def acquire(self, timeout=None):
+        pass
+
+    def try_acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NO_LIMIT = NoLimit()
+
+
+class AdmissionControl:
+    """Допуск запросов по admission_settings: частота для клиента и маршрута
+    (маркерные корзины, ответ 429) проверяется ступенями конвейера до кэша
+    ответов; параллельность view маршрута с очередью и сбросом нагрузки
+    (ответ 503) - вокруг вызова view, ответы из кэша её не занимают.
+    Ограничения собираются для маршрутов один раз, в compose"""
+
+    def __init__(self, enabled=None, client_rate=None, route_rates=None,
+                 route_concurrency=None):
+        self.enabled = enabled if enabled is not None else settings.ADMISSION_ENABLED
+        self.client_rate = client_rate if client_rate is not None else settings.CLIENT_RATE
+        self.route_rates = route_rates if route_rates is not None else settings.ROUTE_RATES
+        self.route_concurrency = (route_concurrency if route_concurrency is not None
+                                  else settings.ROUTE_CONCURRENCY)
+        self.lock = Lock()
+        # (маршрут, причина) -> число отклонённых запросов
+        self.rejected = {}
+        # адрес маршрута -> ConcurrencyLimit
+        self.limits = {}
+
+    def compose(self, urls):
+        """Ступени конвейера для ограничения частоты; ограничители
+        параллельности для маршрутов urls"""
+        stages = []
+        if not self.enabled:
+            return stages
+        if self.client_rate is not None:
+            stages.append(ClientRateLimit(*self.client_rate, self.count))
+        for url in urls:
+            rate = self.match(self.route_rates, url)
+            if rate is not None:
+                stages.append(RouteRateLimit(url, *rate, self.count))
+            limit = self.match(self.route_concurrency, url)
+            if limit is not None:
+                self.limits[url] = ConcurrencyLimit(url, limit, self.count)
+        return stages
+
+    @staticmethod
+    def match(patterns, url):
+        for pattern, value in patterns.items():
+            if fnmatchcase(url, pattern):
+                return value
+        return None
+
+    def slot(self, url):
+        """Место для view маршрута url: контекстный менеджер или acquire/release.
+        Ответ по частям держит место, пока сервер не закроет тело"""
+        return self.limits.get(url, NO_LIMIT)
+
+    def count(self, route, reason):
+        key = (route, reason)
+        with self.lock:
+            self.rejected[key] = self.rejected.get(key, 0) + 1
+
+    def render(self, metrics):
+        """Счётчики и очереди в текстовом формате Prometheus"""
+        lines = []
+        with self.lock:
+            metrics.format_counters(lines, 'pumba_admission_rejected_total',
+                                    'Запросы, не допущенные к view', self.rejected,
+                                    ('route', 'reason'))
+        for name, help_text, attribute in (
+                ('pumba_admission_active', 'Выполняемые view маршрута', 'active'),
+                ('pumba_admission_queued', 'Запросы в очереди маршрута', 'queued')):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for url, limit in sorted(self.limits.items()):
+                lines.append(f'{name}{metrics.format_labels(route=url)} '
+                             f'{getattr(limit, attribute)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,34 @@
+# Настройки допуска запросов: ограничение частоты и сброс нагрузки.
+# В режиме pre-fork у каждого воркера свои ограничения
+ADMISSION_ENABLED = True
+# частота запросов одного клиента: (запросов в секунду, запас на всплеск);
+# None - без ограничения. Превышение - 429 и Retry-After
+CLIENT_RATE = None
+# ключ клиента из environ; за обратным прокси - 'HTTP_X_FORWARDED_FOR'
+CLIENT_KEY = 'REMOTE_ADDR'
+# сколько своих прокси дописывают адрес в X-Forwarded-For: клиентом считается
+# адрес, добавленный самым внешним из них (TRUSTED_PROXIES-й справа);
+# адреса левее него клиент может подставить сам
+TRUSTED_PROXIES = 1
+# сколько клиентов помнить: при переполнении забываются те, у кого запас полон
+MAX_CLIENTS = 10000
+# частота запросов к маршруту от всех клиентов: {шаблон адреса: (в секунду, запас)},
+# шаблоны как в @route, с * и ?; у каждого подходящего маршрута свой запас.
+# Например {'/create-course/': (50, 100)}
+ROUTE_RATES = {}
+# одновременно выполняемых view маршрута: {шаблон адреса: число}.
+# Остальные ждут в очереди маршрута
+ROUTE_CONCURRENCY = {
+    '/create-course/': 4,
+    '/edit-course/': 4,
+    '/create-courses/': 2,
+    '/copy-category/': 2,
+}
+# длина очереди маршрута; больше - сразу 503
+QUEUE_SIZE = 32
+# цель по времени ожидания в очереди (секунды): кто не дождался - 503,
+# и следующие QUEUE_TIMEOUT секунд новые запросы не встают в очередь,
+# а получают 503 сразу, если свободного места нет
+QUEUE_TIMEOUT = 0.5
+# Retry-After в ответе 503 (секунды)
+RETRY_AFTER = 1
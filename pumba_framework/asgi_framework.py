@@ -0,0 +1,319 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from inspect import iscoroutinefunction
+from io import BytesIO
+import asyncio
+from pumba_framework.framework_requests import Request, RequestEntityTooLarge, RequestError
+from pumba_framework.main import Framework
+from pumba_framework.metrics import stage
+import pumba_framework.admission_settings as admission_settings
+import pumba_framework.metrics_settings as metrics_settings
+import pumba_framework.request_settings as request_settings
+
+
+class AsgiFramework(Framework):
+    """ASGI-application - те же маршруты и front controller, что у Framework.
+    Асинхронные view (async def __call__) выполняются в цикле событий,
+    синхронные - в ограниченном пуле потоков."""
+
+    def __init__(self, routes_obj, fronts_obj, max_workers=8, startup_obj=None):
+        super().__init__(routes_obj, fronts_obj, startup_obj=startup_obj)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='pumba-view')
+        # потоки, ждущие места в очереди маршрута: ожидание не занимает пул view.
+        # Больше QUEUE_SIZE запросов маршрута в очереди не стоит
+        self.queue_executor = ThreadPoolExecutor(
+            max_workers=admission_settings.QUEUE_SIZE * max(
+                1, len(admission_settings.ROUTE_CONCURRENCY)),
+            thread_name_prefix='pumba-queue')
+        self.async_views = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise Exception(f'Тип соединения {scope["type"]} не поддерживается')
+
+        if not metrics_settings.METRICS_ENABLED:
+            return await self.handle_http(scope, receive, send)
+        timer = self.metrics.start_request(scope['path'])
+
+        async def timed_send(message):
+            if message['type'] == 'http.response.start':
+                timer.status = str(message['status'])
+            elif message['type'] == 'http.response.body':
+                timer.bytes += len(message.get('body', b''))
+            await send(message)
+
+        error = True
+        try:
+            await self.handle_http(scope, receive, timed_send)
+            error = False
+        finally:
+            self.metrics.finish_request(timer, error)
+
+    async def acquire_slot(self, limit):
+        """Место для синхронной view занимается до отправки в пул потоков:
+        свободное - сразу, иначе очередь маршрута ждёт поток queue_executor"""
+        if limit.try_acquire():
+            return
+        future = self.queue_executor.submit(limit.acquire)
+        try:
+            await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if not future.cancel():
+                # место достанется уже отменённому запросу - сразу освобождаем
+                future.add_done_callback(
+                    lambda future: future.exception() is None and limit.release())
+            raise
+
+    async def run_in_pool(self, func, *args):
+        """func в пуле потоков; контекст копируется, чтобы render и fronts
+        в потоке видели замер текущего запроса"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, copy_context().run, func, *args)
+
+    async def handle_http(self, scope, receive, send):
+        if not self.started:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.startup)
+        try:
+            body = await self.read_body(scope, receive)
+        except RequestEntityTooLarge as e:
+            response = self.error_result(e)
+            return await self.send_response(send, *self.finish_response(
+                {'REQUEST_METHOD': scope['method']}, response.status,
+                [('Content-Type', 'text/plain; charset=utf-8'), *response.headers],
+                self.encode(response.body)))
+        environ = self.scope_to_environ(scope, body)
+        path = self.get_path(environ)
+        method = environ['REQUEST_METHOD']
+
+        # отработка паттерна page controller
+        with stage('resolution'):
+            route_url, view, path_params = self.get_route(path, method)
+        self.set_route(view)
+        if view is None:
+            return await self.send_static(environ, send, self.get_static_path(path))
+
+        pipeline = self.pipelines.get(route_url, self.default_pipeline)
+        request = Request(environ, pipeline.fronts, path_params)
+
+        # ступени конвейера выполняются в цикле событий - они должны быть быстрыми
+        response = None
+        if pipeline.before is not None:
+            response = self.run_before(pipeline, view, path, request)
+
+        cache_key = generation = release = None
+        if response is None:
+            if self.cache.is_cacheable(view, method):
+                cache_key = self.cache.make_key(path, environ.get('QUERY_STRING', ''))
+                entry = self.cache.get(cache_key)
+                if entry is not None:
+                    if self.cache.not_modified(environ, entry):
+                        return await self.send_response(
+                            send, *self.get_cached_response(environ, entry))
+                    return await self.send_response(send, *await self.finish(
+                        environ, entry.status, entry.headers, entry.body, entry.variants))
+                generation = self.cache.generation
+
+            # запуск контроллера с передачей объекта request
+            limit = self.admission.slot(route_url)
+            held = False
+            try:
+                try:
+                    with stage('view'):
+                        if self.is_async_view(view):
+                            # цикл событий не ждёт места в очереди: его нет - сразу 503
+                            limit.acquire(0)
+                            held = True
+                            result = await view(request)
+                        else:
+                            # в пул уходит только view, у которой уже есть место:
+                            # очередь маршрута не занимает потоки других маршрутов
+                            await self.acquire_slot(limit)
+                            held = True
+                            future = self.executor.submit(copy_context().run, view, request)
+                            try:
+                                result = await asyncio.wrap_future(future)
+                            except asyncio.CancelledError:
+                                if not future.cancel():
+                                    # view ещё выполняется в потоке - место
+                                    # освободится, когда она закончит
+                                    future.add_done_callback(lambda future: limit.release())
+                                    held = False
+                                raise
+                except RequestError as e:
+                    result = self.error_result(e)
+                response = self.prepare_response(view, path, result)
+                if pipeline.after is not None:
+                    response = self.run_after(pipeline, request, response)
+                if held and self.is_streamed(response):
+                    # шаблон рендерится при отправке - место освободит закрытие тела
+                    release, held = limit.release, False
+            finally:
+                if held:
+                    limit.release()
+        if self.is_streamed(response):
+            return await self.send_streamed(environ, send, response,
+                                            request, view, cache_key, generation, release)
+        code, headers, body = response.status, response.headers, self.encode(response.body)
+        variants = None
+        if cache_key is not None and code.startswith('200'):
+            entry = self.cache.store(cache_key, code, headers, body,
+                                     view.cache_tags(request), generation)
+            headers, variants = entry.headers, entry.variants
+        await self.send_response(send, *await self.finish(environ, code, headers,
+                                                          body, variants))
+
+    async def finish(self, environ, status, headers, body, variants=None):
+        """finish_response; тело, которое нужно сжать, сжимается в пуле потоков,
+        чтобы не задерживать цикл событий"""
+        coding = (self.compressor.negotiate(environ)
+                  if self.compressor.is_compressible(status, headers) else None)
+        if (coding is not None and len(body) >= self.compressor.min_size
+                and (variants is None or coding not in variants)):
+            return await self.run_in_pool(self.finish_response, environ, status, headers,
+                                          body, variants)
+        return self.finish_response(environ, status, headers, body, variants)
+
+    async def send_streamed(self, environ, send, response,
+                            request, view, cache_key, generation, release=None):
+        """Куски шаблона рендерятся и сжимаются в пуле потоков
+        и отправляются по мере готовности"""
+        code, headers, compressor = self.prepare_stream(environ, response)
+        body = self.make_streamed_body(environ, response, code, compressor,
+                                       request, view, cache_key, generation, release)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            # шаблон не рендерится - итератор закрывается без обхода
+            body.close()
+            await self.send_start(send, code, headers)
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        loop = asyncio.get_running_loop()
+        context = copy_context()
+        iterator = iter(body)
+        await self.send_start(send, code, headers)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, context.run,
+                                                   next, iterator, None)
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            try:
+                try:
+                    iterator.close()
+                finally:
+                    body.close()
+            except ValueError:
+                # задачу отменили, пока кусок ещё рендерится в потоке
+                pass
+
+    def is_async_view(self, view):
+        result = self.async_views.get(id(view))
+        if result is None:
+            result = iscoroutinefunction(view) or iscoroutinefunction(
+                getattr(view, '__call__', None))
+            self.async_views[id(view)] = result
+        return result
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.startup)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                self.queue_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def read_body(scope, receive):
+        """Тело запроса; больше REQUEST_MAX_BODY_SIZE - RequestEntityTooLarge
+        по Content-Length или как только прочитано больше"""
+        limit = request_settings.REQUEST_MAX_BODY_SIZE
+        for name, value in scope.get('headers', []):
+            if name.lower() == b'content-length' and value.isdigit() and int(value) > limit:
+                raise RequestEntityTooLarge('Слишком большое тело запроса')
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > limit:
+                raise RequestEntityTooLarge('Слишком большое тело запроса')
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    def scope_to_environ(scope, body):
+        """Переводит ASGI scope в словарь в формате WSGI environ,
+        чтобы разбор запроса и статика работали так же, как в Framework"""
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'CONTENT_LENGTH': str(len(body)),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'wsgi.input': BytesIO(body),
+        }
+        client = scope.get('client')
+        if client:
+            environ['REMOTE_ADDR'] = client[0]
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_LENGTH':
+                continue
+            key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    async def send_static(self, environ, send, file_path):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+
+        # stat, проверка кэша и чтение небольших файлов - в пуле потоков
+        chunks = await self.run_in_pool(self.static_files, environ, start_response, file_path)
+        if isinstance(chunks, list):
+            return await self.send_response(send, response['status'],
+                                            response['headers'], chunks)
+        # большой файл читаем с диска кусками в пуле потоков
+        loop = asyncio.get_running_loop()
+        iterator = iter(chunks)
+        await self.send_start(send, response['status'], response['headers'])
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    @staticmethod
+    async def send_start(send, status, headers):
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers],
+        })
+
+    async def send_response(self, send, status, headers, chunks):
+        await self.send_start(send, status, headers)
+        await send({'type': 'http.response.body', 'body': b''.join(chunks)})
@@ -0,0 +1,249 @@
+from email.utils import formatdate
+from http import HTTPStatus
+from urllib.parse import unquote
+import asyncio
+import traceback
+
+
+class BadRequest(Exception):
+    """Запрос, который сервер не может разобрать"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class AsgiServer:
+    """Встроенный HTTP/1.1 сервер на asyncio для ASGI-application.
+    Поддерживает keep-alive, поэтому держит тысячи простаивающих соединений
+    в одном потоке."""
+
+    def __init__(self, app, host='', port=8001, keep_alive_timeout=75,
+                 max_header_size=64 * 1024, max_body_size=10 * 1024 * 1024,
+                 backlog=1024):
+        self.app = app
+        self.host = host or None
+        self.port = port
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.backlog = backlog
+        self.lifespan_queue = None
+
+    async def serve(self, sock=None):
+        await self.startup()
+        if sock is not None:
+            server = await asyncio.start_server(
+                self.handle_connection, sock=sock, limit=self.max_header_size)
+        else:
+            server = await asyncio.start_server(
+                self.handle_connection, self.host, self.port,
+                limit=self.max_header_size, backlog=self.backlog)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.shutdown()
+
+    async def startup(self):
+        """Запускает ASGI lifespan, если приложение его поддерживает"""
+        self.lifespan_queue = asyncio.Queue()
+        started = asyncio.get_running_loop().create_future()
+
+        async def receive():
+            return await self.lifespan_queue.get()
+
+        async def send(message):
+            if not started.done():
+                started.set_result(message)
+
+        async def run():
+            try:
+                await self.app({'type': 'lifespan', 'asgi': {'version': '3.0'}},
+                               receive, send)
+            except Exception:
+                # приложение без lifespan - не ошибка сервера, но причину видно
+                self.log_exception('Ошибка ASGI lifespan', 'warning')
+            if not started.done():
+                started.set_result(None)
+
+        self.lifespan_task = asyncio.create_task(run())
+        await self.lifespan_queue.put({'type': 'lifespan.startup'})
+        await started
+
+    async def shutdown(self):
+        if self.lifespan_queue is None:
+            return
+        await self.lifespan_queue.put({'type': 'lifespan.shutdown'})
+        try:
+            await asyncio.wait_for(self.lifespan_task, 5)
+        except asyncio.TimeoutError:
+            pass
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        sock = writer.get_extra_info('sockname')
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                                                  self.keep_alive_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                        asyncio.LimitOverrunError, ConnectionError):
+                    break
+                try:
+                    scope, keep_alive, content_length = self.parse_head(head, peer, sock)
+                    body = await reader.readexactly(content_length) if content_length else b''
+                except BadRequest as e:
+                    await self.write_error(writer, e.status, str(e))
+                    break
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                keep_alive = await self.run_app(scope, body, writer, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    def parse_head(self, head, peer, sock):
+        lines = head[:-4].decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise BadRequest(400, 'Bad Request')
+        if version not in ('HTTP/1.1', 'HTTP/1.0'):
+            raise BadRequest(505, 'HTTP Version Not Supported')
+        headers = []
+        connection = ''
+        content_length = 0
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise BadRequest(400, 'Bad Request')
+            name = name.strip().lower()
+            value = value.strip()
+            if name == 'content-length':
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    raise BadRequest(400, 'Bad Request')
+                if content_length < 0:
+                    raise BadRequest(400, 'Bad Request')
+            elif name == 'transfer-encoding':
+                raise BadRequest(501, 'Not Implemented')
+            elif name == 'connection':
+                connection = value.lower()
+            headers.append((name.encode('latin-1'), value.encode('latin-1')))
+        if content_length > self.max_body_size:
+            raise BadRequest(413, 'Payload Too Large')
+
+        if version == 'HTTP/1.1':
+            keep_alive = 'close' not in connection
+        else:
+            keep_alive = 'keep-alive' in connection
+        raw_path, _, query_string = target.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': version[5:],
+            'method': method.upper(),
+            'scheme': 'http',
+            'path': unquote(raw_path),
+            'raw_path': raw_path.encode('latin-1'),
+            'query_string': query_string.encode('latin-1'),
+            'root_path': '',
+            'headers': headers,
+            'client': peer[:2] if peer else None,
+            'server': sock[:2] if sock else None,
+        }
+        return scope, keep_alive, content_length
+
+    async def run_app(self, scope, body, writer, keep_alive):
+        """Выполняет приложение для одного запроса.
+        Возвращает True, если соединение можно использовать дальше"""
+        is_head = scope['method'] == 'HEAD'
+        http_11 = scope['http_version'] == '1.1'
+        state = {'started': False, 'chunked': False, 'finished': False,
+                 'status': 200, 'headers': [], 'keep_alive': keep_alive}
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # тело уже прочитано - дальше ждать можно только разрыва соединения
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                state['status'] = message['status']
+                state['headers'] = list(message.get('headers', []))
+                return
+            if message['type'] != 'http.response.body' or state['finished']:
+                return
+            chunk = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if not state['started']:
+                state['started'] = True
+                headers = state['headers']
+                has_length = any(name.lower() == b'content-length' for name, _ in headers)
+                # на HEAD длину тела не знает и приложение - её не пишем
+                if not has_length and not is_head:
+                    if not more_body:
+                        headers.append((b'content-length', str(len(chunk)).encode()))
+                    elif http_11:
+                        state['chunked'] = True
+                        headers.append((b'transfer-encoding', b'chunked'))
+                    else:
+                        # HTTP/1.0 без длины - конец ответа определяется закрытием
+                        state['keep_alive'] = False
+                self.write_head(writer, state['status'], headers, state['keep_alive'])
+            if chunk and not is_head:
+                if state['chunked']:
+                    writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                else:
+                    writer.write(chunk)
+            if not more_body:
+                state['finished'] = True
+                if state['chunked'] and not is_head:
+                    writer.write(b'0\r\n\r\n')
+            await writer.drain()
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            self.log_exception('Ошибка приложения', method=scope['method'], path=scope['path'])
+            if not state['started']:
+                await self.write_error(writer, 500, 'Internal Server Error')
+            return False
+        return state['keep_alive'] and state['finished']
+
+    @staticmethod
+    def log_exception(text, level='error', **fields):
+        # импорт здесь: patterns сам зависит от фреймворка
+        from patterns.creational_patterns import Logger
+        getattr(Logger('server'), level)(text, traceback=traceback.format_exc(), **fields)
+
+    @staticmethod
+    def write_head(writer, status, headers, keep_alive):
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ''
+        lines = [f'HTTP/1.1 {status} {reason}'.encode('latin-1'),
+                 b'date: ' + formatdate(usegmt=True).encode('latin-1'),
+                 b'connection: keep-alive' if keep_alive else b'connection: close']
+        lines += [name + b': ' + value for name, value in headers]
+        writer.write(b'\r\n'.join(lines) + b'\r\n\r\n')
+
+    async def write_error(self, writer, status, message):
+        body = message.encode('utf-8')
+        self.write_head(writer, status,
+                        [(b'content-type', b'text/plain'),
+                         (b'content-length', str(len(body)).encode())], False)
+        writer.write(body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
@@ -0,0 +1,6 @@
+# Настройки кэша ответов
+RESPONSE_CACHE_ENABLED = True
+# бюджет памяти на тела закэшированных ответов (байт)
+RESPONSE_CACHE_MAX_SIZE = 64 * 1024 * 1024
+# максимальное число закэшированных ответов
+RESPONSE_CACHE_MAX_ENTRIES = 10000
@@ -0,0 +1,91 @@
+import gzip
+import zlib
+import pumba_framework.compression_settings as settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(environ):
+    """Кодирования из Accept-Encoding, кроме запрещённых через q=0"""
+    result = set()
+    for item in environ.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+        if params in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        result.add(coding.strip().lower())
+    return result
+
+
+class StreamCompressor:
+    """Сжатие ответа по частям: каждый кусок сбрасывается сразу (sync flush),
+    чтобы клиент мог начать разбор страницы, не дожидаясь конца ответа"""
+
+    def __init__(self, coding, level, quality):
+        self.coding = coding
+        if coding == 'br':
+            self.compressor = brotli.Compressor(quality=quality)
+        else:
+            # wbits 31 - формат gzip, 15 - zlib (HTTP deflate)
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                               31 if coding == 'gzip' else 15)
+
+    def compress(self, data):
+        if self.coding == 'br':
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.coding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+class Compressor:
+    """Сжатие ответов view: кодирование выбирается по Accept-Encoding,
+    сжимаются только текстовые типы не меньше min_size"""
+
+    def __init__(self, encodings=None, min_size=None, content_types=None,
+                 level=None, quality=None):
+        encodings = encodings if encodings is not None else settings.COMPRESS_ENCODINGS
+        self.encodings = [coding for coding in encodings if coding != 'br' or brotli is not None]
+        self.min_size = min_size if min_size is not None else settings.COMPRESS_MIN_SIZE
+        self.content_types = frozenset(content_types if content_types is not None
+                                       else settings.COMPRESS_CONTENT_TYPES)
+        self.level = level if level is not None else settings.COMPRESS_LEVEL
+        self.quality = quality if quality is not None else settings.COMPRESS_BROTLI_QUALITY
+
+    def is_compressible(self, status, headers):
+        """Подходит ли ответ для сжатия по статусу и заголовкам (без учёта размера)"""
+        if not settings.COMPRESS_ENABLED or status.startswith(('204', '304')):
+            return False
+        content_type = None
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                return False
+            if name == 'content-type':
+                content_type = value.split(';', 1)[0].strip().lower()
+        return content_type in self.content_types
+
+    def negotiate(self, environ):
+        accepted = accepted_encodings(environ)
+        if not accepted:
+            return None
+        for coding in self.encodings:
+            if coding in accepted:
+                return coding
+        return None
+
+    def compress(self, body, coding):
+        if coding == 'gzip':
+            return gzip.compress(body, compresslevel=self.level, mtime=0)
+        if coding == 'deflate':
+            return zlib.compress(body, self.level)
+        return brotli.compress(body, quality=self.quality)
+
+    def stream(self, coding):
+        return StreamCompressor(coding, self.level, self.quality)
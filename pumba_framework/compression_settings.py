@@ -0,0 +1,13 @@
+# Настройки сжатия ответов view (статика сжимается заранее, см. static_settings)
+COMPRESS_ENABLED = True
+# кодирования в порядке предпочтения; 'br' - только если установлен brotli
+COMPRESS_ENCODINGS = ('br', 'gzip', 'deflate')
+# ответы меньше этого размера (байт) не сжимаем - выигрыш меньше накладных расходов
+COMPRESS_MIN_SIZE = 1024
+# сжимаемые типы ответа (без параметров вроде charset)
+COMPRESS_CONTENT_TYPES = ('text/html', 'text/plain', 'text/css', 'text/javascript',
+                          'application/javascript', 'application/json', 'image/svg+xml')
+# уровень gzip/deflate (1-9) и качество brotli (0-11): ответы сжимаются на
+# каждый промах кэша, поэтому не максимальные
+COMPRESS_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
@@ -1,11 +1,222 @@
+from binascii import a2b_qp
+from tempfile import SpooledTemporaryFile
+import re
+from pumba_framework.metrics import stage
+import pumba_framework.request_settings as settings
+
+PERCENT_RUN_RE = re.compile(rb'(?:%[0-9A-Fa-f]{2})+')
+HEADER_PARAM_RE = re.compile(r';\s*([\w*-]+)=(?:"((?:[^"\\]|\\.)*)"|([^;\s]*))')
+
+
+class RequestError(Exception):
+    """Запрос нельзя разобрать - отвечаем клиенту status и заголовками headers"""
+    status = '400 Bad Request'
+    headers = ()
+
+
+class RequestEntityTooLarge(RequestError):
+    status = '413 Payload Too Large'
+
+
+def unhex_run(match):
+    return bytes.fromhex(match.group().replace(b'%', b'').decode('ascii'))
+
+
+def decode_value(value):
+    """Раскодирует значение из строки запроса за один проход:
+    '+' - пробел, %XX - байты UTF-8.
+    Строка приходит в latin-1, как QUERY_STRING в WSGI: каждый символ - байт"""
+    if '+' in value:
+        value = value.replace('+', ' ')
+    if '%' not in value and value.isascii():
+        return value
+    try:
+        if '%' not in value:
+            return value.encode('latin-1').decode('utf-8', 'replace')
+        if '=' not in value and value[-1] != '%' and value.isprintable():
+            # без '=', управляющих символов и '%' в конце %XX == =XX
+            # из quoted-printable, а его binascii раскодирует на C
+            raw = a2b_qp(value.replace('%', '=').encode('latin-1'))
+            # '=' в результате - это %3D или неверная последовательность
+            if b'=' not in raw:
+                return raw.decode('utf-8', 'replace')
+        raw = PERCENT_RUN_RE.sub(unhex_run, value.encode('latin-1'))
+        return raw.decode('utf-8', 'replace')
+    except UnicodeEncodeError:
+        # строка уже раскодирована
+        return value
+
+
+def parse_header_params(value):
+    """'form-data; name="a"; filename="b.txt"' -> ('form-data', {'name': 'a', ...})"""
+    main_value, _, rest = value.partition(';')
+    params = {}
+    for match in HEADER_PARAM_RE.finditer(f';{rest}'):
+        quoted = match.group(2)
+        if quoted is not None:
+            params[match.group(1).lower()] = quoted.replace('\\"', '"').replace('\\\\', '\\')
+        else:
+            params[match.group(1).lower()] = match.group(3)
+    return main_value.strip().lower(), params
+
+
+class QueryDict(dict):
+    """Параметры запроса: по ключу - последнее значение, getlist - все значения"""
+
+    def __init__(self):
+        super().__init__()
+        self.lists = {}
+
+    def add(self, key, value):
+        self.lists.setdefault(key, []).append(value)
+        self[key] = value
+
+    def getlist(self, key):
+        return self.lists.get(key, [])
+
+
+class UploadedFile:
+    """Файл из multipart/form-data. Небольшие файлы лежат в памяти,
+    большие - во временном файле на диске"""
+    __slots__ = ('name', 'filename', 'content_type', 'file', 'size')
+
+    def __init__(self, name, filename, content_type, file, size):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.file = file
+        self.size = size
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+
+class MultipartParser:
+    """Потоковый разбор multipart/form-data: тело читается кусками,
+    в памяти держится только текущий кусок"""
+
+    def __init__(self, stream, boundary, content_length):
+        self.stream = stream
+        self.remaining = content_length
+        self.delimiter = b'\r\n--' + boundary
+        self.buffer = b''
+        self.fields_count = 0
+
+    def read_chunk(self):
+        if self.remaining <= 0:
+            return b''
+        chunk = self.stream.read(min(settings.REQUEST_CHUNK_SIZE, self.remaining))
+        if not chunk:
+            self.remaining = 0
+        self.remaining -= len(chunk)
+        return chunk
+
+    def fill(self, size):
+        while len(self.buffer) < size:
+            chunk = self.read_chunk()
+            if not chunk:
+                raise RequestError('Тело multipart оборвалось')
+            self.buffer += chunk
+
+    def parse(self):
+        data = QueryDict()
+        files = QueryDict()
+        # тело начинается с '--boundary', а не с '\r\n--boundary'
+        self.buffer = b'\r\n'
+        self.read_part(None)
+        while True:
+            self.fill(2)
+            if self.buffer.startswith(b'--'):
+                break
+            if not self.buffer.startswith(b'\r\n'):
+                raise RequestError('Неверный разделитель multipart')
+            self.buffer = self.buffer[2:]
+
+            self.fields_count += 1
+            if self.fields_count > settings.REQUEST_MAX_FIELDS:
+                raise RequestError('Слишком много полей')
+            headers = self.read_headers()
+            _, params = parse_header_params(headers.get('content-disposition', ''))
+            name = params.get('name', '')
+            filename = params.get('filename')
+            if filename is None:
+                chunks = []
+                self.read_part(chunks.append)
+                data.add(name, b''.join(chunks).decode('utf-8', errors='replace'))
+            else:
+                file = SpooledTemporaryFile(max_size=settings.REQUEST_FILE_MEMORY_SIZE)
+                size = self.read_part(file.write)
+                file.seek(0)
+                content_type = headers.get('content-type', 'application/octet-stream')
+                files.add(name, UploadedFile(name, filename, content_type, file, size))
+        return data, files
+
+    def read_headers(self):
+        while True:
+            index = self.buffer.find(b'\r\n\r\n')
+            if index >= 0:
+                break
+            if len(self.buffer) > 16 * 1024:
+                raise RequestError('Слишком большие заголовки части multipart')
+            self.fill(len(self.buffer) + 1)
+        head = self.buffer[:index].decode('utf-8', errors='replace')
+        self.buffer = self.buffer[index + 4:]
+        headers = {}
+        for line in head.split('\r\n'):
+            key, _, value = line.partition(':')
+            headers[key.strip().lower()] = value.strip()
+        return headers
+
+    def read_part(self, write):
+        """Передаёт в write содержимое части до следующего разделителя"""
+        size = 0
+        # хвост буфера может оказаться началом разделителя
+        keep = len(self.delimiter) - 1
+        while True:
+            index = self.buffer.find(self.delimiter)
+            if index >= 0:
+                if write is not None:
+                    write(self.buffer[:index])
+                size += index
+                self.buffer = self.buffer[index + len(self.delimiter):]
+                return size
+            if len(self.buffer) > keep:
+                if write is not None:
+                    write(self.buffer[:-keep])
+                size += len(self.buffer) - keep
+                self.buffer = self.buffer[-keep:]
+            chunk = self.read_chunk()
+            if not chunk:
+                raise RequestError('Тело multipart оборвалось')
+            self.buffer += chunk
+
+
 class ReqM:
     @staticmethod
     def parse_input_data(data: str):
-        result = {}
+        result = QueryDict()
         if data:
-            # делим параметры через &, а словарь через =
-            vals = [item.split('=')[:2] for item in data.split('&')]
-            result = {v[0]: v[1] for v in vals}
+            # делим параметры через &, а ключ и значение - по первому =
+            items = data.split('&')
+            if len(items) > settings.REQUEST_MAX_FIELDS:
+                raise RequestError('Слишком много полей')
+            lists = result.lists
+            for item in items:
+                if not item:
+                    continue
+                key, _, value = item.partition('=')
+                if '%' in key or '+' in key or not key.isascii():
+                    key = decode_value(key)
+                if '%' in value or '+' in value or not value.isascii():
+                    value = decode_value(value)
+                if key in lists:
+                    lists[key].append(value)
+                else:
+                    lists[key] = [value]
+                result[key] = value
         return result
 
     @staticmethod
@@ -18,7 +229,7 @@ class GetRequests(ReqM):
     @staticmethod
     def get_request_params(environ):
         # получаем параметры запроса
-        query_string = environ['QUERY_STRING']
+        query_string = environ.get('QUERY_STRING', '')
         # превращаем параметры в словарь
         request_params = GetRequests.parse_input_data(query_string)
         return request_params
@@ -27,25 +238,194 @@ class GetRequests(ReqM):
 # post requests
 class PostRequests(ReqM):
     @staticmethod
-    def get_wsgi_input_data(env) -> bytes:
+    def get_content_length(env):
         # получаем длину тела
         content_length_data = env.get('CONTENT_LENGTH')
-        # приводим к int
-        content_length = int(content_length_data) if content_length_data else 0
-        # print(content_length)
+        try:
+            content_length = int(content_length_data) if content_length_data else 0
+        except ValueError:
+            raise RequestError('Неверный Content-Length')
+        if content_length > settings.REQUEST_MAX_BODY_SIZE:
+            raise RequestEntityTooLarge('Слишком большое тело запроса')
+        return content_length
+
+    @staticmethod
+    def get_wsgi_input_data(env) -> bytes:
+        content_length = PostRequests.get_content_length(env)
         # считываем данные, если они есть
         data = env['wsgi.input'].read(content_length) if content_length > 0 else b''
         return data
 
     def parse_wsgi_input_data(self, data: bytes) -> dict:
-        result = {}
+        result = QueryDict()
         if data:
-            data_str = data.decode(encoding='utf-8')
-            # print(f'Строка после декодирования - {data_str}')
+            data_str = data.decode(encoding='latin-1')
             result = self.parse_input_data(data_str)
         return result
 
     def get_request_params(self, environ):
         # получаем данные и превращаем данные в словарь
+        data, _ = self.get_request_data(environ)
+        return data
+
+    def get_request_data(self, environ):
+        """Возвращает (поля формы, загруженные файлы)"""
+        content_type = environ.get('CONTENT_TYPE', '')
+        if content_type[:19].lower() == 'multipart/form-data':
+            _, params = parse_header_params(content_type)
+            boundary = params.get('boundary')
+            if not boundary:
+                raise RequestError('Нет boundary в multipart/form-data')
+            parser = MultipartParser(environ['wsgi.input'],
+                                     boundary.encode('latin-1'),
+                                     self.get_content_length(environ))
+            return parser.parse()
         data = self.get_wsgi_input_data(environ)
-        return self.parse_wsgi_input_data(data)
+        return self.parse_wsgi_input_data(data), QueryDict()
+
+
+class Request:
+    """Запрос. Параметры, тело, заголовки, cookies и данные от front
+    controller вычисляются при первом обращении и запоминаются.
+    Читается как словарь: request['method'], request['data'],
+    request['request_params'], request['path_params'], request['user']...
+    request['body'] - тело POST как есть (bytes), для тел не из форм.
+    Тело читается один раз: view берёт либо body, либо data"""
+    __slots__ = ('environ', 'method', 'path_params', 'fronts', 'fronts_done',
+                 '_params', '_data', '_files', '_body', '_headers', '_cookies', '_extra')
+
+    # ключи словаря, которые вычисляет сам запрос
+    LAZY_KEYS = {
+        'request_params': 'params',
+        'data': 'data',
+        'files': 'files',
+        'body': 'body',
+        'headers': 'headers',
+        'cookies': 'cookies',
+    }
+
+    def __init__(self, environ, fronts=(), path_params=None):
+        self.environ = environ
+        self.method = environ['REQUEST_METHOD']
+        self.path_params = path_params if path_params is not None else {}
+        self.fronts = fronts
+        self.fronts_done = False
+        self._params = None
+        self._data = None
+        self._files = None
+        self._body = None
+        self._headers = None
+        self._cookies = None
+        # значения от front controller и выставленные view
+        self._extra = None
+
+    @property
+    def params(self):
+        if self._params is None:
+            self._params = GetRequests.get_request_params(self.environ)
+        return self._params
+
+    @property
+    def data(self):
+        if self._data is None:
+            if self.method == 'POST':
+                self._data, self._files = PostRequests().get_request_data(self.environ)
+            else:
+                self._data, self._files = QueryDict(), QueryDict()
+        return self._data
+
+    @property
+    def files(self):
+        if self._files is None:
+            self.data
+        return self._files
+
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = (PostRequests.get_wsgi_input_data(self.environ)
+                          if self.method == 'POST' else b'')
+        return self._body
+
+    @property
+    def headers(self):
+        if self._headers is None:
+            headers = {}
+            for key, value in self.environ.items():
+                if key.startswith('HTTP_'):
+                    headers[key[5:].replace('_', '-').lower()] = value
+                elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+                    headers[key.replace('_', '-').lower()] = value
+            self._headers = headers
+        return self._headers
+
+    @property
+    def cookies(self):
+        if self._cookies is None:
+            cookies = {}
+            for item in self.environ.get('HTTP_COOKIE', '').split(';'):
+                key, sep, value = item.strip().partition('=')
+                if sep:
+                    cookies[key] = decode_value(value.strip('"'))
+            self._cookies = cookies
+        return self._cookies
+
+    @property
+    def extra(self):
+        if not self.fronts_done:
+            self.fronts_done = True
+            # отработка паттерна front controller - только когда
+            # view обратился к значению, которое могут выставить fronts
+            with stage('fronts'):
+                for front in self.fronts:
+                    front(self)
+        if self._extra is None:
+            self._extra = {}
+        return self._extra
+
+    def __getitem__(self, key):
+        if key == 'method':
+            return self.method
+        if key == 'path_params':
+            return self.path_params
+        name = self.LAZY_KEYS.get(key)
+        if name is not None:
+            return getattr(self, name)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key == 'method':
+            self.method = value
+        elif key == 'path_params':
+            self.path_params = value
+        elif key in self.LAZY_KEYS:
+            setattr(self, f'_{self.LAZY_KEYS[key]}', value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return (key in ('method', 'path_params') or key in self.LAZY_KEYS
+                or key in self.extra)
+
+    def keys(self):
+        return ['method', 'path_params', *self.LAZY_KEYS, *self.extra]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __repr__(self):
+        return f'<Request {self.method} {self.environ.get("PATH_INFO", "")}>'
@@ -1,74 +1,394 @@
-from quopri import decodestring
-from pumba_framework.framework_requests import GetRequests, PostRequests
+from threading import Lock
+from time import perf_counter
+from wsgiref.util import setup_testing_defaults
+import gc
+from pumba_framework.framework_requests import Request, RequestError
 from pumba_framework.types_dict import CONTENT_TYPES
+from pumba_framework.static_files import StaticFiles
+from pumba_framework.router import Router
+from pumba_framework.response_cache import response_cache
+from pumba_framework.metrics import MetricsView, current_timer, metrics, stage
+from pumba_framework.middleware import Pipeline
+from pumba_framework.admission import AdmissionControl
+from pumba_framework.profiling import Profiler, ProfilerView
+from pumba_framework.compression import Compressor
+from pumba_framework.response import Response, add_vary
+from pumba_framework.templator import TemplateEngine
+import pumba_framework.metrics_settings as metrics_settings
+import pumba_framework.profiling_settings as profiling_settings
+import pumba_framework.startup_settings as startup_settings
 import pumba_framework.static_settings as static
 from os import path
 
 
-class PageNotFound404:
-    def __call__(self, request):
-        return '404 WHAT', '404 PAGE Not Found'
+class StreamedBody:
+    """Тело ответа view, вернувшего итератор строк (templator.stream):
+    куски кодируются и, если клиент принимает сжатие, сжимаются по мере
+    отправки - ответ целиком в памяти не собирается.
+    Слушатели on_close вызываются, когда сервер закрыл ответ;
+    completed - был ли ответ отправлен до конца"""
+
+    def __init__(self, chunks, collect=False, compressor=None):
+        self.chunks = chunks
+        self.bytes = 0
+        self.completed = False
+        # закодированные несжатые куски для кэша ответов
+        self.collected = [] if collect else None
+        self.compressor = compressor
+        self.on_close = []
 
+    def __iter__(self):
+        for chunk in self.chunks:
+            with stage('encoding'):
+                data = chunk.encode('utf-8')
+            if self.collected is not None:
+                self.collected.append(data)
+            if self.compressor is not None:
+                with stage('compression'):
+                    data = self.compressor.compress(data)
+            self.bytes += len(data)
+            yield data
+        if self.compressor is not None:
+            data = self.compressor.finish()
+            self.bytes += len(data)
+            yield data
+        self.completed = True
 
-class ViewGetStatic:
-    def __init__(self, static_dir, file_path):
-        self.static_dir = static_dir
-        self.file_path = file_path
+    def close(self):
+        try:
+            if hasattr(self.chunks, 'close'):
+                self.chunks.close()
+        finally:
+            for callback in self.on_close:
+                callback(self)
 
+
+class PageNotFound404:
     def __call__(self, request):
-        path_to_file = path.join(self.static_dir, self.file_path)
-        with open(path_to_file, 'rb') as f:
-            file_content = f.read()
-        status_code = '200 OK'
-        return status_code, file_content
+        return '404 WHAT', '404 PAGE Not Found'
 
 
 class Framework:
     """Класс Framework - основа фреймворка"""
 
-    def __init__(self, routes_obj, fronts_obj):
+    def __init__(self, routes_obj, fronts_obj, cache=None, metrics_obj=None, compressor=None,
+                 startup_obj=None, admission=None):
         self.routes_lst = routes_obj
         self.fronts_lst = fronts_obj
+        # вызываются один раз - при прогреве или перед первым запросом
+        self.startup_lst = list(startup_obj or ())
+        self.started = not self.startup_lst
+        self.startup_lock = Lock()
+        self.cache = cache if cache is not None else response_cache
+        self.compressor = compressor if compressor is not None else Compressor()
+        self.metrics = metrics_obj if metrics_obj is not None else metrics
+        self.admission = admission if admission is not None else AdmissionControl()
+        self.router = Router(routes_obj)
+        if metrics_settings.METRICS_ENABLED:
+            self.router.add(metrics_settings.METRICS_URL,
+                            MetricsView(self.metrics, self.admission))
+        # fronts_obj - функции front controller, Front и Middleware:
+        # конвейер каждого маршрута собирается один раз, ограничение частоты - первым
+        urls = self.router.urls()
+        self.pipelines, self.default_pipeline = Pipeline.compose(
+            self.admission.compose(urls) + list(fronts_obj), urls)
+        self.static_files = StaticFiles(static.STATIC_FILES_DIR)
+        if static.STATIC_SCAN_ON_STARTUP:
+            self.static_files.scan()
 
     def __call__(self, environ, start_response):
+        if not metrics_settings.METRICS_ENABLED:
+            return self.handle(environ, start_response)
+        timer = self.metrics.start_request(environ['PATH_INFO'])
+
+        def timed_start_response(status, headers, exc_info=None):
+            timer.status = status
+            for name, value in headers:
+                if name == 'Content-Length':
+                    timer.bytes = int(value)
+            return start_response(status, headers, exc_info)
+
+        error = True
+        streamed = False
+        try:
+            result = self.handle(environ, timed_start_response)
+            if isinstance(result, list):
+                timer.bytes = sum(map(len, result))
+            elif isinstance(result, StreamedBody):
+                # запрос завершается, когда сервер отправил последний кусок
+                streamed = True
+                result.on_close.append(lambda body: self.finish_streamed(timer, body))
+            error = False
+            return result
+        finally:
+            if not streamed:
+                self.metrics.finish_request(timer, error)
+
+    def warm_up(self, paths=None, gc_freeze=None):
+        """Прогрев до приёма соединений: загружает все шаблоны и один раз
+        запрашивает страницы paths, чтобы они попали в кэш ответов.
+        Запросы идут мимо метрик. Возвращает (шаблонов, страниц, секунд)"""
+        paths = startup_settings.WARM_UP_PATHS if paths is None else paths
+        started = perf_counter()
+        self.startup()
+        self.router.load_views()
+        templates = TemplateEngine.warm_up()
+        for path in paths:
+            environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET',
+                       'HTTP_ACCEPT_ENCODING': startup_settings.WARM_UP_ACCEPT_ENCODING}
+            setup_testing_defaults(environ)
+            body = self.handle(environ, lambda status, headers, exc_info=None: None)
+            for _ in body:
+                pass
+            if hasattr(body, 'close'):
+                body.close()
+        if startup_settings.WARM_UP_GC_FREEZE if gc_freeze is None else gc_freeze:
+            gc.collect()
+            gc.freeze()
+        return templates, len(paths), perf_counter() - started
+
+    def startup(self):
+        """Вызывает функции startup_obj, если они ещё не вызывались"""
+        if self.started:
+            return
+        with self.startup_lock:
+            if not self.started:
+                for func in self.startup_lst:
+                    func()
+                self.started = True
+
+    def finish_streamed(self, timer, body):
+        timer.bytes = body.bytes
+        self.metrics.finish_request(timer, not body.completed)
+
+    def handle(self, environ, start_response):
+        if not self.started:
+            self.startup()
         # получаем адрес, по которому выполнен переход
+        path = self.get_path(environ)
+        method = environ['REQUEST_METHOD']
+
+        # отработка паттерна page controller
+        with stage('resolution'):
+            route_url, view, path_params = self.get_route(path, method)
+        self.set_route(view)
+        if view is None:
+            return self.static_files(environ, start_response,
+                                     self.get_static_path(path))
+
+        # конвейер маршрута собран при запуске
+        pipeline = self.pipelines.get(route_url, self.default_pipeline)
+        # параметры, тело и fronts разбираются, только если view к ним обратится
+        request = Request(environ, pipeline.fronts, path_params)
+
+        response = None
+        if pipeline.before is not None:
+            response = self.run_before(pipeline, view, path, request)
+
+        cache_key = generation = release = None
+        if response is None:
+            if self.cache.is_cacheable(view, method):
+                cache_key = self.cache.make_key(path, environ.get('QUERY_STRING', ''))
+                entry = self.cache.get(cache_key)
+                if entry is not None:
+                    code, headers, body = self.get_cached_response(environ, entry)
+                    start_response(code, headers)
+                    return body
+                generation = self.cache.generation
+
+            # запуск контроллера с передачей объекта request
+            limit = self.admission.slot(route_url)
+            held = False
+            try:
+                try:
+                    # место в ограничении параллельности маршрута или 503
+                    limit.acquire()
+                    held = True
+                    with stage('view'):
+                        result = view(request)
+                except RequestError as e:
+                    result = self.error_result(e)
+                response = self.prepare_response(view, path, result)
+                if pipeline.after is not None:
+                    response = self.run_after(pipeline, request, response)
+                if held and self.is_streamed(response):
+                    # шаблон рендерится при отправке - место освободит закрытие тела
+                    release, held = limit.release, False
+            finally:
+                if held:
+                    limit.release()
+        if self.is_streamed(response):
+            return self.stream_response(environ, start_response, response,
+                                        request, view, cache_key, generation, release)
+        code, headers, body = response.status, response.headers, self.encode(response.body)
+        variants = None
+        if cache_key is not None and code.startswith('200'):
+            entry = self.cache.store(cache_key, code, headers, body,
+                                     view.cache_tags(request), generation)
+            headers, variants = entry.headers, entry.variants
+        code, headers, body = self.finish_response(environ, code, headers, body, variants)
+        start_response(code, headers)
+        return body
+
+    @staticmethod
+    def error_result(error):
+        """Ответ на RequestError: статус в теле и заголовки ошибки"""
+        return Response(error.status, error.status, error.headers)
+
+    def prepare_response(self, view, path, result):
+        """Ответ view (Response или кортеж) -> Response с Content-Type"""
+        response = Response.from_view(result)
+        if response.get_header('Content-Type') is None:
+            response.headers.insert(0, ('Content-Type', self.get_view_content_type(view, path)))
+        return response
+
+    @staticmethod
+    def encode(body):
+        if isinstance(body, bytes):
+            return body
+        with stage('encoding'):
+            return body.encode('utf-8')
+
+    def finish_response(self, environ, status, headers, body, variants=None):
+        """Этап после view: сжатие по Accept-Encoding, Vary и Content-Length.
+        variants - сжатые варианты тела у записи кэша, пополняются по мере запросов"""
+        if self.compressor.is_compressible(status, headers):
+            headers = add_vary(headers, 'Accept-Encoding')
+            coding = self.compressor.negotiate(environ)
+            if coding is not None and len(body) >= self.compressor.min_size:
+                compressed = variants.get(coding) if variants is not None else None
+                if compressed is None:
+                    with stage('compression'):
+                        compressed = self.compressor.compress(body, coding)
+                    if variants is not None:
+                        variants[coding] = compressed
+                if len(compressed) < len(body):
+                    body = compressed
+                    headers = self.weaken_etag(headers) + [('Content-Encoding', coding)]
+        headers = headers + [('Content-Length', str(len(body)))]
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return status, headers, []
+        return status, headers, [body]
+
+    @staticmethod
+    def weaken_etag(headers):
+        """ETag тела относится к несжатому ответу - у сжатого он слабый"""
+        return [(name, f'W/{value}' if name == 'ETag' and not value.startswith('W/') else value)
+                for name, value in headers]
+
+    @staticmethod
+    def is_streamed(response):
+        return not isinstance(response.body, (str, bytes))
+
+    def stream_response(self, environ, start_response, response,
+                        request, view, cache_key, generation, release=None):
+        """Ответ по частям, без Content-Length. Отправленный до конца ответ
+        кэшируется, как обычный: повторные запросы получат его целиком с ETag.
+        На HEAD шаблон не рендерится - итератор сразу закрывается"""
+        code, headers, compressor = self.prepare_stream(environ, response)
+        body = self.make_streamed_body(environ, response, code, compressor,
+                                       request, view, cache_key, generation, release)
+        start_response(code, headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            body.close()
+            return []
+        return body
+
+    def make_streamed_body(self, environ, response, code, compressor,
+                           request, view, cache_key, generation, release=None):
+        """Тело ответа по частям; release - освобождение места view маршрута,
+        вызывается при закрытии тела"""
+        collect = (cache_key is not None and code.startswith('200')
+                   and environ['REQUEST_METHOD'] != 'HEAD')
+        body = StreamedBody(response.body, collect, compressor)
+        if release is not None:
+            body.on_close.append(lambda body: release())
+        if collect:
+            body.on_close.append(lambda body: self.store_streamed(
+                cache_key, code, response.headers, body, view.cache_tags(request), generation))
+        return body
+
+    def prepare_stream(self, environ, response):
+        """(статус, заголовки, StreamCompressor или None) для ответа по частям"""
+        headers = response.headers
+        compressor = None
+        if self.compressor.is_compressible(response.status, headers):
+            headers = add_vary(headers, 'Accept-Encoding')
+            coding = self.compressor.negotiate(environ)
+            if coding is not None:
+                compressor = self.compressor.stream(coding)
+                headers = headers + [('Content-Encoding', coding)]
+        return response.status, headers, compressor
+
+    def store_streamed(self, cache_key, code, headers, body, tags, generation):
+        if body.completed:
+            self.cache.store(cache_key, code, headers, b''.join(body.collected),
+                             tags, generation)
+
+    @staticmethod
+    def set_route(view):
+        """Метрики группируются по классу view, а не по адресу:
+        у /courses/1/ и /courses/2/ один маршрут"""
+        timer = current_timer.get()
+        if timer is not None:
+            timer.route = 'static' if view is None else type(view).__name__
+
+    @staticmethod
+    def get_path(environ):
         path = environ['PATH_INFO']
         if not path.endswith('/'):
             path = f'{path}/'
+        return path
 
-        method = environ['REQUEST_METHOD']
-        request = {'method': method}
-        if method == 'POST':
-            data = Framework.decode_value(
-                PostRequests().get_request_params(environ))
-            request['data'] = data
-            print(f'Нам пришёл post-запрос: {data}')
-        if method == 'GET':
-            request_params = Framework.decode_value(
-                GetRequests().get_request_params(environ))
-            request['request_params'] = request_params
-            print(f'Нам пришли GET-параметры: {request_params}')
+    def get_view(self, path, method):
+        """Возвращает (view, параметры пути); view=None - путь ведёт к статике"""
+        return self.get_route(path, method)[1:]
 
-        # отработка паттерна page controller
-        _static = False
-        if path in self.routes_lst:
-            view = self.routes_lst[path]
-        elif path.startswith(static.STATIC_URL):
-            path = path[len(static.STATIC_URL):len(path) - 1]
-            view = ViewGetStatic(static.STATIC_FILES_DIR, path)
-            _static = True
-        else:
-            view = PageNotFound404()
-
-        # отработка паттерна front controller
-        for front in self.fronts_lst:
-            front(request)
-
-        # запуск контроллера с передачей объекта request
-        code, body = view(request)
-        body = body if _static else body.encode('utf-8')
-        start_response(code, [('Content-Type', self.get_content_type(path))])
-        return [body]
+    def get_route(self, path, method):
+        """Возвращает (адрес маршрута, view, параметры пути);
+        view=None - путь ведёт к статике, адрес None - маршрута нет"""
+        url, view, path_params = self.router.resolve_route(path, method)
+        if view is not None:
+            return url, view, path_params
+        if path.startswith(static.STATIC_URL):
+            return None, None, None
+        return None, PageNotFound404(), None
+
+    def run_before(self, pipeline, view, path, request):
+        """Ступени before конвейера; Response, если одна из них ответила сама"""
+        try:
+            with stage('middleware'):
+                result = pipeline.before(request)
+        except RequestError as e:
+            result = self.error_result(e)
+        if result is None:
+            return None
+        return self.prepare_response(view, path, result)
+
+    def run_after(self, pipeline, request, response):
+        with stage('middleware'):
+            return pipeline.after(request, response)
+
+    def get_cached_response(self, environ, entry):
+        if self.cache.not_modified(environ, entry):
+            headers = [(name, value) for name, value in entry.headers
+                       if name.lower() != 'content-type']
+            if self.compressor.is_compressible(entry.status, entry.headers):
+                headers = add_vary(headers, 'Accept-Encoding')
+                if (len(entry.body) >= self.compressor.min_size
+                        and self.compressor.negotiate(environ) is not None):
+                    headers = self.weaken_etag(headers)
+            return '304 Not Modified', headers, []
+        return self.finish_response(environ, entry.status, entry.headers,
+                                    entry.body, entry.variants)
+
+    @staticmethod
+    def get_static_path(path):
+        return path[len(static.STATIC_URL):len(path) - 1]
+
+    def get_view_content_type(self, view, path):
+        # view может задать свой тип ответа атрибутом content_type
+        return getattr(view, 'content_type', None) or self.get_content_type(path)
 
     @staticmethod
     def get_content_type(file_path):
@@ -77,36 +397,55 @@ class Framework:
         # print(extension)
         return CONTENT_TYPES.get(extension, "text/html")
 
-    @staticmethod
-    def decode_value(data):
-        new_data = {}
-        for k, v in data.items():
-            val = bytes(v.replace('%', '=').replace("+", " "), 'UTF-8')
-            val_decode_str = decodestring(val).decode('UTF-8')
-            new_data[k] = val_decode_str
-        return new_data
-
 
 class DebugApplication(Framework):
-    """WSGI-application — логирующий (такой же, как основной, только для каждого запроса выводит информацию (тип запроса и параметры) в консоль."""
+    """WSGI-application — логирующий (такой же, как основной, только для каждого запроса выводит информацию (тип запроса и параметры) в консоль.
+    Умеет профилировать выборку запросов: управление и выгрузка результатов -
+    по адресу PROFILING_URL (см. ProfilerView)."""
 
-    def __init__(self, routes_obj, fronts_obj):
-        self.application = Framework(routes_obj, fronts_obj)
-        super().__init__(routes_obj, fronts_obj)
+    def __init__(self, routes_obj, fronts_obj, startup_obj=None):
+        self.application = Framework(routes_obj, fronts_obj, startup_obj=startup_obj)
+        super().__init__(routes_obj, fronts_obj, startup_obj=startup_obj)
+        self.profiler = Profiler()
+        self.application.router.add(profiling_settings.PROFILING_URL,
+                                     ProfilerView(self.profiler))
 
     def __call__(self, env, start_response):
         print('DEBUG MODE')
         print(env)
-        return self.application(env, start_response)
+        view, _ = self.application.get_view(self.get_path(env), env['REQUEST_METHOD'])
+        route = 'static' if view is None else type(view).__name__
+        if isinstance(view, ProfilerView):
+            return self.application(env, start_response)
+        return self.profiler.profile(route, self.call_application, env, start_response)
+
+    def call_application(self, env, start_response):
+        """Страница, которая рендерится по частям (stream), рендерится уже при
+        отдаче тела - в отладке тело собирается целиком внутри профиля"""
+        result = self.application(env, start_response)
+        if not isinstance(result, StreamedBody):
+            return result
+        try:
+            return list(result)
+        finally:
+            result.close()
 
 
 class FakeApplication(Framework):
     """WSGI-application — фейковый (на все запросы пользователя отвечает: 200 OK, Hello from Fake)."""
 
-    def __init__(self, routes_obj, fronts_obj):
-        self.application = Framework(routes_obj, fronts_obj)
-        super().__init__(routes_obj, fronts_obj)
+    def __init__(self, routes_obj, fronts_obj, startup_obj=None):
+        self.application = Framework(routes_obj, fronts_obj, startup_obj=startup_obj)
+        super().__init__(routes_obj, fronts_obj, startup_obj=startup_obj)
 
     def __call__(self, env, start_response):
         start_response('200 OK', [('Content-Type', 'text/html')])
         return [b'Hello from Fake']
+
+
+def __getattr__(name):
+    # AsgiFramework вынесен в свой модуль, чтобы WSGI-сервер не импортировал asyncio
+    if name == 'AsgiFramework':
+        from pumba_framework.asgi_framework import AsgiFramework
+        return AsgiFramework
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
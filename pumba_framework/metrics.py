@@ -0,0 +1,247 @@
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from random import random
+from threading import Lock, Thread, get_ident
+from time import perf_counter, sleep, time
+import sys
+import traceback
+import pumba_framework.metrics_settings as settings
+
+# замер текущего запроса - по нему render и fronts добавляют свои этапы
+current_timer = ContextVar('current_timer', default=None)
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными корзинами, как в Prometheus"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestTimer:
+    """Замер одного запроса: время по этапам, статус и размер ответа"""
+    __slots__ = ('route', 'start', 'stages', 'thread_id', 'status', 'bytes',
+                 'stack', 'path')
+
+    def __init__(self, path):
+        self.path = path
+        self.route = None
+        self.start = perf_counter()
+        self.stages = {}
+        self.thread_id = get_ident()
+        self.status = None
+        self.bytes = 0
+        self.stack = None
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+class Stage:
+    """Контекстный менеджер: время блока добавляется к этапу текущего запроса"""
+    __slots__ = ('name', 'timer', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timer = current_timer.get()
+        if self.timer is not None:
+            self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timer is not None:
+            self.timer.add(self.name, perf_counter() - self.start)
+
+
+def stage(name):
+    return Stage(name)
+
+
+class Metrics:
+    """Метрики процесса: гистограммы задержек по view и этапам обработки,
+    счётчики запросов, байт и ошибок, журнал медленных запросов.
+    Отдаются в текстовом формате Prometheus. В режиме pre-fork у каждого
+    воркера свои метрики."""
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or settings.METRICS_BUCKETS)
+        self.lock = Lock()
+        # (route, stage) -> Histogram
+        self.durations = {}
+        # (name,) -> Histogram для декоратора Debug
+        self.debug_durations = {}
+        # (route, status) -> число запросов
+        self.requests = {}
+        self.bytes = {}
+        self.errors = {}
+        self.in_flight = {}
+        self.slow_log = deque(maxlen=settings.SLOW_REQUEST_LOG_SIZE)
+        self.monitor = None
+
+    def start_request(self, path):
+        timer = RequestTimer(path)
+        current_timer.set(timer)
+        self.in_flight[id(timer)] = timer
+        if settings.SLOW_REQUEST_THRESHOLD is not None and self.monitor is None:
+            self.start_monitor()
+        return timer
+
+    def finish_request(self, timer, error=False):
+        total = perf_counter() - timer.start
+        route = timer.route or 'unknown'
+        status = (timer.status or '500').split(' ', 1)[0]
+        with self.lock:
+            self.observe(self.durations, (route, 'total'), total)
+            for name, seconds in timer.stages.items():
+                self.observe(self.durations, (route, name), seconds)
+            key = (route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes[route] = self.bytes.get(route, 0) + timer.bytes
+            if error or status.startswith('5'):
+                self.errors[route] = self.errors.get(route, 0) + 1
+        current_timer.set(None)
+        self.in_flight.pop(id(timer), None)
+        threshold = settings.SLOW_REQUEST_THRESHOLD
+        if threshold is not None and total >= threshold:
+            self.log_slow_request(timer, total)
+
+    def observe(self, histograms, key, value):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def observe_debug(self, name, seconds):
+        with self.lock:
+            self.observe(self.debug_durations, name, seconds)
+
+    def start_monitor(self):
+        with self.lock:
+            if self.monitor is None:
+                self.monitor = Thread(target=self.watch_slow_requests,
+                                      name='slow-request-monitor', daemon=True)
+                self.monitor.start()
+
+    def watch_slow_requests(self):
+        """Снимает стек потока, пока медленный запрос ещё выполняется"""
+        while True:
+            threshold = settings.SLOW_REQUEST_THRESHOLD
+            if threshold is None:
+                sleep(1)
+                continue
+            sleep(max(threshold / 2, 0.05))
+            now = perf_counter()
+            frames = None
+            for timer in list(self.in_flight.values()):
+                if timer.stack is not None or now - timer.start < threshold:
+                    continue
+                if random() >= settings.SLOW_REQUEST_SAMPLE_RATE:
+                    timer.stack = ''
+                    continue
+                if frames is None:
+                    frames = sys._current_frames()
+                frame = frames.get(timer.thread_id)
+                timer.stack = ''.join(traceback.format_stack(frame)) if frame else ''
+
+    def log_slow_request(self, timer, total):
+        record = {
+            'time': time(),
+            'path': timer.path,
+            'route': timer.route,
+            'status': timer.status,
+            'duration': round(total, 6),
+            'stages': {name: round(seconds, 6) for name, seconds in timer.stages.items()},
+            'stack': timer.stack or '',
+        }
+        self.slow_log.append(record)
+        # импорт здесь: patterns сам зависит от фреймворка
+        from patterns.creational_patterns import Logger
+        Logger('slow_requests').warning('Медленный запрос', **record)
+
+    @staticmethod
+    def format_labels(**labels):
+        items = ','.join(f'{key}="{str(value).replace(chr(34), chr(39))}"'
+                         for key, value in labels.items())
+        return f'{{{items}}}'
+
+    def format_histograms(self, lines, name, help_text, histograms, label_names):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, histogram in sorted(histograms.items()):
+            labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{self.format_labels(**labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_bucket{self.format_labels(**labels, le="+Inf")} '
+                         f'{histogram.count}')
+            lines.append(f'{name}_sum{self.format_labels(**labels)} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{self.format_labels(**labels)} {histogram.count}')
+
+    def format_counters(self, lines, name, help_text, counters, label_names):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for key, value in sorted(counters.items()):
+            labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+            lines.append(f'{name}{self.format_labels(**labels)} {value}')
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        with self.lock:
+            self.format_histograms(lines, 'pumba_request_duration_seconds',
+                                   'Время обработки запроса по view и этапам',
+                                   self.durations, ('route', 'stage'))
+            self.format_histograms(lines, 'pumba_debug_duration_seconds',
+                                   'Время методов, обёрнутых декоратором Debug',
+                                   self.debug_durations, ('name',))
+            self.format_counters(lines, 'pumba_requests_total', 'Число запросов',
+                                 self.requests, ('route', 'status'))
+            self.format_counters(lines, 'pumba_response_bytes_total',
+                                 'Отправлено байт в телах ответов', self.bytes, ('route',))
+            self.format_counters(lines, 'pumba_errors_total',
+                                 'Ошибки: исключения и ответы 5xx', self.errors, ('route',))
+        lines.append('# HELP pumba_requests_in_flight Запросы в обработке')
+        lines.append('# TYPE pumba_requests_in_flight gauge')
+        lines.append(f'pumba_requests_in_flight {len(self.in_flight)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.durations.clear()
+            self.debug_durations.clear()
+            self.requests.clear()
+            self.bytes.clear()
+            self.errors.clear()
+            self.slow_log.clear()
+
+
+class MetricsView:
+    """Страница с метриками для Prometheus"""
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, metrics, admission=None):
+        self.metrics = metrics
+        self.admission = admission
+
+    def __call__(self, request):
+        text = self.metrics.render()
+        if self.admission is not None:
+            text += self.admission.render(self.metrics)
+        return '200 OK', text
+
+
+# метрики процесса: Framework использует их по умолчанию
+metrics = Metrics()
@@ -0,0 +1,14 @@
+# Настройки метрик
+METRICS_ENABLED = True
+# адрес, по которому метрики отдаются в текстовом формате Prometheus
+METRICS_URL = '/metrics/'
+# границы корзин гистограмм задержек (секунды)
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# запросы дольше этого порога (секунды) попадают в журнал медленных запросов,
+# None - журнал выключен
+SLOW_REQUEST_THRESHOLD = 1.0
+# у какой доли медленных запросов снимается стек
+SLOW_REQUEST_SAMPLE_RATE = 1.0
+# сколько последних медленных запросов держать в памяти
+SLOW_REQUEST_LOG_SIZE = 100
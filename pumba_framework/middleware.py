@@ -0,0 +1,96 @@
+from fnmatch import fnmatchcase
+
+
+class Middleware:
+    """Ступень конвейера запроса (middleware).
+    before(request) вызывается до кэша ответов и view: если вернёт ответ
+    (кортеж (код, тело) или Response), запрос дальше не идёт - так
+    работают отказы в доступе, ограничение частоты и свои кэши.
+    after(request, response) получает Response от view и возвращает Response;
+    ответ после after попадает в кэш ответов, поэтому для ответов из кэша
+    after уже не вызывается.
+    routes - шаблоны адресов маршрутов, как в @route, с * и ?
+    ('/courses/*'); None - все маршруты, включая 404"""
+    routes = None
+
+    def before(self, request):
+        return None
+
+    def after(self, request, response):
+        return response
+
+    def applies_to(self, url):
+        if self.routes is None:
+            return True
+        return url is not None and any(fnmatchcase(url, pattern) for pattern in self.routes)
+
+
+class Front(Middleware):
+    """Прежний front controller - функция от request, которая дописывает
+    в него значения, - только для маршрутов routes. Как и функции в списке
+    fronts, вызывается лениво: когда view обратится к таким значениям"""
+
+    def __init__(self, func, routes=None):
+        self.func = func
+        self.routes = routes
+
+
+class Pipeline:
+    """Конвейер одного маршрута, собранный один раз при запуске:
+    fronts - ленивые front controller для Request, before и after -
+    ступени, сложенные в одну функцию каждая (None - ступеней нет)"""
+    __slots__ = ('fronts', 'before', 'after')
+
+    def __init__(self, stages, url=None):
+        fronts, befores, afters = [], [], []
+        for stage in stages:
+            if not isinstance(stage, Middleware):
+                # функция из прежнего списка fronts - для всех маршрутов
+                fronts.append(stage)
+            elif not stage.applies_to(url):
+                continue
+            elif isinstance(stage, Front):
+                fronts.append(stage.func)
+            else:
+                if type(stage).before is not Middleware.before:
+                    befores.append(stage.before)
+                if type(stage).after is not Middleware.after:
+                    afters.append(stage.after)
+        self.fronts = tuple(fronts)
+        self.before = self.chain_before(befores)
+        self.after = self.chain_after(afters)
+
+    @staticmethod
+    def chain_before(befores):
+        """Ступени before по порядку; первая, вернувшая ответ, останавливает цепочку"""
+        chained = None
+        for before in reversed(befores):
+            if chained is None:
+                chained = before
+                continue
+
+            def chained(request, before=before, rest=chained):
+                response = before(request)
+                if response is None:
+                    return rest(request)
+                return response
+        return chained
+
+    @staticmethod
+    def chain_after(afters):
+        """Ступени after в обратном порядке: первая в списке видит ответ последней"""
+        chained = None
+        for after in afters:
+            if chained is None:
+                chained = after
+                continue
+
+            def chained(request, response, after=after, rest=chained):
+                return rest(request, after(request, response))
+        return chained
+
+    @classmethod
+    def compose(cls, stages, urls):
+        """{адрес маршрута: Pipeline} и конвейер для остальных адресов (404)"""
+        stages = list(stages)
+        return {url: cls(stages, url) for url in urls}, cls(stages)
@@ -0,0 +1,53 @@
+import pumba_framework.pagination_settings as settings
+
+
+class Page:
+    """Страница списка: элементы, номер (с 1) и размер страницы.
+    Общее число элементов известно не всегда (например, у поиска) -
+    тогда есть ли следующая страница определяется по лишнему элементу"""
+
+    def __init__(self, items, number, size, has_next, total=None):
+        self.items = items
+        self.number = number
+        self.size = size
+        self.has_next = has_next
+        self.total = total
+
+    @property
+    def has_prev(self):
+        return self.number > 1
+
+    @property
+    def offset(self):
+        return (self.number - 1) * self.size
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        return max((self.total + self.size - 1) // self.size, 1)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @staticmethod
+    def get_params(params, size=settings.PAGE_SIZE, max_size=settings.MAX_PAGE_SIZE,
+                   page_name='page', size_name='size'):
+        """(номер, размер) страницы из параметров запроса; неверные значения -
+        первая страница и размер по умолчанию"""
+        try:
+            number = max(int(params.get(page_name, 1)), 1)
+            size = min(max(int(params.get(size_name, size)), 1), max_size)
+        except ValueError:
+            number = 1
+        return number, size
+
+    @classmethod
+    def from_sequence(cls, sequence, number, size):
+        """Срез списка: берутся только элементы страницы, без копии всего списка"""
+        offset = (number - 1) * size
+        return cls(list(sequence[offset:offset + size]), number, size,
+                   offset + size < len(sequence), len(sequence))
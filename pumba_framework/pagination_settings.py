@@ -0,0 +1,6 @@
+# Настройки постраничного вывода списков
+# курсов на странице списка категории и максимум, который можно запросить (?size=)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# категорий в выпадающем списке на странице редактирования курса
+CATEGORIES_PAGE_SIZE = 100
@@ -0,0 +1,218 @@
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+import os
+import random
+import signal
+import socket
+import time
+import traceback
+
+
+class WorkerWSGIServer(WSGIServer):
+    """WSGI-сервер воркера: принимает соединения с общего слушающего сокета"""
+    # handle_request ждёт соединение не дольше timeout секунд,
+    # чтобы воркер вовремя замечал сигнал остановки
+    timeout = 0.5
+
+    def __init__(self, sock, app, handler_class=WSGIRequestHandler):
+        super().__init__(sock.getsockname()[:2], handler_class, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        host, port = sock.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(app)
+        self.handled = 0
+        self.stopping = False
+
+    def process_request(self, request, client_address):
+        self.handled += 1
+        super().process_request(request, client_address)
+
+
+class ThreadingWorkerWSGIServer(ThreadingMixIn, WorkerWSGIServer):
+    """Воркер с потоком на каждый запрос. При остановке ждёт
+    завершения всех запросов, которые уже обрабатываются"""
+    daemon_threads = False
+    block_on_close = True
+
+
+class PreforkServer:
+    """Pre-fork сервер: мастер-процесс открывает сокет, запускает N воркеров
+    и следит за ними.
+    SIGTERM/SIGINT - плавная остановка: воркеры дорабатывают текущие запросы.
+    SIGHUP - плавный перезапуск: запускаются новые воркеры, старые завершаются.
+    Воркер перезапускается после max_requests запросов (0 - без ограничения).
+    Если воркеры падают раз за разом, пауза перед запуском нового растёт
+    от 0.1 до max_backoff секунд."""
+
+    def __init__(self, app, host='', port=8001, workers=2, threads=False,
+                 max_requests=0, max_requests_jitter=0, graceful_timeout=30,
+                 backlog=1024, max_backoff=30):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers_count = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.max_backoff = max_backoff
+        self.sock = None
+        self.workers = set()
+        # упавших подряд воркеров и воркеров, ждущих перезапуска после паузы
+        self.failures = 0
+        self.pending = 0
+        self.respawn_at = 0.0
+        self.failed_at = 0.0
+        self.stopping = False
+        self.reloading = False
+
+    def run(self):
+        self.sock = socket.create_server((self.host, self.port), backlog=self.backlog)
+        # воркеры ждут соединения вместе: если соединение забрал другой воркер,
+        # accept вернётся по таймауту, а не заблокирует воркер
+        self.sock.settimeout(WorkerWSGIServer.timeout)
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        for _ in range(self.workers_count):
+            self.spawn_worker()
+        try:
+            while not self.stopping:
+                if self.reloading:
+                    self.reload()
+                self.reap_workers()
+                self.respawn_workers()
+                time.sleep(0.2)
+        finally:
+            self.stop_workers()
+            self.sock.close()
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_reload(self, signum, frame):
+        self.reloading = True
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.workers.add(pid)
+            return pid
+        # дочерний процесс
+        exit_code = 0
+        try:
+            self.run_worker()
+        except Exception:
+            exit_code = 1
+            self.log_exception('Воркер упал')
+        finally:
+            os._exit(exit_code)
+
+    @staticmethod
+    def log_exception(text, **fields):
+        # импорт здесь: patterns сам зависит от фреймворка
+        from patterns.behavioral_patterns import log_queue
+        from patterns.creational_patterns import Logger
+        Logger('server').error(text, pid=os.getpid(),
+                               traceback=traceback.format_exc(), **fields)
+        # os._exit не ждёт фоновый поток лога - сбрасываем очередь сами
+        log_queue.close()
+
+    def run_worker(self):
+        server_class = ThreadingWorkerWSGIServer if self.threads else WorkerWSGIServer
+        server = server_class(self.sock, self.app)
+
+        def stop(signum, frame):
+            server.stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            max_requests += random.randint(0, self.max_requests_jitter)
+        while not server.stopping:
+            server.handle_request()
+            if max_requests and server.handled >= max_requests:
+                break
+        # ThreadingMixIn дожидается запросов, которые ещё обрабатываются
+        server.server_close()
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            if pid in self.workers:
+                self.workers.discard(pid)
+                if self.stopping:
+                    continue
+                if os.waitstatus_to_exitcode(status) == 0:
+                    # плановый перезапуск по max_requests
+                    self.failures = 0
+                    self.spawn_worker()
+                    continue
+                now = time.monotonic()
+                if now - self.failed_at > 2 * self.max_backoff:
+                    # давно не падали - считаем заново
+                    self.failures = 0
+                self.failures += 1
+                self.failed_at = now
+                delay = min(self.max_backoff, 0.1 * 2 ** (self.failures - 1))
+                self.respawn_at = max(self.respawn_at, now + delay)
+                self.pending += 1
+                self.log_master('Воркер завершился с ошибкой', pid=pid,
+                                status=os.waitstatus_to_exitcode(status), restart_in=delay)
+
+    def respawn_workers(self):
+        if self.pending and time.monotonic() >= self.respawn_at:
+            for _ in range(self.pending):
+                self.spawn_worker()
+            self.pending = 0
+
+    @staticmethod
+    def log_master(text, **fields):
+        from patterns.creational_patterns import Logger
+        Logger('server').warning(text, **fields)
+
+    def reload(self):
+        self.reloading = False
+        # новые воркеры запускаются все сразу
+        self.pending = 0
+        self.failures = 0
+        old_workers = set(self.workers)
+        for _ in range(self.workers_count):
+            self.spawn_worker()
+        for pid in old_workers:
+            self.workers.discard(pid)
+            self.kill(pid, signal.SIGTERM)
+
+    def stop_workers(self):
+        for pid in self.workers:
+            self.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid:
+                self.workers.discard(pid)
+            else:
+                time.sleep(0.1)
+        for pid in self.workers:
+            self.kill(pid, signal.SIGKILL)
+
+    @staticmethod
+    def kill(pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
@@ -0,0 +1,290 @@
+from collections import Counter
+from io import StringIO
+from random import random
+from threading import Event, Lock, Thread, get_ident
+import cProfile
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+import pumba_framework.profiling_settings as settings
+
+
+class CProfileProfiler:
+    """Детерминированный профайлер на cProfile, профили копятся по маршрутам.
+    cProfile работает только в одном потоке за раз: запрос, пришедший,
+    пока профилируется другой, выполняется без профиля"""
+    extension = 'pstats'
+
+    def __init__(self):
+        self.stats = {}
+        self.lock = Lock()
+        self.running = Lock()
+
+    def profile(self, route, func, *args):
+        if not self.running.acquire(blocking=False):
+            return func(*args)
+        try:
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args)
+            finally:
+                with self.lock:
+                    if route in self.stats:
+                        self.stats[route].add(profile)
+                    else:
+                        self.stats[route] = pstats.Stats(profile)
+        finally:
+            self.running.release()
+
+    def routes(self):
+        return sorted(self.stats)
+
+    def report(self, route, limit=40):
+        out = StringIO()
+        with self.lock:
+            stats = self.stats.get(route)
+            if stats is None:
+                return ''
+            stats.stream = out
+            stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def dump(self, route, file_name):
+        with self.lock:
+            self.stats[route].dump_stats(file_name)
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+
+class StackSampler:
+    """Статистический профайлер: фоновый поток раз в interval секунд снимает
+    стеки потоков, которые сейчас выполняют профилируемые запросы.
+    Стеки копятся в свёрнутом виде (collapsed) - формат flamegraph.pl и speedscope.
+    Сам запрос при этом не замедляется"""
+    extension = 'collapsed'
+
+    def __init__(self, interval):
+        self.interval = interval
+        # id потока -> маршрут запроса, который он выполняет
+        self.active = {}
+        # маршрут -> Counter стеков
+        self.stacks = {}
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.thread = None
+
+    def profile(self, route, func, *args):
+        thread_id = get_ident()
+        self.active[thread_id] = route
+        if self.thread is None:
+            self.start()
+        self.wakeup.set()
+        try:
+            return func(*args)
+        finally:
+            self.active.pop(thread_id, None)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(target=self.run, name='stack-sampler', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            if not self.active:
+                # спим, пока нет профилируемых запросов
+                self.wakeup.clear()
+                if not self.active:
+                    self.wakeup.wait()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for thread_id, route in list(self.active.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = self.collapse(frame)
+                with self.lock:
+                    self.stacks.setdefault(route, Counter())[stack] += 1
+
+    def collapse(self, frame):
+        """Стек от profile() до текущей функции: 'a (file.py:1);b (file.py:7)'"""
+        names = []
+        while frame is not None and frame.f_code is not StackSampler.profile.__code__:
+            code = frame.f_code
+            name = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+            names.append(name.replace(';', ':'))
+            frame = frame.f_back
+        names.reverse()
+        return ';'.join(names)
+
+    def routes(self):
+        return sorted(self.stacks)
+
+    def report(self, route, limit=None):
+        with self.lock:
+            stacks = self.stacks.get(route)
+            items = stacks.most_common(limit) if stacks else []
+        return ''.join(f'{route};{stack} {count}\n' for stack, count in items)
+
+    def dump(self, route, file_name):
+        with open(file_name, 'w', encoding='utf-8') as file:
+            file.write(self.report(route))
+
+    def reset(self):
+        with self.lock:
+            self.stacks.clear()
+
+
+class Profiler:
+    """Профилирование выборки запросов DebugApplication.
+    Включается, выключается и выгружает результаты во время работы -
+    через ProfilerView, без перезапуска сервера"""
+
+    def __init__(self):
+        self.profilers = {
+            'cprofile': CProfileProfiler(),
+            'sampler': StackSampler(settings.PROFILING_SAMPLER_INTERVAL),
+        }
+        self.enabled = False
+        self.mode = settings.PROFILING_MODE
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.requests = Counter()
+        self.memory_snapshot = None
+        # False в настройках не останавливает tracemalloc, запущенный снаружи
+        self.configure(enabled=settings.PROFILING_ENABLED,
+                       tracemalloc_enabled=settings.PROFILING_TRACEMALLOC or None)
+
+    def configure(self, enabled=None, mode=None, sample_rate=None,
+                  tracemalloc_enabled=None):
+        if mode is not None:
+            if mode not in self.profilers:
+                raise ValueError(f'Неизвестный режим профилирования {mode}')
+            self.mode = mode
+        if sample_rate is not None:
+            if not 0 <= sample_rate <= 1:
+                raise ValueError('Доля запросов должна быть от 0 до 1')
+            self.sample_rate = sample_rate
+        if enabled is not None:
+            self.enabled = enabled
+        if tracemalloc_enabled:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(settings.PROFILING_TRACEMALLOC_FRAMES)
+            # tracemalloc мог быть запущен раньше (PYTHONTRACEMALLOC, -X
+            # tracemalloc) - базовый снимок всё равно нужен
+            if self.memory_snapshot is None:
+                self.memory_snapshot = self.take_memory_snapshot()
+        elif tracemalloc_enabled is False and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self.memory_snapshot = None
+
+    def profile(self, route, func, *args):
+        if not self.enabled or random() >= self.sample_rate:
+            return func(*args)
+        self.requests[route] += 1
+        return self.profilers[self.mode].profile(route, func, *args)
+
+    @property
+    def profiler(self):
+        return self.profilers[self.mode]
+
+    def report(self, route=None, limit=None):
+        routes = [route] if route else self.profiler.routes()
+        return ''.join(self.profiler.report(name, limit) for name in routes)
+
+    def dump(self, route=None, directory=None):
+        """Сохраняет результаты текущего режима по файлу на маршрут"""
+        directory = directory or settings.PROFILING_DUMP_DIR
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        file_names = []
+        for name in ([route] if route else self.profiler.routes()):
+            if name not in self.profiler.routes():
+                continue
+            file_name = os.path.join(directory, f'{name}-{stamp}.{self.profiler.extension}')
+            self.profiler.dump(name, file_name)
+            file_names.append(file_name)
+        return file_names
+
+    @staticmethod
+    def take_memory_snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+    def memory_report(self, limit=30):
+        """Что выделено с прошлого снимка tracemalloc, по строкам кода"""
+        if not tracemalloc.is_tracing():
+            return ''
+        snapshot = self.take_memory_snapshot()
+        if self.memory_snapshot is None:
+            # сравнивать не с чем: этот снимок становится базовым
+            self.memory_snapshot = snapshot
+            return 'Базовый снимок tracemalloc сохранён, повторите запрос\n'
+        stats = snapshot.compare_to(self.memory_snapshot, 'lineno')
+        self.memory_snapshot = snapshot
+        return ''.join(f'{stat}\n' for stat in stats[:limit])
+
+    def status(self):
+        lines = [
+            f'enabled: {self.enabled}',
+            f'mode: {self.mode}',
+            f'sample_rate: {self.sample_rate}',
+            f'tracemalloc: {tracemalloc.is_tracing()}',
+        ]
+        lines += [f'requests {route}: {count}' for route, count in sorted(self.requests.items())]
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        self.requests.clear()
+        for profiler in self.profilers.values():
+            profiler.reset()
+
+
+class ProfilerView:
+    """Управление профилированием, только в DebugApplication.
+    ?action=status - состояние и число профилированных запросов по маршрутам
+    ?action=on&mode=sampler&rate=0.1 - включить; off - выключить; reset - сбросить
+    ?action=report&route=Index&limit=40 - pstats или свёрнутые стеки текстом
+    ?action=dump&route=Index - сохранить .pstats/.collapsed в PROFILING_DUMP_DIR
+    ?action=memory - разница снимков tracemalloc (memory-on / memory-off)"""
+    content_type = 'text/plain; charset=utf-8'
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def __call__(self, request):
+        params = request['request_params']
+        action = params.get('action', 'status')
+        route = params.get('route') or None
+        try:
+            limit = int(params['limit']) if params.get('limit') else None
+            if action == 'on':
+                rate = params.get('rate')
+                self.profiler.configure(enabled=True, mode=params.get('mode') or None,
+                                        sample_rate=float(rate) if rate else None)
+            elif action == 'off':
+                self.profiler.configure(enabled=False)
+            elif action == 'reset':
+                self.profiler.reset()
+            elif action == 'report':
+                return '200 OK', self.profiler.report(route, limit)
+            elif action == 'dump':
+                return '200 OK', ''.join(f'{name}\n' for name in self.profiler.dump(route))
+            elif action == 'memory-on':
+                self.profiler.configure(tracemalloc_enabled=True)
+            elif action == 'memory-off':
+                self.profiler.configure(tracemalloc_enabled=False)
+            elif action == 'memory':
+                return '200 OK', self.profiler.memory_report(limit or 30)
+            elif action != 'status':
+                raise ValueError(f'Неизвестное действие {action}')
+        except ValueError as e:
+            return '400 Bad Request', f'{e}\n'
+        return '200 OK', self.profiler.status()
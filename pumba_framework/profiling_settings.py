@@ -0,0 +1,19 @@
+from os import path
+from pumba_framework.static_settings import ROOT_DIR
+
+# Настройки профилирования (только для DebugApplication)
+# профилирование включено сразу после запуска; переключается по PROFILING_URL
+PROFILING_ENABLED = False
+# 'cprofile' - детерминированный профиль (pstats),
+# 'sampler' - статистический: стеки потока раз в PROFILING_SAMPLER_INTERVAL секунд
+PROFILING_MODE = 'sampler'
+# доля профилируемых запросов
+PROFILING_SAMPLE_RATE = 1.0
+PROFILING_SAMPLER_INTERVAL = 0.005
+# адрес управления профилированием и выгрузки результатов
+PROFILING_URL = '/_debug/profile/'
+# снимки tracemalloc; замедляют все запросы, поэтому по умолчанию выключены
+PROFILING_TRACEMALLOC = False
+PROFILING_TRACEMALLOC_FRAMES = 10
+# куда сохранять файлы .pstats и .collapsed
+PROFILING_DUMP_DIR = path.join(ROOT_DIR, 'profiles')
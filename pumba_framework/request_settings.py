@@ -0,0 +1,9 @@
+# Настройки разбора запросов
+# максимальный размер тела запроса (байт), больше - ответ 413
+REQUEST_MAX_BODY_SIZE = 10 * 1024 * 1024
+# максимальное число полей в запросе (строка запроса, форма)
+REQUEST_MAX_FIELDS = 1000
+# файлы из multipart/form-data больше этого размера пишутся во временный файл
+REQUEST_FILE_MEMORY_SIZE = 256 * 1024
+# размер куска при чтении тела запроса
+REQUEST_CHUNK_SIZE = 64 * 1024
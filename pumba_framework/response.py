@@ -0,0 +1,57 @@
+class Response:
+    """Ответ view: статус, тело и заголовки.
+    body - строка, байты или итератор строк (templator.stream).
+    View может по-прежнему возвращать кортеж (код, тело): Framework приводит
+    его к Response. Response распаковывается как кортеж, поэтому код,
+    ожидающий (код, тело), продолжает работать"""
+
+    def __init__(self, body='', status='200 OK', headers=None, content_type=None):
+        self.status = status
+        self.body = body
+        self.headers = list(headers or [])
+        if content_type is not None:
+            self.set_header('Content-Type', content_type)
+
+    @classmethod
+    def from_view(cls, result):
+        if isinstance(result, Response):
+            return result
+        status, body = result
+        return cls(body, status)
+
+    def __iter__(self):
+        yield self.status
+        yield self.body
+
+    def get_header(self, name, default=None):
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def set_header(self, name, value):
+        """Заменяет все заголовки с таким именем"""
+        self.remove_header(name)
+        self.headers.append((name, value))
+
+    def remove_header(self, name):
+        name = name.lower()
+        self.headers = [(key, value) for key, value in self.headers if key.lower() != name]
+
+    def add_vary(self, *names):
+        self.headers = add_vary(self.headers, *names)
+
+
+def add_vary(headers, *names):
+    """Список заголовков с дополненным Vary: значения view сохраняются"""
+    values = []
+    for key, value in headers:
+        if key.lower() == 'vary':
+            values += [item.strip() for item in value.split(',') if item.strip()]
+    known = {value.lower() for value in values}
+    if '*' in known:
+        return headers
+    values += [name for name in names if name.lower() not in known]
+    return [(key, value) for key, value in headers if key.lower() != 'vary'] + [
+        ('Vary', ', '.join(values))]
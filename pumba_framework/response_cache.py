@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+import pumba_framework.cache_settings as settings
+
+# память на ответ сверх тела: ключ, заголовки, теги
+ENTRY_OVERHEAD = 512
+
+
+def cache_page(tags=None):
+    """Декоратор класса view: ответы 200 на GET/HEAD кэшируются целиком.
+    tags(request) возвращает теги страницы; запись с любым из этих тегов
+    в Engine сбрасывает страницу из кэша"""
+    def decorator(cls):
+        cls.cache_tags = staticmethod(tags if tags else lambda request: ())
+        return cls
+    return decorator
+
+
+class CacheEntry:
+    __slots__ = ('status', 'headers', 'body', 'etag', 'tags', 'size', 'variants')
+
+    def __init__(self, status, headers, body, tags):
+        self.status = status
+        self.body = body
+        # сжатые варианты тела {'gzip': bytes}: сжимаем один раз на запись,
+        # а не на каждое попадание; в бюджет памяти не входят - они в разы меньше тела
+        self.variants = {}
+        self.etag = f'"{blake2b(body, digest_size=12).hexdigest()}"'
+        self.headers = headers + [('ETag', self.etag), ('Cache-Control', 'no-cache')]
+        self.tags = frozenset(tags)
+        self.size = len(body) + ENTRY_OVERHEAD
+
+
+class ResponseCache:
+    """Кэш готовых ответов: LRU с бюджетом памяти и сбросом по тегам.
+    Подписывается на Engine как наблюдатель - update(subject, tags)"""
+
+    def __init__(self, max_size=None, max_entries=None):
+        self.max_size = max_size if max_size is not None else settings.RESPONSE_CACHE_MAX_SIZE
+        self.max_entries = (max_entries if max_entries is not None
+                            else settings.RESPONSE_CACHE_MAX_ENTRIES)
+        self.entries = OrderedDict()
+        # тег -> множество ключей
+        self.tag_keys = {}
+        self.size = 0
+        # растёт при каждом сбросе: ответ, который рендерился во время
+        # записи в каталог, в кэш уже не попадёт
+        self.generation = 0
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def is_cacheable(view, method):
+        return (settings.RESPONSE_CACHE_ENABLED and method in ('GET', 'HEAD')
+                and hasattr(view, 'cache_tags'))
+
+    @staticmethod
+    def make_key(path, query_string):
+        # HEAD отвечает тем же, что и GET; порядок разных параметров не важен,
+        # а у повторённого - важен: QueryDict.get берёт последнее значение.
+        # Сортировка по имени устойчива и сохраняет порядок значений
+        if query_string:
+            query_string = '&'.join(sorted(
+                (item for item in query_string.split('&') if item),
+                key=lambda item: item.partition('=')[0]))
+        return path, query_string
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def store(self, key, status, headers, body, tags, generation):
+        """Сохраняет ответ, если с начала его рендера каталог не менялся"""
+        entry = CacheEntry(status, headers, body, tags)
+        if entry.size > self.max_size:
+            return entry
+        with self.lock:
+            if generation != self.generation:
+                return entry
+            self.remove(key)
+            self.entries[key] = entry
+            self.size += entry.size
+            for tag in entry.tags:
+                self.tag_keys.setdefault(tag, set()).add(key)
+            while self.entries and (self.size > self.max_size
+                                    or len(self.entries) > self.max_entries):
+                self.remove(next(iter(self.entries)))
+        return entry
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry.size
+        for tag in entry.tags:
+            keys = self.tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tag_keys[tag]
+
+    def invalidate(self, tags):
+        with self.lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self.tag_keys.get(tag, ())):
+                    self.remove(key)
+
+    def update(self, subject, tags):
+        # None - изменилось всё (каталог перечитан)
+        if tags is None:
+            self.clear()
+        else:
+            self.invalidate(tags)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.tag_keys.clear()
+            self.size = 0
+
+    @staticmethod
+    def not_modified(environ, entry):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or entry.etag in tags or f'W/{entry.etag}' in tags
+
+
+# общий кэш процесса: Framework использует его по умолчанию,
+# а views подписывают его на изменения Engine
+response_cache = ResponseCache()
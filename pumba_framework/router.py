@@ -0,0 +1,194 @@
+from threading import Lock
+import re
+from pumba_framework.response import Response
+
+# конвертеры параметров пути: <int:id>, <slug:name>, <str:name>, <path:rest>
+CONVERTERS = {
+    'int': (re.compile(r'\d+'), int),
+    'str': (re.compile(r'[^/]+'), str),
+    'slug': (re.compile(r'[-a-zA-Z0-9_]+'), str),
+    'path': (re.compile(r'.+'), str),
+}
+PARAM_RE = re.compile(r'^<(?:(?P<converter>\w+):)?(?P<name>\w+)>$')
+ANY_METHOD = '*'
+
+
+class MethodNotAllowed405:
+    def __init__(self, allowed):
+        self.allowed = allowed
+
+    def __call__(self, request):
+        # RFC 9110: ответ 405 перечисляет допустимые методы в Allow
+        return Response('405 Method Not Allowed', '405 Method Not Allowed',
+                        [('Allow', ', '.join(self.allowed))])
+
+
+class LazyView:
+    """View, класс которого создаётся при первом обращении к маршруту,
+    а не при импорте модуля с view"""
+    __slots__ = ('cls', 'view', 'lock')
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.view = None
+        self.lock = Lock()
+
+    def get(self):
+        if self.view is None:
+            with self.lock:
+                if self.view is None:
+                    self.view = self.cls()
+        return self.view
+
+
+class RouteNode:
+    """Узел дерева маршрутов - один сегмент пути"""
+    __slots__ = ('children', 'params', 'views', 'url')
+
+    def __init__(self):
+        # точные сегменты: {'courses': RouteNode}
+        self.children = {}
+        # параметры: [(имя, шаблон, преобразование, RouteNode, жадный)]
+        self.params = []
+        # {метод: view} и адрес маршрута, заполнены только у конечных узлов
+        self.views = None
+        self.url = None
+
+
+class Router:
+    """Маршрутизатор: все маршруты собираются один раз при старте.
+    Маршруты без параметров ищутся в словаре, с параметрами - в дереве
+    сегментов, так что время поиска не зависит от числа маршрутов."""
+
+    def __init__(self, routes_obj=None):
+        self.exact = {}
+        self.root = RouteNode()
+        if routes_obj:
+            for url, view in routes_obj.items():
+                self.add(url, view)
+
+    @staticmethod
+    def split(url):
+        return [segment for segment in url.strip('/').split('/') if segment]
+
+    @staticmethod
+    def views_by_method(view):
+        # значение в routes - view или словарь {метод: view}
+        if isinstance(view, dict):
+            return {method.upper(): v for method, v in view.items()}
+        return {ANY_METHOD: view}
+
+    def add(self, url, view):
+        views = self.views_by_method(view)
+        if '<' not in url:
+            self.exact.setdefault(url, {}).update(views)
+            return
+        node = self.root
+        for segment in self.split(url):
+            match = PARAM_RE.match(segment)
+            if match is None:
+                node = node.children.setdefault(segment, RouteNode())
+                continue
+            converter = match.group('converter') or 'str'
+            if converter not in CONVERTERS:
+                raise Exception(f'Неизвестный конвертер {converter} в маршруте {url}')
+            name = match.group('name')
+            for param in node.params:
+                if param[0] == name and param[1] is CONVERTERS[converter][0]:
+                    node = param[3]
+                    break
+            else:
+                pattern, convert = CONVERTERS[converter]
+                child = RouteNode()
+                node.params.append((name, pattern, convert, child, converter == 'path'))
+                node = child
+        if node.views is None:
+            node.views = {}
+        node.views.update(views)
+        node.url = url
+
+    def urls(self):
+        """Адреса всех маршрутов, как они были добавлены"""
+        urls = list(self.exact)
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            if node.url is not None:
+                urls.append(node.url)
+            nodes.extend(node.children.values())
+            nodes.extend(param[3] for param in node.params)
+        return urls
+
+    def match(self, path):
+        """Возвращает (адрес маршрута, {метод: view}, параметры пути) или (None, None, None)"""
+        views = self.exact.get(path)
+        if views is not None:
+            return path, views, {}
+        segments = self.split(path)
+        return self.match_node(self.root, segments, 0, {})
+
+    def match_node(self, node, segments, index, params):
+        if index == len(segments):
+            if node.views:
+                return node.url, node.views, params
+            return None, None, None
+        segment = segments[index]
+        child = node.children.get(segment)
+        if child is not None:
+            url, views, found = self.match_node(child, segments, index + 1, params)
+            if views is not None:
+                return url, views, found
+        for name, pattern, convert, child, greedy in node.params:
+            if greedy:
+                if child.views:
+                    rest = '/'.join(segments[index:])
+                    return child.url, child.views, {**params, name: rest}
+                continue
+            if pattern.fullmatch(segment):
+                url, views, found = self.match_node(
+                    child, segments, index + 1, {**params, name: convert(segment)})
+                if views is not None:
+                    return url, views, found
+        return None, None, None
+
+    def resolve(self, path, method):
+        """Возвращает (view, параметры пути); view=None - маршрут не найден"""
+        return self.resolve_route(path, method)[1:]
+
+    def resolve_route(self, path, method):
+        """Возвращает (адрес маршрута, view, параметры пути); view=None - маршрут не найден.
+        У 405 адрес маршрута есть"""
+        url, views, params = self.match(path)
+        if views is None:
+            return None, None, None
+        view = views.get(method) or views.get(ANY_METHOD)
+        if view is None and method == 'HEAD':
+            view = views.get('GET')
+        if view is None:
+            allowed = set(views)
+            if 'GET' in allowed:
+                # HEAD обслуживает view для GET
+                allowed.add('HEAD')
+            return url, MethodNotAllowed405(sorted(allowed)), {}
+        if type(view) is LazyView:
+            view = view.get()
+        return url, view, params
+
+    def load_views(self):
+        """Создаёт все отложенные view сразу - например, до fork воркеров.
+        Возвращает число созданных"""
+        loaded = 0
+        nodes = [self.root]
+        views_list = list(self.exact.values())
+        while nodes:
+            node = nodes.pop()
+            if node.views:
+                views_list.append(node.views)
+            nodes.extend(node.children.values())
+            nodes.extend(param[3] for param in node.params)
+        for views in views_list:
+            for view in views.values():
+                if type(view) is LazyView and view.view is None:
+                    view.get()
+                    loaded += 1
+        return loaded
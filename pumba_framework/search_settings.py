@@ -0,0 +1,14 @@
+# Настройки поиска по каталогу
+SEARCH_ENABLED = True
+# результатов на странице /search/ и максимум, который можно запросить
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+# сколько категорий показывать над курсами
+SEARCH_CATEGORIES_LIMIT = 10
+# до скольких слов словаря раскрывается префикс ('пит' -> 'питон', 'питер', ...)
+SEARCH_MAX_PREFIX_TERMS = 50
+# по сколько строк читать из базы при построении индекса
+SEARCH_BUILD_CHUNK_SIZE = 50000
+# сколько добавлений и удалений слова копить, прежде чем влить их
+# в массив слова (для длинных массивов - корень из их длины)
+SEARCH_MERGE_SIZE = 64
@@ -0,0 +1,102 @@
+from time import perf_counter, sleep
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+
+class StartupProfiler:
+    """Профиль запуска сервера: команда запускается в новом процессе
+    с python -X importtime, профайлер ждёт, пока порт начнёт принимать
+    соединения и пока сервер ответит на первый запрос, затем останавливает его.
+    Время считается от запуска процесса, вместе со стартом интерпретатора"""
+
+    def __init__(self, args, port, path='/', env=None, timeout=120):
+        self.args = args
+        self.port = port
+        self.path = path
+        self.env = env
+        self.timeout = timeout
+
+    @staticmethod
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    @staticmethod
+    def parse_importtime(lines):
+        """Строки -X importtime -> [(модуль, собственное время, с вложенными, глубина)], мкс"""
+        imports = []
+        for line in lines:
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            own, cumulative, name = line[len('import time:'):].split('|')
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            imports.append((name.strip(), int(own), int(cumulative), depth))
+        return imports
+
+    def wait(self, process, started):
+        """Возвращает (порт открыт, первый ответ) в секундах от запуска"""
+        listening = None
+        while perf_counter() - started < self.timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f'сервер завершился с кодом {process.returncode}')
+            connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+            try:
+                connection.connect()
+                if listening is None:
+                    listening = perf_counter() - started
+                connection.request('GET', self.path)
+                connection.getresponse().read()
+                return listening, perf_counter() - started
+            except OSError:
+                sleep(0.002)
+            finally:
+                connection.close()
+        raise RuntimeError(f'сервер не ответил за {self.timeout} с')
+
+    def run(self):
+        # без буфера вывод сервера не теряется при остановке
+        env = dict(os.environ, PYTHONUNBUFFERED='1', **(self.env or {}))
+        started = perf_counter()
+        # своя группа процессов - вместе с воркерами pre-fork
+        process = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', *self.args, '--port', str(self.port)],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            start_new_session=True)
+        try:
+            listening, first_response = self.wait(process, started)
+        finally:
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            output, errors = process.communicate()
+        imports = self.parse_importtime(errors.splitlines())
+        return {
+            'listening': listening,
+            'first_response': first_response,
+            'imports': imports,
+            'import_total': sum(own for _, own, _, _ in imports) / 1e6,
+            'output': [line for line in output.splitlines() if line],
+        }
+
+    @staticmethod
+    def format(report, limit=20):
+        lines = [
+            f'импорт модулей: {report["import_total"] * 1000:.1f} мс '
+            f'({len(report["imports"])} модулей)',
+            f'порт принимает соединения: {report["listening"] * 1000:.1f} мс',
+            f'первый ответ: {report["first_response"] * 1000:.1f} мс',
+            '',
+            f'{"с вложенными, мс":>17} {"свои, мс":>9}  модуль',
+        ]
+        top = sorted(report['imports'], key=lambda item: item[2], reverse=True)[:limit]
+        for name, own, cumulative, depth in top:
+            lines.append(f'{cumulative / 1000:>17.1f} {own / 1000:>9.1f}  {name}')
+        if report['output']:
+            lines += ['', 'вывод сервера:'] + [f'  {line}' for line in report['output']]
+        return '\n'.join(lines) + '\n'
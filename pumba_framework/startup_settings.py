@@ -0,0 +1,18 @@
+from os import environ
+
+# Настройки запуска сервера
+# не загружать каталог при импорте views: он загружается при прогреве или
+# перед первым запросом. Без прогрева в режиме pre-fork каждый воркер
+# загружает свою копию. Переменная окружения PUMBA_DEFER_CATALOG=1 включает
+STARTUP_DEFER_CATALOG = environ.get('PUMBA_DEFER_CATALOG', '') not in ('', '0')
+# прогрев перед приёмом соединений: все шаблоны загружаются в окружение,
+# страницы WARM_UP_PATHS запрашиваются один раз и попадают в кэш ответов.
+# В режиме pre-fork воркеры получают всё это готовым (copy-on-write)
+WARM_UP_ENABLED = True
+WARM_UP_PATHS = ('/', '/about/', '/study_programs/', '/category-list/')
+# с каким Accept-Encoding прогревать: сжатый вариант тоже попадает в кэш
+WARM_UP_ACCEPT_ENCODING = 'br, gzip'
+# после прогрева перенести объекты в постоянное поколение сборщика мусора
+# (gc.freeze): он перестаёт их обходить и не трогает страницы памяти,
+# общие у воркеров после fork
+WARM_UP_GC_FREEZE = True
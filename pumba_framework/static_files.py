@@ -0,0 +1,158 @@
+from email.utils import formatdate, parsedate_to_datetime
+from threading import Lock
+from os import path, walk, stat
+import gzip
+import stat as file_stat
+import pumba_framework.static_settings as static
+from pumba_framework.compression import accepted_encodings, brotli
+from pumba_framework.types_dict import CONTENT_TYPES
+
+
+class StaticFile:
+    """Файл статики: метаданные и, если файл небольшой, его содержимое"""
+    __slots__ = ('full_path', 'size', 'mtime', 'content_type', 'etag',
+                 'last_modified', 'body', 'variants')
+
+    def __init__(self, full_path, st):
+        self.full_path = full_path
+        self.size = st.st_size
+        self.mtime = st.st_mtime_ns
+        extension = path.splitext(full_path)[1].lower()
+        self.content_type = CONTENT_TYPES.get(extension, 'application/octet-stream')
+        self.etag = f'"{self.size:x}-{self.mtime:x}"'
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        self.body = None
+        # сжатые варианты: {'br': bytes, 'gzip': bytes}
+        self.variants = {}
+        if self.size <= static.STATIC_MAX_CACHED_FILE_SIZE:
+            with open(full_path, 'rb') as f:
+                self.body = f.read()
+            if (extension in static.STATIC_COMPRESS_EXTENSIONS
+                    and self.size >= static.STATIC_COMPRESS_MIN_SIZE):
+                self.compress()
+
+    def compress(self):
+        variants = {'gzip': gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(self.body)
+        # сжатый вариант храним, только если он действительно меньше
+        self.variants = {k: v for k, v in variants.items() if len(v) < self.size}
+
+
+class StaticFiles:
+    """Раздача статики из памяти с ETag, условными GET и сжатыми вариантами"""
+
+    def __init__(self, static_dir=static.STATIC_FILES_DIR):
+        self.static_dir = path.realpath(static_dir)
+        self.files = {}
+        self.scanned = False
+        self.lock = Lock()
+
+    def scan(self):
+        """Читает всю папку со статикой в память"""
+        files = {}
+        for root, _, names in walk(self.static_dir):
+            for name in names:
+                full_path = path.join(root, name)
+                rel_path = path.relpath(full_path, self.static_dir).replace(path.sep, '/')
+                files[rel_path] = StaticFile(full_path, stat(full_path))
+        with self.lock:
+            self.files = files
+            self.scanned = True
+
+    def get_file(self, file_path):
+        if not self.scanned:
+            self.scan()
+        file = self.files.get(file_path)
+        if file is not None and not static.STATIC_AUTO_RELOAD:
+            return file
+        # файла нет в индексе или надо проверить, не изменился ли он
+        full_path = path.realpath(path.join(self.static_dir, file_path))
+        if not full_path.startswith(self.static_dir + path.sep):
+            return None
+        try:
+            st = stat(full_path)
+        except OSError:
+            st = None
+        # папка (/static/css/) или файл удалён - 404
+        if st is None or not file_stat.S_ISREG(st.st_mode):
+            if file is not None:
+                with self.lock:
+                    self.files.pop(file_path, None)
+            return None
+        if file is None or file.mtime != st.st_mtime_ns or file.size != st.st_size:
+            file = StaticFile(full_path, st)
+            with self.lock:
+                self.files[file_path] = file
+        return file
+
+    @staticmethod
+    def not_modified(environ, file):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or file.etag in tags or f'W/{file.etag}' in tags
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return file.mtime // 1_000_000_000 <= since
+        return False
+
+    accepted_encodings = staticmethod(accepted_encodings)
+
+    def __call__(self, environ, start_response, file_path):
+        file = self.get_file(file_path)
+        if file is None:
+            start_response('404 WHAT', [('Content-Type', 'text/html')])
+            return [b'404 PAGE Not Found']
+
+        coding = None
+        if file.body is not None and file.variants:
+            accepted = self.accepted_encodings(environ)
+            for name in ('br', 'gzip'):
+                if name in file.variants and name in accepted:
+                    coding = name
+                    break
+        # ETag относится к несжатому файлу - у сжатого варианта он слабый, как у view
+        headers = [('ETag', file.etag if coding is None else f'W/{file.etag}'),
+                   ('Last-Modified', file.last_modified),
+                   ('Cache-Control', f'public, max-age={static.STATIC_MAX_AGE}')]
+        if file.variants:
+            headers.append(('Vary', 'Accept-Encoding'))
+        if self.not_modified(environ, file):
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers.append(('Content-Type', file.content_type))
+        is_head = environ['REQUEST_METHOD'] == 'HEAD'
+        if file.body is None:
+            # большой файл - отдаём с диска кусками
+            headers.append(('Content-Length', str(file.size)))
+            start_response('200 OK', headers)
+            if is_head:
+                return []
+            f = open(file.full_path, 'rb')
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if file_wrapper is not None:
+                return file_wrapper(f, static.STATIC_CHUNK_SIZE)
+            return self.iter_file(f)
+
+        body = file.body
+        if coding is not None:
+            body = file.variants[coding]
+            headers.append(('Content-Encoding', coding))
+        headers.append(('Content-Length', str(len(body))))
+        start_response('200 OK', headers)
+        return [] if is_head else [body]
+
+    @staticmethod
+    def iter_file(f):
+        with f:
+            while True:
+                chunk = f.read(static.STATIC_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
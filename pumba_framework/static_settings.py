@@ -4,3 +4,16 @@ from os import path
 ROOT_DIR = Path(__file__).resolve().parent.parent
 STATIC_FILES_DIR = path.join(ROOT_DIR, 'staticfiles')
 STATIC_URL = '/static/'
+# файлы не больше этого размера (байт) держим в памяти, остальные отдаём с диска кусками
+STATIC_MAX_CACHED_FILE_SIZE = 1024 * 1024
+# размер куска при потоковой отдаче больших файлов
+STATIC_CHUNK_SIZE = 64 * 1024
+# сканировать папку со статикой при старте приложения, а не при первом запросе
+STATIC_SCAN_ON_STARTUP = True
+# проверять mtime файла на каждый запрос (режим разработки)
+STATIC_AUTO_RELOAD = True
+# сжимаем заранее только текстовые файлы не меньше этого размера
+STATIC_COMPRESS_MIN_SIZE = 512
+STATIC_COMPRESS_EXTENSIONS = ('.css', '.js', '.html', '.htm', '.json', '.svg', '.txt')
+# значение max-age для заголовка Cache-Control
+STATIC_MAX_AGE = 3600
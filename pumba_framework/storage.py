@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+from threading import local
+import os
+import sqlite3
+import pumba_framework.storage_settings as settings
+
+
+class Database:
+    """База SQLite в режиме WAL: читатели не ждут писателя.
+    У каждого потока своё соединение (sqlite3 не разделяет соединения между
+    потоками), после fork соединения открываются заново. Соединение держит
+    кэш подготовленных запросов, поэтому одинаковый SQL не разбирается
+    повторно"""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.local = local()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = self.connect()
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def connect(self):
+        # isolation_level=None - транзакции открываются только явно, в transaction()
+        connection = sqlite3.connect(self.file_name,
+                                     timeout=settings.STORAGE_BUSY_TIMEOUT,
+                                     isolation_level=None,
+                                     check_same_thread=False,
+                                     cached_statements=settings.STORAGE_CACHED_STATEMENTS)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute(f'PRAGMA synchronous = {settings.STORAGE_SYNCHRONOUS}')
+        return connection
+
+    def execute(self, sql, parameters=()):
+        return self.connection().execute(sql, parameters)
+
+    @contextmanager
+    def transaction(self):
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def migrate(self, migrations):
+        """Применяет миграции, которых ещё нет в базе.
+        migrations - список миграций, миграция - список SQL-команд;
+        номер последней применённой хранится в PRAGMA user_version"""
+        with self.transaction() as connection:
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            for number, statements in enumerate(migrations[version:], version + 1):
+                for statement in statements:
+                    connection.execute(statement)
+                connection.execute(f'PRAGMA user_version = {number}')
+        return len(migrations) - version
+
+    def close(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
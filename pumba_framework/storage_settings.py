@@ -0,0 +1,26 @@
+from os import environ
+
+# Настройки хранилища каталога
+# файл базы SQLite; None - каталог только в памяти и теряется при перезапуске.
+# По умолчанию хранилище выключено, файл задаёт переменная окружения
+# PUMBA_STORAGE_PATH - обычный запуск не пишет файлов в дерево проекта
+STORAGE_PATH = environ.get('PUMBA_STORAGE_PATH') or None
+# NORMAL в режиме WAL: fsync только при checkpoint, а не на каждую транзакцию
+STORAGE_SYNCHRONOUS = 'NORMAL'
+# сколько секунд копить изменения перед записью одной транзакцией;
+# 0 - записывать сразу после каждого изменения каталога
+STORAGE_FLUSH_INTERVAL = 0.05
+# столько накопленных изменений записываются сразу, не дожидаясь интервала
+STORAGE_BATCH_SIZE = 1000
+# сколько ждать, пока база занята другим процессом (секунды)
+STORAGE_BUSY_TIMEOUT = 5.0
+# подготовленных запросов в кэше каждого соединения
+STORAGE_CACHED_STATEMENTS = 128
+# сколько id процесс занимает в базе за раз: воркеры pre-fork
+# берут id из общей последовательности и не повторяют их
+STORAGE_ID_BLOCK_SIZE = 1000
+# строк в одной транзакции при массовом импорте
+STORAGE_IMPORT_BATCH_SIZE = 10000
+# курсы в памяти - в параллельных массивах, а не отдельными объектами:
+# меньше памяти на воркер, но объект курса создаётся при каждом обращении
+STORAGE_COLUMNAR = False
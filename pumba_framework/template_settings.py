@@ -0,0 +1,17 @@
+from os import path
+from pumba_framework.static_settings import ROOT_DIR
+
+# Настройки шаблонизатора
+TEMPLATES_FOLDER = 'templates'
+# куда python manage.py compile-templates складывает шаблоны, скомпилированные
+# в модули Python; None - всегда компилировать из исходников при первом обращении
+TEMPLATES_COMPILED_DIR = path.join(ROOT_DIR, 'templates_compiled')
+# сколько скомпилированных шаблонов держим в памяти на одно окружение
+TEMPLATES_CACHE_SIZE = 400
+# True - проверять mtime файлов шаблонов на каждый запрос (режим разработки),
+# False - шаблоны компилируются один раз за жизнь процесса (prod)
+TEMPLATES_AUTO_RELOAD = True
+# папка для байткод-кэша Jinja2 на диске, None - кэш выключен
+TEMPLATES_BYTECODE_CACHE_DIR = None
+# потоковый рендер (stream): символов в одном отправляемом куске ответа
+TEMPLATES_STREAM_CHUNK_SIZE = 16 * 1024
@@ -1,8 +1,142 @@
-from jinja2 import Environment, FileSystemLoader
+from threading import Lock
+from jinja2 import (BaseLoader, Environment, FileSystemLoader, FileSystemBytecodeCache,
+                    ModuleLoader)
+from pumba_framework.metrics import stage
+import pumba_framework.template_settings as settings
+import compileall
 import os
+import shutil
 
 
-def render(template_name, folder='templates', static_url='/static/', **kwargs):
+class PrecompiledLoader(BaseLoader):
+    """Шаблоны из модулей Python, собранных заранее (TemplateEngine.compile_templates):
+    при первом обращении шаблон импортируется, а не разбирается и компилируется.
+    Если исходник новее модуля, шаблон берётся из исходника"""
+
+    def __init__(self, compiled_dir, source_loader):
+        self.compiled_dir = compiled_dir
+        self.modules = ModuleLoader(compiled_dir)
+        self.source_loader = source_loader
+
+    def source_mtime(self, name):
+        for search_path in self.source_loader.searchpath:
+            try:
+                return os.path.getmtime(os.path.join(search_path, *name.split('/')))
+            except OSError:
+                continue
+        return None
+
+    def load(self, environment, name, globals=None):
+        source_mtime = self.source_mtime(name)
+        try:
+            module_mtime = os.path.getmtime(
+                os.path.join(self.compiled_dir, ModuleLoader.get_module_filename(name)))
+        except OSError:
+            module_mtime = None
+        if source_mtime is None or module_mtime is None or source_mtime > module_mtime:
+            return self.source_loader.load(environment, name, globals)
+        template = self.modules.load(environment, name, globals)
+        if environment.auto_reload:
+            # у шаблона из модуля нет проверки актуальности - следим за исходником
+            template._uptodate = lambda: self.source_mtime(name) == source_mtime
+        return template
+
+    def list_templates(self):
+        return self.source_loader.list_templates()
+
+
+class TemplateEngine:
+    """Окружения Jinja2 на весь процесс - по одному на папку с шаблонами.
+    Окружение хранит скомпилированные шаблоны, поэтому base.html и include
+    не разбираются заново на каждый запрос."""
+    _environments = {}
+    _lock = Lock()
+
+    @classmethod
+    def get_environment(cls, folder=settings.TEMPLATES_FOLDER, static_url='/static/'):
+        key = (os.path.abspath(folder), static_url)
+        env = cls._environments.get(key)
+        if env is None:
+            with cls._lock:
+                env = cls._environments.get(key)
+                if env is None:
+                    env = cls.make_environment(folder, static_url)
+                    cls._environments[key] = env
+        return env
+
+    @staticmethod
+    def compiled_path(folder):
+        """Папка скомпилированных шаблонов для папки исходников"""
+        if not settings.TEMPLATES_COMPILED_DIR:
+            return None
+        return os.path.join(settings.TEMPLATES_COMPILED_DIR,
+                            os.path.normpath(folder).strip(os.sep).replace(os.sep, '_'))
+
+    @classmethod
+    def make_environment(cls, folder, static_url, precompiled=True):
+        bytecode_cache = None
+        if settings.TEMPLATES_BYTECODE_CACHE_DIR:
+            os.makedirs(settings.TEMPLATES_BYTECODE_CACHE_DIR, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(
+                settings.TEMPLATES_BYTECODE_CACHE_DIR)
+        loader = FileSystemLoader(folder)
+        compiled_path = cls.compiled_path(folder)
+        if precompiled and compiled_path and os.path.isdir(compiled_path):
+            loader = PrecompiledLoader(compiled_path, loader)
+        env = Environment(loader=loader,
+                          cache_size=settings.TEMPLATES_CACHE_SIZE,
+                          auto_reload=settings.TEMPLATES_AUTO_RELOAD,
+                          bytecode_cache=bytecode_cache)
+        env.globals['static'] = static_url
+        return env
+
+    @classmethod
+    def configure(cls, cache_size=None, auto_reload=None, bytecode_cache_dir=None):
+        """Меняет настройки и сбрасывает уже созданные окружения"""
+        if cache_size is not None:
+            settings.TEMPLATES_CACHE_SIZE = cache_size
+        if auto_reload is not None:
+            settings.TEMPLATES_AUTO_RELOAD = auto_reload
+        if bytecode_cache_dir is not None:
+            settings.TEMPLATES_BYTECODE_CACHE_DIR = bytecode_cache_dir
+        cls.clear()
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._environments = {}
+
+    @classmethod
+    def compile_templates(cls, folder=settings.TEMPLATES_FOLDER):
+        """Шаг сборки: все шаблоны папки, включая include, компилируются
+        в модули Python (и сразу в .pyc). Возвращает число шаблонов"""
+        target = cls.compiled_path(folder)
+        if target is None:
+            raise ValueError('TEMPLATES_COMPILED_DIR не задан')
+        env = cls.make_environment(folder, '/static/', precompiled=False)
+        shutil.rmtree(target, ignore_errors=True)
+        env.compile_templates(target, zip=None, ignore_errors=False)
+        compileall.compile_dir(target, quiet=1)
+        cls.clear()
+        return len(env.list_templates())
+
+    @classmethod
+    def warm_up(cls, folder=settings.TEMPLATES_FOLDER, static_url='/static/'):
+        """Загружает все шаблоны папки в окружение - до первого запроса.
+        Возвращает число шаблонов"""
+        env = cls.get_environment(folder, static_url)
+        names = env.list_templates()
+        for name in names:
+            env.get_template(name)
+        return len(names)
+
+    @classmethod
+    def get_template(cls, template_name, folder=settings.TEMPLATES_FOLDER,
+                     static_url='/static/'):
+        return cls.get_environment(folder, static_url).get_template(template_name)
+
+
+def render(template_name, folder=settings.TEMPLATES_FOLDER, static_url='/static/', **kwargs):
     """
     :param template_name: имя шаблона
     :param folder: папка в которой ищем шаблон
@@ -10,8 +144,48 @@ def render(template_name, folder='templates', static_url='/static/', **kwargs):
     :param kwargs: параметры
     :return:
     """
-    env = Environment()
-    env.loader = FileSystemLoader(folder)
-    env.globals['static'] = static_url
-    template = env.get_template(template_name)
-    return template.render(**kwargs)
+    with stage('render'):
+        template = TemplateEngine.get_template(template_name, folder, static_url)
+        return template.render(**kwargs)
+
+
+def stream(template_name, folder=settings.TEMPLATES_FOLDER, static_url='/static/',
+           lock=None, **kwargs):
+    """
+    Рендер шаблона по частям (Template.generate): view возвращает итератор,
+    фреймворк кодирует и отправляет куски, не собирая всю страницу в памяти.
+    :param lock: фабрика контекстного менеджера (например, site.lock.read) -
+    под ним собирается каждый кусок, а не весь ответ, поэтому медленный
+    клиент не держит блокировку
+    :return: итератор строк размером около TEMPLATES_STREAM_CHUNK_SIZE
+    """
+    template = TemplateEngine.get_template(template_name, folder, static_url)
+    parts = template.generate(**kwargs)
+    chunk_size = settings.TEMPLATES_STREAM_CHUNK_SIZE
+    try:
+        while True:
+            buffer = []
+            size = 0
+            with stage('render'):
+                if lock is None:
+                    size = fill_chunk(parts, buffer, chunk_size)
+                else:
+                    with lock():
+                        size = fill_chunk(parts, buffer, chunk_size)
+            if buffer:
+                yield ''.join(buffer)
+            if size < chunk_size:
+                return
+    finally:
+        parts.close()
+
+
+def fill_chunk(parts, buffer, chunk_size):
+    """Берёт части шаблона, пока не наберётся chunk_size символов"""
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            break
+    return size
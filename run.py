@@ -1,16 +1,78 @@
+from argparse import ArgumentParser
 import views
-from patterns.structural_patterns import routes
+from patterns.structural_patterns import routes, startup
 from pumba_framework.main import Framework, DebugApplication, FakeApplication
+from pumba_framework.prefork_server import PreforkServer
+from pumba_framework.startup import StartupProfiler
+import pumba_framework.cache_settings as cache_settings
+import pumba_framework.startup_settings as startup_settings
 from urls import fronts
 from wsgiref.simple_server import make_server
+import sys
 
-application = Framework(routes, fronts)
-# application = DebugApplication(routes, fronts)
-# application = FakeApplication(routes, fronts)
-port = 8001
-addr = ''
+APPLICATIONS = {
+    'main': Framework,
+    'debug': DebugApplication,
+    'fake': FakeApplication,
+}
 
-with make_server(addr, port, application) as httpd:
-    addr = addr if addr else '127.0.0.1'
-    print(f"Запуск на порту {port}...\nhttp://{addr}:{port}")
-    httpd.serve_forever()
+application = Framework(routes, fronts, startup_obj=startup)
+
+
+def get_args():
+    parser = ArgumentParser(description='Запуск приложения на фреймворке Pumba')
+    parser.add_argument('--addr', default='', help='адрес (по умолчанию все интерфейсы)')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--app', choices=APPLICATIONS, default='main',
+                        help='вид WSGI-application')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='число процессов-воркеров; больше 1 - режим pre-fork')
+    parser.add_argument('--threads', action='store_true',
+                        help='поток на каждый запрос внутри воркера')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='перезапускать воркер после N запросов (0 - никогда)')
+    parser.add_argument('--max-requests-jitter', type=int, default=0,
+                        help='случайная добавка к --max-requests, чтобы воркеры '
+                             'не перезапускались одновременно')
+    parser.add_argument('--graceful-timeout', type=int, default=30,
+                        help='сколько секунд ждать завершения запросов при остановке')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='запустить сервер с этими же параметрами в новом процессе и '
+                             'вывести время импорта модулей и время до первого ответа')
+    parser.add_argument('--no-warm-up', dest='warm_up', action='store_false',
+                        default=startup_settings.WARM_UP_ENABLED,
+                        help='не прогревать шаблоны и кэш страниц перед запуском')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    if args.startup_profile:
+        server_args = [arg for arg in sys.argv if arg != '--startup-profile']
+        profiler = StartupProfiler(server_args, StartupProfiler.free_port())
+        print(profiler.format(profiler.run()), end='')
+        sys.exit()
+    if args.workers > 1 and views.site.storage is None:
+        # без общей базы воркерам не узнать об изменениях друг друга
+        cache_settings.RESPONSE_CACHE_ENABLED = False
+        print('Внимание: без хранилища (PUMBA_STORAGE_PATH) у каждого воркера свой '
+              'каталог в памяти и изменения одного воркера не видны другим; '
+              'кэш страниц выключен')
+    if args.app != 'main':
+        application = APPLICATIONS[args.app](routes, fronts, startup_obj=startup)
+    if args.warm_up:
+        templates, pages, seconds = application.warm_up()
+        print(f'Прогрев: шаблонов {templates}, страниц {pages} за {seconds * 1000:.0f} мс')
+    addr = args.addr if args.addr else '127.0.0.1'
+    print(f"Запуск на порту {args.port}...\nhttp://{addr}:{args.port}")
+    if args.workers > 1 or args.threads or args.max_requests:
+        print(f'Воркеров: {args.workers}, поток на запрос: {"да" if args.threads else "нет"}')
+        PreforkServer(application, args.addr, args.port,
+                      workers=args.workers,
+                      threads=args.threads,
+                      max_requests=args.max_requests,
+                      max_requests_jitter=args.max_requests_jitter,
+                      graceful_timeout=args.graceful_timeout).run()
+    else:
+        with make_server(args.addr, args.port, application) as httpd:
+            httpd.serve_forever()
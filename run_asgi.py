@@ -0,0 +1,16 @@
+import asyncio
+import views
+from patterns.structural_patterns import routes, startup
+from pumba_framework.asgi_framework import AsgiFramework
+from pumba_framework.asgi_server import AsgiServer
+from urls import fronts
+
+application = AsgiFramework(routes, fronts, startup_obj=startup)
+port = 8001
+addr = ''
+
+if __name__ == '__main__':
+    server = AsgiServer(application, addr, port)
+    addr = addr if addr else '127.0.0.1'
+    print(f"Запуск ASGI на порту {port}...\nhttp://{addr}:{port}")
+    asyncio.run(server.serve())
@@ -1,4 +1,6 @@
 from datetime import date
+from patterns.structural_patterns import CatalogSync
+from views import site
 
 
 # front controller
@@ -14,6 +16,9 @@ def other_front(request):
     request['key'] = 'key'
 
 
-# что-то вроде middleware в django
-fronts = [secret_front, user_front, other_front]
+# что-то вроде middleware в django: кроме функций сюда можно добавить
+# Front(функция, routes=['/courses/*']) - front controller только для части
+# маршрутов, и ступени Middleware с before/after (pumba_framework.middleware)
+# CatalogSync - первой: воркеры pre-fork видят изменения каталога друг друга
+fronts = [CatalogSync(site), secret_front, user_front, other_front]
 
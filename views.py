@@ -1,21 +1,63 @@
 from datetime import date
-from patterns.creational_patterns import Engine, Logger
-from patterns.structural_patterns import route, Debug
-from pumba_framework.templator import render
-
-site = Engine()
+from io import StringIO
+import json
+from patterns.batch_patterns import CourseBatchReader
+from patterns.creational_patterns import CourseFactory, Engine, Logger
+from patterns.structural_patterns import route, startup, Debug
+from pumba_framework.templator import render, stream
+from pumba_framework.pagination import Page
+from pumba_framework.response import Response
+from pumba_framework.response_cache import cache_page, response_cache
+import pumba_framework.pagination_settings as pagination_settings
+import pumba_framework.search_settings as search_settings
+import pumba_framework.startup_settings as startup_settings
+
+site = Engine(deferred=startup_settings.STARTUP_DEFER_CATALOG)
+startup.append(site.load_catalog)
+# изменения каталога сбрасывают закэшированные страницы
+site.attach(response_cache)
 logger = Logger('main')
 
 
+def category_page_tags(request):
+    params = request.get('path_params') or request['request_params']
+    return {f'category:{params.get("id")}'}
+
+
+def course_page_tags(request):
+    return {f'course:{request["request_params"].get("id")}', 'categories:all'}
+
+
+def course_list_page(request, category):
+    """Страница курсов категории: в шаблон попадает только срез списка,
+    страница отдаётся по частям"""
+    number, size = Page.get_params(request['request_params'])
+    with site.lock.read():
+        courses = Page.from_sequence(category.courses if category else [], number, size)
+    return '200 OK', stream('course_list.html', lock=site.lock.read,
+                            category=category, courses=courses)
+
+
+def category_list_page(request):
+    number, size = Page.get_params(request['request_params'])
+    with site.lock.read():
+        categories = Page.from_sequence(site.categories, number, size)
+    return '200 OK', stream('category_list.html', lock=site.lock.read,
+                            categories=categories)
+
+
 @route('/')
+@cache_page(lambda request: {'categories'})
 class Index:
     """Главная страница"""
     @Debug(name='Index')
     def __call__(self, request):
-        return '200 OK', render('index.html', data=request, objects_list=site.categories)
+        with site.lock.read():
+            return '200 OK', render('index.html', data=request, objects_list=site.categories)
 
 
 @route('/about/')
+@cache_page()
 class About:
     """О проекте"""
     def __call__(self, request):
@@ -30,44 +72,46 @@ class StudyPrograms:
 
 
 @route('/courses-list/')
+@route('/courses/<int:id>/')
+@cache_page(category_page_tags)
 class CoursesList:
     """Список курсов"""
     def __call__(self, request):
         logger.log('Список курсов')
+        params = request.get('path_params') or request['request_params']
         try:
-            category = site.find_category_by_id(
-                int(request['request_params']['id']))
-            return '200 OK', render('course_list.html', category=category)
+            category = site.find_category_by_id(int(params['id']))
+            return course_list_page(request, category)
         except KeyError:
             return '200 OK', 'No courses have been added yet'
 
 
 @route('/create-course/')
+@cache_page(category_page_tags)
 class CreateCourse:
     """Создать курс"""
-    category_id = -1
-
     def __call__(self, request):
         if request['method'] == 'POST':
             # метод пост
             data = request['data']
 
             name = data['name']
-            name = site.decode_value(name)
 
+            # id категории приходит из скрытого поля формы, а не хранится
+            # в общем для всех запросов объекте view
             category = None
-            if self.category_id != -1:
-                category = site.find_category_by_id(int(self.category_id))
+            category_id = int(data.get('id', -1))
+            if category_id != -1:
+                category = site.find_category_by_id(category_id)
 
-                course = site.create_course('record', '/site-link/', name, category)
-                site.courses.append(course)
+                site.create_course('record', '/site-link/', name, category)
 
-            return '200 OK', render('course_list.html', category=category)
+            return course_list_page(request, category)
 
         else:
             try:
-                self.category_id = int(request['request_params']['id'])
-                category = site.find_category_by_id(int(self.category_id))
+                category_id = int(request['request_params']['id'])
+                category = site.find_category_by_id(category_id)
 
                 return '200 OK', render('create_course.html',
                                         name=category.name,
@@ -77,6 +121,7 @@ class CreateCourse:
 
 
 @route('/edit-course/')
+@cache_page(course_page_tags)
 class EditCourse:
     """Редактировать курс"""
     def __call__(self, request):
@@ -84,35 +129,36 @@ class EditCourse:
             data = request['data']
 
             name = data['name']
-            name = site.decode_value(name)
             link = data['link']
             course_id = int(data['id'])
             category_id = int(data['category'])
             category = site.find_category_by_id(category_id)
             course = site.find_course_by_id(course_id)
+            try:
+                site.edit_course(course, name, link, category)
+            except ValueError as e:
+                return '400 Bad Request', str(e)
 
-            old_category_id = course.category.id
-            old_category = site.find_category_by_id(old_category_id)
-            old_category.courses.remove(course)
-
-            course.name = name
-            course.link = link
-            course.category = category
-            category.courses.append(course)
-
-            return '200 OK', render('course_list.html', category=category)
+            return course_list_page(request, category)
         else:
             try:
                 course_id = int(request['request_params']['id'])
                 course = site.find_course_by_id(course_id)
-                return '200 OK', render('course_edit.html',
-                                        categories=site.get_all_categories(site.categories),
-                                        course=course)
+                # в выпадающий список - одна страница категорий
+                number, size = Page.get_params(request['request_params'],
+                                               pagination_settings.CATEGORIES_PAGE_SIZE)
+                with site.lock.read():
+                    categories = Page.from_sequence(
+                        site.get_all_categories(site.categories), number, size)
+                    return '200 OK', render('course_edit.html', categories=categories,
+                                            course=course,
+                                            link=getattr(course, CourseFactory.field(course)))
             except KeyError:
                 return '200 OK', 'No categories have been added yet'
 
 
 @route('/create-category/')
+@cache_page()
 class CreateCategory:
     """Создать категорию"""
     def __call__(self, request):
@@ -123,20 +169,16 @@ class CreateCategory:
             data = request['data']
 
             name = data['name']
-            name = site.decode_value(name)
 
             category_id = int(data.get('id'))
 
             if category_id == -1:
-                category = None
-                new_category = site.create_category(name, category)
-                site.categories.append(new_category)
-                return '200 OK', render('category_list.html',
-                                        objects_list=site.categories)
+                site.create_category(name)
+                return category_list_page(request)
             else:
                 category = site.find_category_by_id(category_id)
                 site.create_category(name, category)
-                return '200 OK', render('course_list.html', category=category)
+                return course_list_page(request, category)
         else:
             try:
                 id = int(request['request_params']['id'])
@@ -146,12 +188,12 @@ class CreateCategory:
 
 
 @route('/category-list/')
+@cache_page(lambda request: {'categories'})
 class CategoryList:
     """Список категорий"""
     def __call__(self, request):
         logger.log('Список категорий')
-        return '200 OK', render('category_list.html',
-                                objects_list=site.categories)
+        return category_list_page(request)
 
 
 @route('/copy-course/')
@@ -168,11 +210,99 @@ class CopyCourse:
             category = site.find_category_by_id(cid)
             if old_course:
                 new_name = f'copy_{old_course.name}'
-                new_course = old_course.clone()
-                new_course.name = new_name
-                # new_course.category.courses.append(new_course)
-                site.courses.append(new_course)
+                site.clone_course(old_course, new_name)
 
-            return '200 OK', render('course_list.html', category=category)
+            return course_list_page(request, category)
         except KeyError:
             return '200 OK', 'No courses have been added yet'
+
+
+@route('/search/')
+class Search:
+    """Поиск курсов и категорий по названию"""
+    def __call__(self, request):
+        params = request['request_params']
+        query = params.get('q', '').strip()
+        page, page_size = Page.get_params(params, search_settings.SEARCH_PAGE_SIZE,
+                                          search_settings.SEARCH_MAX_PAGE_SIZE)
+        categories, courses, has_next = site.search(query, page, page_size)
+        with site.lock.read():
+            return '200 OK', render('search.html', query=query, categories=categories,
+                                    courses=courses, page=page, page_size=page_size,
+                                    has_next=has_next)
+
+
+def json_response(data, status='200 OK'):
+    return Response(json.dumps(data, ensure_ascii=False), status,
+                    content_type='application/json')
+
+
+def get_ids(values):
+    """id из повторяющегося поля и/или через запятую: ids=1&ids=2,3"""
+    ids = []
+    for value in values:
+        ids += [int(item) for item in value.split(',') if item.strip()]
+    return ids
+
+
+@route('/create-courses/', methods=['POST'])
+class CreateCourses:
+    """Пакетное создание курсов из тела запроса: CSV или JSON Lines
+    (см. CourseBatchReader). Пачка применяется целиком или не применяется"""
+    def __call__(self, request):
+        try:
+            text = request['body'].decode('utf-8')
+            records = CourseBatchReader().read(request['headers'].get('content-type', ''),
+                                               StringIO(text, newline=''))
+            categories = {}
+            for category_id in {record[3] for record in records}:
+                categories[category_id] = site.find_category_by_id(category_id)
+        except UnicodeDecodeError:
+            return json_response({'error': 'Тело должно быть в UTF-8'}, '400 Bad Request')
+        except Exception as e:
+            return json_response({'error': str(e)}, '400 Bad Request')
+        try:
+            courses = site.create_courses((type_, addr, name, categories[category_id])
+                                          for type_, addr, name, category_id in records)
+        except ValueError as e:
+            return json_response({'error': str(e)}, '400 Bad Request')
+        logger.log('Пакетное создание курсов', created=len(courses))
+        return json_response({'created': len(courses),
+                              'ids': [courses[0].id, courses[-1].id] if courses else []},
+                             '201 Created')
+
+
+@route('/copy-category/', methods=['POST'])
+class CopyCategory:
+    """Глубокая копия категории: id - что копировать, parent - куда
+    (-1 - в корень, по умолчанию - рядом с исходной), name - название копии"""
+    def __call__(self, request):
+        data = request['data']
+        try:
+            category = site.find_category_by_id(int(data['id']))
+            parent = category.category
+            if data.get('parent'):
+                parent_id = int(data['parent'])
+                parent = None if parent_id == -1 else site.find_category_by_id(parent_id)
+            copy = site.copy_category(category, parent,
+                                      data.get('name') or f'copy_{category.name}')
+        except Exception as e:
+            return json_response({'error': str(e)}, '400 Bad Request')
+        with site.lock.read():
+            return json_response({'id': copy.id, 'courses': copy.course_count(),
+                                  'categories': len(site.get_all_categories([copy]))},
+                                 '201 Created')
+
+
+@route('/move-courses/', methods=['POST'])
+class MoveCourses:
+    """Перенос курсов ids в категорию category одной операцией"""
+    def __call__(self, request):
+        data = request['data']
+        try:
+            category = site.find_category_by_id(int(data['category']))
+            courses = [site.find_course_by_id(id) for id in get_ids(data.getlist('ids'))]
+            moved = site.move_courses(courses, category)
+        except Exception as e:
+            return json_response({'error': str(e)}, '400 Bad Request')
+        return json_response({'moved': moved})